@@ -1,12 +1,13 @@
 import os
+import re
+import shutil
 import subprocess
 import tempfile
+import traceback
 from pathlib import Path
+
 from anthropic import Anthropic
 from dotenv import load_dotenv
-import re
-import shutil
-import traceback
 
 # Load environment variables
 load_dotenv()
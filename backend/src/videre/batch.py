@@ -0,0 +1,258 @@
+"""Batch (course) generation with stage-pipelined execution.
+
+A batch runs its topics through three stages connected by bounded queues:
+
+    codegen  ->  render  ->  upload
+
+so code for topic n+1 is generated while topic n renders and topic n-1
+uploads. Generating and rendering each hold a generation slot of the batch's
+tenant at "batch" priority (see scheduling.py), so a batch shares capacity
+fairly with other tenants and yields to interactive requests. Each stage has
+its own worker pool; with a slow render stage the total batch time approaches
+(topics x render time) instead of the sum of all stages. Progress is published
+as aggregate events that any number of SSE streams can follow, and the batch
+itself is stored in the `batches` collection with one chat history per topic.
+
+Environment variables supported:
+- BATCH_CODEGEN_CONCURRENCY (default: 2)
+- BATCH_RENDER_CONCURRENCY (default: 1)
+- BATCH_UPLOAD_CONCURRENCY (default: 2)
+- BATCH_QUEUE_SIZE (default: 2) - max items waiting between two stages
+"""
+from __future__ import annotations
+
+import asyncio
+import traceback
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from bson import ObjectId
+
+from .config import settings
+from .pipeline import publish_result, record_result
+from .progress import progress_hub
+from .scheduling import generation_scheduler
+from .utils.create_video import GeneratedVideo, prepare_script, render_script
+from .utils.history_search import search_terms
+from .utils.response_cache import response_cache
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+BATCH_CODEGEN_CONCURRENCY = settings.batch_codegen_concurrency
+BATCH_RENDER_CONCURRENCY = settings.batch_render_concurrency
+BATCH_UPLOAD_CONCURRENCY = settings.batch_upload_concurrency
+BATCH_QUEUE_SIZE = settings.batch_queue_size
+
+STAGES = ["queued", "generating", "rendering", "uploading", "complete", "failed"]
+
+
+@dataclass
+class BatchItem:
+    index: int
+    topic: str
+    chat_id: str
+    stage: str = "queued"
+    video: GeneratedVideo | None = None
+    error: str | None = None
+
+
+class BatchRun:
+    """A running batch: its pipeline plus the event log its streams follow."""
+
+    def __init__(
+        self, db: AsyncIOMotorDatabase, batch_id: str, items: list[BatchItem], tenant: str
+    ):
+        self.db = db
+        self.batch_id = batch_id
+        self.tenant = tenant
+        self.items = items
+        self.events: list[dict] = []
+        self.finished = False
+        self.task: asyncio.Task | None = None
+        self._changed = asyncio.Condition()
+
+    def counts(self) -> dict[str, int]:
+        counts = {stage: 0 for stage in STAGES}
+        for item in self.items:
+            counts[item.stage] += 1
+        return counts
+
+    async def _emit(self, event_type: str, data: dict):
+        async with self._changed:
+            self.events.append({"type": event_type, "batch_id": self.batch_id, **data})
+            self._changed.notify_all()
+        # A topic's newer stage supersedes its older one for slow WebSocket clients
+        coalesce = f"item:{data['index']}" if event_type == "batch_progress" else None
+        progress_hub.publish(self.batch_id, event_type, data, coalesce)
+
+    async def wait_for_events(self, seen: int, timeout: float) -> list[dict]:
+        """Events after the first `seen`, waiting up to `timeout` for new ones."""
+        async with self._changed:
+            if len(self.events) <= seen and not self.finished:
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout)
+                except TimeoutError:
+                    pass
+            return self.events[seen:]
+
+    async def _set_stage(self, item: BatchItem, stage: str, error: str | None = None):
+        item.stage = stage
+        item.error = error
+        await self.db.batches.update_one(
+            {"_id": ObjectId(self.batch_id)},
+            {"$set": {
+                f"items.{item.index}.status": stage,
+                f"items.{item.index}.error": error,
+                "updated_at": datetime.utcnow(),
+            }},
+        )
+        event = {"index": item.index, "topic": item.topic, "chat_id": item.chat_id,
+                 "stage": stage, "counts": self.counts()}
+        if error:
+            event["error"] = error
+        await self._emit("batch_progress", event)
+
+    async def _generate(self, item: BatchItem) -> bool:
+        async with generation_scheduler.slot(self.tenant, "batch"):
+            await self._set_stage(item, "generating")
+            item.video = await prepare_script(item.topic)
+        return True
+
+    async def _render(self, item: BatchItem) -> bool:
+        async with generation_scheduler.slot(self.tenant, "batch"):
+            await self._set_stage(item, "rendering")
+            rendered = await render_script(item.video)
+        if rendered is None:
+            await self._set_stage(item, "failed", "Render failed")
+            return False
+        return True
+
+    async def _upload(self, item: BatchItem) -> bool:
+        await self._set_stage(item, "uploading")
+        published = await publish_result(item.video)
+        await record_result(self.db, item.chat_id, item.topic, item.video, published)
+        await self._set_stage(item, "complete")
+        return True
+
+    async def _stage(
+        self,
+        handler: Callable[[BatchItem], Awaitable[bool]],
+        inbox: asyncio.Queue,
+        outbox: asyncio.Queue | None,
+        concurrency: int,
+    ):
+        async def worker():
+            while True:
+                item = await inbox.get()
+                if item is None:
+                    # Put the sentinel back for sibling workers
+                    await inbox.put(None)
+                    return
+                try:
+                    ok = await handler(item)
+                except Exception as e:
+                    traceback.print_exc()
+                    ok = False
+                    try:
+                        await self._set_stage(item, "failed", str(e))
+                    except Exception:
+                        # Recording the failure failed too; keep the worker alive
+                        traceback.print_exc()
+                if ok and outbox is not None:
+                    await outbox.put(item)
+
+        try:
+            # Wait for every worker, even if one died, before closing the next stage
+            await asyncio.gather(*[worker() for _ in range(concurrency)], return_exceptions=True)
+        finally:
+            if outbox is not None:
+                await outbox.put(None)
+
+    async def run(self):
+        codegen_queue = asyncio.Queue(maxsize=BATCH_QUEUE_SIZE)
+        render_queue = asyncio.Queue(maxsize=BATCH_QUEUE_SIZE)
+        upload_queue = asyncio.Queue(maxsize=BATCH_QUEUE_SIZE)
+
+        async def feed():
+            for item in self.items:
+                await codegen_queue.put(item)
+            await codegen_queue.put(None)
+
+        await self._emit("batch_start", {
+            "chat_ids": [item.chat_id for item in self.items], "counts": self.counts()
+        })
+        try:
+            await asyncio.gather(
+                feed(),
+                self._stage(self._generate, codegen_queue, render_queue, BATCH_CODEGEN_CONCURRENCY),
+                self._stage(self._render, render_queue, upload_queue, BATCH_RENDER_CONCURRENCY),
+                self._stage(self._upload, upload_queue, None, BATCH_UPLOAD_CONCURRENCY),
+            )
+        finally:
+            counts = self.counts()
+            status = "complete" if counts["complete"] == len(self.items) else "partial"
+            await self.db.batches.update_one(
+                {"_id": ObjectId(self.batch_id)},
+                {"$set": {"status": status, "counts": counts, "updated_at": datetime.utcnow()}},
+            )
+            self.finished = True
+            await self._emit("batch_complete", {"status": status, "counts": counts})
+
+
+# Batches running in this process, by id
+running_batches: dict[str, BatchRun] = {}
+
+
+async def start_batch(
+    db: AsyncIOMotorDatabase, title: str, topics: list[str], tenant: str
+) -> BatchRun:
+    """Create the batch and its chat histories, and start the pipeline in the background."""
+    now = datetime.utcnow()
+    batch_result = await db.batches.insert_one(
+        {
+            "title": title,
+            "status": "running",
+            "tenant": tenant,
+            "items": [
+                {"topic": topic, "chat_id": None, "status": "queued", "error": None}
+                for topic in topics
+            ],
+            "created_at": now,
+            "updated_at": now,
+        }
+    )
+    batch_id = str(batch_result.inserted_id)
+
+    chat_result = await db.chat_histories.insert_many(
+        [
+            {
+                "topic": topic,
+                "search_terms": search_terms(topic),
+                "batch_id": batch_id,
+                "tenant": tenant,
+                "chat_messages": [],
+                "created_at": now,
+                "updated_at": now,
+            }
+            for topic in topics
+        ]
+    )
+    await response_cache.invalidate_lists()
+    chat_ids = [str(chat_id) for chat_id in chat_result.inserted_ids]
+    await db.batches.update_one(
+        {"_id": batch_result.inserted_id},
+        {"$set": {f"items.{i}.chat_id": chat_id for i, chat_id in enumerate(chat_ids)}},
+    )
+
+    items = [
+        BatchItem(i, topic, chat_id) for i, (topic, chat_id) in enumerate(zip(topics, chat_ids))
+    ]
+    batch = BatchRun(db, batch_id, items, tenant)
+    running_batches[batch_id] = batch
+    # running_batches keeps the task referenced until it is done
+    batch.task = asyncio.create_task(batch.run())
+    batch.task.add_done_callback(lambda _: running_batches.pop(batch_id, None))
+    return batch
@@ -0,0 +1,327 @@
+"""Chat-history API benchmarks with query-plan regression checks.
+
+Seeds a scratch database on a local mongod with realistic chat histories,
+drives the CRUD endpoints through the ASGI app (no network, no server), and
+checks `explain()` of the hot queries. Exits non-zero if a latency exceeds
+its p95 budget or a hot query stops using an index:
+
+    cd backend/src && uv run python -m videre.bench --histories 100000
+
+The scratch database (`--database`, default videre_bench) is dropped and
+re-seeded unless `--reuse` is given. The response cache is off so the
+numbers measure Mongo and serialization; pass `--cache` to include it.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+WORDS = (
+    "binary search tree heap graph dijkstra shortest path fourier transform "
+    "integral derivative matrix eigenvalue vector gradient descent neural "
+    "network probability bayes theorem recursion sorting quicksort merge "
+    "hash table linked list dynamic programming convolution entropy"
+).split()
+
+# p95 budgets in milliseconds, overridable with --budget op=ms
+DEFAULT_BUDGETS_MS = {
+    "list": 50, "list_keyset": 50, "get": 20, "create": 25, "update": 30, "delete": 25,
+}
+
+SEED_BATCH_SIZE = 1000
+
+
+def _sentence(n: int) -> str:
+    return " ".join(random.choice(WORDS) for _ in range(n))
+
+
+def make_history(created_at: datetime, messages: int) -> dict:
+    from .utils.history_search import search_terms
+
+    topic = _sentence(random.randint(2, 5)).capitalize()
+    has_video = random.random() < 0.8
+    return {
+        "topic": topic,
+        "search_terms": search_terms(topic),
+        "video_id": f"bench-{random.getrandbits(64):016x}" if has_video else None,
+        "chat_messages": [
+            {
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": _sentence(60),
+                "timestamp": created_at,
+            }
+            for i in range(messages)
+        ],
+        "manim_code": "from manim import *\n" + _sentence(400) if has_video else None,
+        "narration": [_sentence(30) for _ in range(6)] if has_video else [],
+        "render_stats": {"generation_mode": "fresh", "render_seconds": 42.0} if has_video else {},
+        "created_at": created_at,
+        "updated_at": created_at,
+    }
+
+
+async def seed(db, histories: int, messages: int):
+    await db.chat_histories.drop()
+    start = datetime.utcnow() - timedelta(days=365)
+    step = timedelta(days=365) / histories
+    started = time.monotonic()
+    for offset in range(0, histories, SEED_BATCH_SIZE):
+        docs = [
+            make_history(start + step * i, messages)
+            for i in range(offset, min(offset + SEED_BATCH_SIZE, histories))
+        ]
+        await db.chat_histories.insert_many(docs, ordered=False)
+    print(
+        f"Seeded {histories} histories x {messages} messages in {time.monotonic() - started:.1f}s"
+    )
+
+
+def summarize(latencies: list[float], wall: float) -> dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "throughput_rps": round(len(ordered) / wall, 1),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+    }
+
+
+async def measure(name: str, requests: int, concurrency: int, call) -> dict[str, float]:
+    """Run `call(i)` `requests` times, `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await call(i)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                raise RuntimeError(
+                    f"{name} request failed: {response.status_code} {response.text[:200]}"
+                )
+
+    started = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    return summarize(latencies, time.perf_counter() - started)
+
+
+async def run_http(db, requests: int, concurrency: int) -> dict[str, dict]:
+    import httpx
+
+    from .main import app
+
+    ids = [str(doc["_id"]) async for doc in db.chat_histories.find({}, {"_id": 1}).limit(5000)]
+    results = {}
+    created: list[str] = []
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results["list"] = await measure(
+            "list",
+            requests,
+            concurrency,
+            lambda i: client.get("/api/chat-history", params={"limit": 50}),
+        )
+
+        # Walk the keyset cursor as deep as `requests` pages go
+        cursors = [None]
+
+        async def list_keyset(i):
+            response = await client.get(
+                "/api/chat-history",
+                params={"limit": 50, **({"cursor": cursors[-1]} if cursors[-1] else {})},
+            )
+            cursors.append(response.json().get("next_cursor"))
+            return response
+
+        results["list_keyset"] = await measure("list_keyset", requests, 1, list_keyset)
+        results["get"] = await measure(
+            "get",
+            requests,
+            concurrency,
+            lambda i: client.get(f"/api/chat-history/{random.choice(ids)}"),
+        )
+
+        async def create(i):
+            response = await client.post("/api/chat-history", json={
+                "topic": _sentence(4),
+                "chat_messages": [{"role": "user", "content": _sentence(60)} for _ in range(10)],
+            })
+            created.append(response.json()["id"])
+            return response
+
+        results["create"] = await measure("create", requests, concurrency, create)
+        results["update"] = await measure(
+            "update",
+            requests,
+            concurrency,
+            lambda i: client.put(
+                f"/api/chat-history/{created[i % len(created)]}",
+                json={
+                    "topic": _sentence(4),
+                    "chat_messages": [{"role": "user", "content": _sentence(60)}],
+                },
+            ),
+        )
+        results["delete"] = await measure(
+            "delete",
+            len(created),
+            concurrency,
+            lambda i: client.delete(f"/api/chat-history/{created[i]}"),
+        )
+    return results
+
+
+def plan_stages(plan: dict) -> list[str]:
+    """All stage names in an explain() plan tree."""
+    stages = [plan.get("stage", "")]
+    for child_key in ("inputStage", "queryPlan"):
+        if child_key in plan:
+            stages += plan_stages(plan[child_key])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return stages
+
+
+async def check_plans(db, limit: int = 50) -> list[dict]:
+    """Explain the hot queries; each must avoid COLLSCAN (and in-memory SORT where noted)."""
+    from .utils.history_search import LIST_PROJECTION, after_cursor
+
+    sample = await db.chat_histories.find_one(
+        {"video_id": {"$ne": None}}, sort=[("created_at", -1)], skip=1000
+    ) or await db.chat_histories.find_one({"video_id": {"$ne": None}})
+    order = [("created_at", -1), ("_id", -1)]
+    keyset = {"t": sample["created_at"], "id": sample["_id"]}
+
+    checks = [
+        (
+            "list first page",
+            db.chat_histories.find({}, LIST_PROJECTION).sort(order).limit(limit + 1),
+            True,
+            limit + 1,
+        ),
+        (
+            "list keyset page",
+            db.chat_histories.find(after_cursor(keyset), LIST_PROJECTION)
+            .sort(order)
+            .limit(limit + 1),
+            True,
+            limit + 1,
+        ),
+        ("get by id", db.chat_histories.find({"_id": sample["_id"]}), False, 1),
+        ("find by video_id", db.chat_histories.find({"video_id": sample["video_id"]}), False, 1),
+        (
+            "prefix search",
+            db.chat_histories.find(
+                {"search_terms": {"$regex": "^" + sample["search_terms"][0][:3]}}
+            )
+            .sort(order)
+            .limit(limit + 1),
+            False,
+            None,
+        ),
+        (
+            "text search",
+            db.chat_histories.find({"$text": {"$search": sample["search_terms"][0]}}).limit(limit),
+            False,
+            None,
+        ),
+    ]
+
+    results = []
+    for name, cursor, no_sort, max_docs in checks:
+        explain = await cursor.explain()
+        plan = explain["queryPlanner"]["winningPlan"]
+        stages = plan_stages(plan)
+        docs_examined = explain.get("executionStats", {}).get("totalDocsExamined")
+        problems = []
+        if "COLLSCAN" in stages:
+            problems.append("COLLSCAN")
+        if no_sort and "SORT" in stages:
+            problems.append("in-memory SORT")
+        if max_docs is not None and docs_examined is not None and docs_examined > max_docs:
+            problems.append(f"examined {docs_examined} docs (max {max_docs})")
+        results.append(
+            {"query": name, "stages": stages, "docs_examined": docs_examined, "problems": problems}
+        )
+    return results
+
+
+def parse_budgets(values: list[str]) -> dict[str, float]:
+    budgets = dict(DEFAULT_BUDGETS_MS)
+    for value in values:
+        op, _, ms = value.partition("=")
+        budgets[op] = float(ms)
+    return budgets
+
+
+async def main_async(args) -> int:
+    from .database import close_db, connect_db, get_database
+    from .utils.history_search import ensure_search_indexes
+
+    await connect_db()
+    db = get_database()
+    try:
+        if not args.reuse or await db.chat_histories.estimated_document_count() == 0:
+            await seed(db, args.histories, args.messages)
+        await ensure_search_indexes(db)
+
+        plans = await check_plans(db)
+        http = await run_http(db, args.requests, args.concurrency)
+    finally:
+        await close_db()
+
+    budgets = parse_budgets(args.budget)
+    failed = False
+    print(f"\n{'operation':<14}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'budget':>10}")
+    for op, result in http.items():
+        over = result["p95_ms"] > budgets.get(op, float("inf"))
+        failed |= over
+        print(f"{op:<14}{result['throughput_rps']:>10}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+              f"{budgets.get(op, '-'):>10}{'  FAIL' if over else ''}")
+
+    print("\nquery plans")
+    for plan in plans:
+        failed |= bool(plan["problems"])
+        status = "FAIL " + ", ".join(plan["problems"]) if plan["problems"] else "ok"
+        print(f"  {plan['query']:<18} {' <- '.join(plan['stages']):<40} {status}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {"http": http, "plans": plans, "budgets_ms": budgets}, f, indent=2, default=str
+            )
+    return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat-history API benchmarks")
+    parser.add_argument("--histories", type=int, default=10000)
+    parser.add_argument("--messages", type=int, default=40, help="chat messages per history")
+    parser.add_argument("--requests", type=int, default=500, help="requests per operation")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--database", default="videre_bench")
+    parser.add_argument("--reuse", action="store_true", help="keep an already seeded database")
+    parser.add_argument("--cache", action="store_true", help="leave the response cache on")
+    parser.add_argument(
+        "--budget", action="append", default=[], metavar="OP=MS", help="p95 budget override"
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    # Settings are read at import time, so set these before importing the app
+    os.environ["MONGODB_DATABASE"] = args.database
+    if not args.cache:
+        os.environ["RESPONSE_CACHE_BACKEND"] = "off"
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Application settings, read once from the environment and `.env`.
+
+Every tunable lives on `Settings`; field names are the environment variable
+names in lower case (see backend/.env.example). Modules read `settings` at
+import time instead of calling `os.getenv` / `load_dotenv` themselves.
+"""
+from functools import lru_cache
+from pathlib import Path
+
+from pydantic import AliasChoices, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+SRC_DIR = Path(__file__).parent.parent  # backend/src
+
+
+class Settings(BaseSettings):
+    model_config = SettingsConfigDict(
+        # backend/.env, then the working directory's .env (later files win)
+        env_file=(SRC_DIR.parent / ".env", ".env"),
+        extra="ignore",
+    )
+
+    # Database
+    mongodb_url: str = "mongodb://localhost:27017"
+    mongodb_database: str = "videre"
+
+    # Claude
+    claude_api_key: str | None = Field(
+        None, validation_alias=AliasChoices("claude_api_key", "anthropic_api_key")
+    )
+    claude_max_concurrency: int = 8
+    claude_requests_per_minute: int = 50
+    claude_tokens_per_minute: int = 80000
+    claude_max_retries: int = 5
+    claude_base_url: str | None = None
+
+    # Code generation model routing: <model>:<relative cost>:<max topic complexity>, strongest first
+    codegen_models: str = "claude-sonnet-4-5-20250929:3:1.0,claude-haiku-4-5-20251001:1:0.35"
+    codegen_latency_budget_seconds: float = 120
+    codegen_cost_budget: float | None = None
+    codegen_timeout_seconds: float = 180
+    codegen_min_pass_rate: float = 0.6
+    codegen_explore_rate: float = 0.05
+    # "script" (Claude writes the Python) or "scene_graph" (Claude writes JSON, compiled locally)
+    codegen_format: str = "script"
+    scene_graph_repair_attempts: int = 1
+
+    # Docs retrieval
+    context7_api_key: str | None = None
+    docs_index_path: Path = SRC_DIR / ".cache" / "docs_index.json"
+    docs_index_ttl_seconds: int = 86400
+    docs_index_fetch_timeout_seconds: float = 30
+    docs_index_retry_seconds: int = 600
+
+    # Script reuse
+    script_reuse_threshold: float = 0.9
+    script_fewshot_threshold: float = 0.3
+
+    # Hedged codegen / dry run
+    hedge_candidates: int = 1
+    hedge_strategies: str = "direct,staged"
+    hedge_validate_timeout_seconds: float = 120
+    dry_run_enabled: bool = True
+    dry_run_repair_attempts: int = 1
+    dry_run_timeout_seconds: float = 120
+    dry_run_words_per_minute: float = 150
+
+    # Rendering
+    render_mode: str = "local"
+    render_workspace_dir: Path = SRC_DIR / "media" / "renders"
+    render_lease_seconds: int = 60
+    render_max_attempts: int = 3
+    render_job_timeout_seconds: int = 1800
+    render_affinity_seconds: int = 30
+    render_poll_interval_seconds: float = 1.0
+    render_worker_concurrency: int = 1
+    render_profile: str = "1080p60"
+    render_adaptive_quality: bool = True
+    render_profile_steps: str = "720p30@300,480p15@900"  # <profile>@<estimated wait seconds>
+    render_upgrade: bool = False
+
+    # Shared Tex/Text cache for renders on this host
+    render_cache_dir: Path = SRC_DIR / "media" / "render_cache"
+    render_cache_warm_scripts: int = 500
+    render_cache_warm_limit: int = 300
+    render_cache_warm_on_start: bool = True
+
+    # Render profiling (cProfile + phase timings); requested per job or sampled
+    render_profiling_sample_rate: float = 0.0
+
+    # Narration pre-synthesis (all voiceover clips before the render);
+    # TTS_SERVICE=fake for a local fake
+    narration_presynthesis: bool = True
+    narration_concurrency: int = 4
+    tts_service: str = ""
+    fake_tts_latency_seconds: float = 0.5
+
+    # Chat-history response cache ("memory", "sqlite" or "off")
+    response_cache_backend: str = "memory"
+    response_cache_ttl_seconds: float = 30
+    response_cache_max_entries: int = 2000
+    response_cache_sqlite_path: Path = SRC_DIR / ".cache" / "responses.sqlite3"
+    response_cache_list_max_skip: int = 100  # only the first list pages are cached
+
+    # Chat-history change feed (SSE)
+    history_feed_buffer: int = 1000
+    history_feed_catchup_limit: int = 5000
+    history_feed_outbox: int = 1000
+
+    # Fair scheduling of generations across tenants (see scheduling.py)
+    generation_slots: int = 4
+    priority_weights: str = "interactive:4,batch:1"
+    tenant_weight: float = 1.0
+    tenant_max_concurrent: int = 4
+    tenant_max_queued: int = 20
+    tenant_daily_quota: int = 0  # new videos per tenant per UTC day; 0 = unlimited
+    tenant_limits: str = ""  # <tenant>:<weight>:<max concurrent>:<daily quota>,...
+
+    # Batches
+    batch_codegen_concurrency: int = 2
+    batch_render_concurrency: int = 1
+    batch_upload_concurrency: int = 2
+    batch_queue_size: int = 2
+
+    # Packaging
+    hls_packaging: bool = True
+    hls_segment_seconds: int = 2
+    video_previews: bool = True
+    preview_thumbnail_widths: str = "320,640"
+    preview_sprite_columns: int = 10
+    preview_sprite_rows: int = 6
+    preview_sprite_width: int = 160
+    ffmpeg_binary: str = "ffmpeg"
+    ffprobe_binary: str = "ffprobe"
+
+    # Storage
+    storage_backend: str = "s3"
+    aws_mp4_s3_bucket_id: str | None = None
+    aws_region: str = "us-east-2"
+    aws_access_key_id: str | None = None
+    aws_secret_access_key: str | None = None
+    s3_endpoint_url: str | None = None
+    local_storage_dir: Path = SRC_DIR / "media" / "storage"
+    public_base_url: str = "http://localhost:8000"
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()
+
+
+settings = get_settings()
@@ -1,21 +1,25 @@
 """MongoDB database configuration and connection management."""
-import os
-from typing import Optional
+from __future__ import annotations
 
-from dotenv import load_dotenv
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from typing import TYPE_CHECKING
 
-load_dotenv()
+from .config import settings
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 
 class Database:
-    client: Optional[AsyncIOMotorClient] = None
-    db: Optional[AsyncIOMotorDatabase] = None
+    client: AsyncIOMotorClient | None = None
+    db: AsyncIOMotorDatabase | None = None
 
 async def connect_db():
     """Create database connection."""
-    mongodb_url = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+    # Imported here so modules that only need the settings stay light
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    mongodb_url = settings.mongodb_url
     Database.client = AsyncIOMotorClient(mongodb_url)
-    Database.db = Database.client.get_database("videre")
+    Database.db = Database.client.get_database(settings.mongodb_database)
     print(f"Connected to MongoDB at {mongodb_url}")
 
 async def close_db():
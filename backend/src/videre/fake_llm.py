@@ -0,0 +1,128 @@
+"""Fake Anthropic Messages API for exercising model routing and fallback locally.
+
+Answers `POST /v1/messages` with a small valid VoiceoverScene for the scene
+class named in the prompt (or a small scene graph, for scene graph prompts),
+after a configurable per-model latency, and fails a configurable share of
+requests with 529 (overloaded):
+
+    cd backend/src && uv run python -m videre.fake_llm --port 8090 \\
+        --model claude-sonnet-4-5-20250929:latency=8:errors=0.05 \\
+        --model claude-haiku-4-5-20251001:latency=2:errors=0.3
+
+then run the API with CLAUDE_BASE_URL=http://localhost:8090 and any
+CLAUDE_API_KEY. Unknown models get the defaults (--latency, --errors).
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+SCRIPT = """import os
+from manim import *
+from manim_voiceover import VoiceoverScene
+from manim_voiceover.services.gtts import GTTSService
+
+
+class {scene}(VoiceoverScene):
+    def construct(self):
+        self.set_speech_service(GTTSService())
+        title = Text("Fake LLM", font_size=48)
+        with self.voiceover(text="This script comes from the fake LLM server.") as tracker:
+            self.play(Write(title), run_time=tracker.duration)
+        formula = MathTex(r"a^2 + b^2 = c^2")
+        with self.voiceover(text="Here is a formula to render.") as tracker:
+            self.play(ReplacementTransform(title, formula), run_time=tracker.duration)
+"""
+
+SCENE_GRAPH = json.dumps(
+    {
+        "blocks": [
+            {
+                "narration": "This scene graph comes from the fake language model server.",
+                "visuals": [
+                    {"type": "title", "text": "Fake LLM"},
+                    {"type": "formula", "id": "f", "tex": "a^2 + b^2 = c^2"},
+                ],
+            },
+            {
+                "narration": "Here is the formula again.",
+                "visuals": [{"type": "highlight", "target": "f"}],
+            },
+        ]
+    }
+)
+
+
+def parse_model(spec: str) -> dict[str, object]:
+    """`<model>:latency=<seconds>:errors=<share>`."""
+    name, *options = spec.split(":")
+    behaviour = {"name": name}
+    for option in options:
+        key, _, value = option.partition("=")
+        behaviour[key] = float(value)
+    return behaviour
+
+
+def create_app(models: dict[str, dict], default_latency: float, default_errors: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/messages")
+    async def messages(request: Request):
+        body = await request.json()
+        model = body.get("model", "")
+        behaviour = models.get(model, {})
+        await asyncio.sleep(behaviour.get("latency", default_latency) * random.uniform(0.5, 1.5))
+        if random.random() < behaviour.get("errors", default_errors):
+            return JSONResponse(
+                {"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}},
+                status_code=529,
+            )
+
+        prompt = "".join(
+            m["content"]
+            if isinstance(m["content"], str)
+            else "".join(b.get("text", "") for b in m["content"])
+            for m in body.get("messages", [])
+        )
+        scene = re.search(r"class `?(\w+)\(VoiceoverScene\)", prompt)
+        if "JSON scene graph" in prompt:
+            text = SCENE_GRAPH
+        else:
+            text = SCRIPT.format(scene=scene.group(1)) if scene else "A short fake answer."
+        return {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4},
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Anthropic Messages API")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument(
+        "--model", action="append", default=[], help="<model>:latency=<s>:errors=<share>"
+    )
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--errors", type=float, default=0.0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    models = {b["name"]: b for b in map(parse_model, args.model)}
+    uvicorn.run(create_app(models, args.latency, args.errors), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
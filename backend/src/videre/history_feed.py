@@ -0,0 +1,363 @@
+"""Push chat-history changes to clients instead of having them re-fetch the list.
+
+One change stream on `chat_histories`, shared by every client of this
+process, is fanned out as small deltas over SSE (`GET /api/chat-history/events`):
+
+    id: <resume token>
+    data: {"op": "upsert", "id": "<chat id>", "doc": {...}}     (insert / replace)
+    data: {"op": "update", "id": "<chat id>", "fields": {...}, "removed": [...]}
+    data: {"op": "delete", "id": "<chat id>"}
+    data: {"op": "reset"}   (refetch the list; no id)
+
+`doc` and `fields` use the stored field names; `fields` keys can be dotted
+paths (`render_stats.render_profile`). Large fields the list does not show
+(HEAVY_FIELDS) are left out, so fetch a chat's details on demand.
+
+Each event's id is the change stream resume token. EventSource sends it back
+as Last-Event-ID when it reconnects (or pass `?resume=`), and the client
+gets every change it missed:
+- from the replay buffer (the last HISTORY_FEED_BUFFER deltas), or
+- for older tokens, and tokens from another API process, from a private
+  change stream resumed at the token, which hands over to the shared one
+  without a gap.
+If the token is too old for the oplog, or the catch-up exceeds
+HISTORY_FEED_CATCHUP_LIMIT, the client gets a reset. A client more than
+HISTORY_FEED_OUTBOX deltas behind is disconnected; it resumes the same way.
+
+Change streams need a replica set. A single-node one is enough:
+`just db-replset`, then `just check-history-feed` (runs `_check` below
+against a scratch database).
+
+Environment variables supported:
+- HISTORY_FEED_BUFFER (default: 1000)
+- HISTORY_FEED_CATCHUP_LIMIT (default: 5000)
+- HISTORY_FEED_OUTBOX (default: 1000)
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from collections import OrderedDict
+from collections.abc import Iterator
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from .config import settings
+from .utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+HISTORY_FEED_BUFFER = settings.history_feed_buffer
+HISTORY_FEED_CATCHUP_LIMIT = settings.history_feed_catchup_limit
+HISTORY_FEED_OUTBOX = settings.history_feed_outbox
+
+# Not pushed: large, and not shown in lists
+HEAVY_FIELDS = ("manim_code", "narration", "chat_messages", "search_terms", "scene_graph")
+# The resume token can't be used
+# (InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost)
+HISTORY_LOST_CODES = {260, 280, 286}
+RETRY_SECONDS = 2
+MAX_AWAIT_MS = 1000
+
+PIPELINE = [
+    {"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+    {"$project": {
+        **{f"fullDocument.{field}": 0 for field in HEAVY_FIELDS},
+        **{f"updateDescription.updatedFields.{field}": 0 for field in HEAVY_FIELDS},
+    }},
+]
+
+RESET = (None, {"op": "reset"})
+
+Item = tuple[str | None, dict]  # (resume token, delta)
+
+
+class FeedUnavailableError(RuntimeError):
+    pass
+
+
+class SlowConsumerError(Exception):
+    pass
+
+
+def _light(field: str) -> bool:
+    return field.split(".")[0] not in HEAVY_FIELDS
+
+
+def to_delta(change: dict) -> dict | None:
+    """The delta a change event is sent as; None if nothing a list shows changed."""
+    op = change["operationType"]
+    chat_id = str(change["documentKey"]["_id"])
+    if op == "delete":
+        return {"op": "delete", "id": chat_id}
+    if op in ("insert", "replace"):
+        doc = change.get("fullDocument") or {}
+        return {
+            "op": "upsert",
+            "id": chat_id,
+            "doc": {k: v for k, v in doc.items() if k != "_id" and _light(k)},
+        }
+    description = change.get("updateDescription") or {}
+    fields = {k: v for k, v in description.get("updatedFields", {}).items() if _light(k)}
+    removed = [k for k in description.get("removedFields", []) if _light(k)]
+    if not fields and not removed:
+        return None
+    return {"op": "update", "id": chat_id, "fields": fields, "removed": removed}
+
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def encode_event(item: Item) -> str:
+    token, delta = item
+    data = json.dumps(delta, separators=(",", ":"), default=_json_default)
+    return f"id: {token}\ndata: {data}\n\n" if token else f"data: {data}\n\n"
+
+
+class FeedClient:
+    """One connection's outbox. While catching up, live deltas wait in `pending`."""
+
+    def __init__(self):
+        self.queue: asyncio.Queue[Item] = asyncio.Queue()
+        self.catching_up = False
+        self.pending: list[Item] = []
+        self.overflowed = False
+
+    def push(self, item: Item):
+        if self.catching_up:
+            self.pending.append(item)
+        elif self.queue.qsize() >= HISTORY_FEED_OUTBOX:
+            # Stop here; the client drains the outbox, reconnects and resumes
+            # from the last delta it got
+            self.overflowed = True
+        elif not self.overflowed:
+            self.queue.put_nowait(item)
+
+    async def next(self, timeout: float) -> Item | None:
+        """The next delta, or None after `timeout` (send a heartbeat).
+
+        SlowConsumerError once drained after overflowing.
+        """
+        if self.overflowed and self.queue.empty():
+            raise SlowConsumerError()
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except TimeoutError:
+            return None
+
+
+class HistoryFeed:
+    def __init__(self):
+        self._clients: set[FeedClient] = set()
+        self._buffer: OrderedDict[str, dict] = OrderedDict()  # token -> delta, in stream order
+        self._token: dict | None = None  # where the shared stream resumes after an error
+        self._task: asyncio.Task | None = None
+        self._started: asyncio.Future | None = None
+
+    async def start(self, db: AsyncIOMotorDatabase):
+        """Open the shared change stream once. FeedUnavailableError if the deployment has none."""
+        if self._task is None or self._task.done():
+            self._started = asyncio.get_running_loop().create_future()
+            self._task = asyncio.create_task(self._run(db))
+        await asyncio.shield(self._started)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self, db: AsyncIOMotorDatabase):
+        while True:
+            try:
+                async with db.chat_histories.watch(
+                    PIPELINE, resume_after=self._token, max_await_time_ms=MAX_AWAIT_MS
+                ) as stream:
+                    if not self._started.done():
+                        self._started.set_result(None)
+                    while True:
+                        change = await stream.try_next()
+                        if change is not None:
+                            self._dispatch(change)
+                        self._token = stream.resume_token
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not self._started.done():
+                    # Most likely not a replica set
+                    self._started.set_exception(FeedUnavailableError(str(e)))
+                    return
+                if getattr(e, "code", None) in HISTORY_LOST_CODES:
+                    self._token = None
+                    self._buffer.clear()
+                    for client in list(self._clients):
+                        client.push(RESET)
+                metrics.incr("history_feed_errors_total")
+                print(f"History change stream failed, reopening: {e}")
+                await asyncio.sleep(RETRY_SECONDS)
+
+    def _dispatch(self, change: dict):
+        delta = to_delta(change)
+        if delta is None:
+            return
+        token = change["_id"]["_data"]
+        self._buffer[token] = delta
+        while len(self._buffer) > HISTORY_FEED_BUFFER:
+            self._buffer.popitem(last=False)
+        for client in list(self._clients):
+            client.push((token, delta))
+        metrics.incr("history_feed_deltas_total", op=delta["op"])
+
+    def _buffered_from(self, token: str, inclusive: bool) -> Iterator[Item]:
+        found = False
+        for buffered, delta in self._buffer.items():
+            if found:
+                yield buffered, delta
+            elif buffered == token:
+                found = True
+                if inclusive:
+                    yield buffered, delta
+
+    async def subscribe(self, db: AsyncIOMotorDatabase, resume: str | None = None) -> FeedClient:
+        """A client getting every delta after `resume` (a token this feed sent), then live ones."""
+        await self.start(db)
+        client = FeedClient()
+        if resume is not None and resume in self._buffer:
+            for item in self._buffered_from(resume, inclusive=False):
+                client.push(item)
+            metrics.incr("history_feed_resumes_total", source="buffer")
+        elif resume is not None:
+            client.catching_up = True
+        self._clients.add(client)
+        if client.catching_up:
+            await self._catch_up(db, client, resume)
+        return client
+
+    async def _catch_up(self, db: AsyncIOMotorDatabase, client: FeedClient, resume: str):
+        """Replay from `resume` on a private stream until it reaches what the shared one queued."""
+        delivered = 0
+        try:
+            async with db.chat_histories.watch(
+                PIPELINE, resume_after={"_data": resume}, max_await_time_ms=MAX_AWAIT_MS
+            ) as stream:
+                while client.catching_up:
+                    change = await stream.try_next()
+                    if change is None:
+                        # Caught up with the oplog; deltas the shared stream queued
+                        # meanwhile are still to come
+                        if not client.pending:
+                            client.catching_up = False
+                        continue
+                    token = change["_id"]["_data"]
+                    handover = next(
+                        (i for i, (queued, _) in enumerate(client.pending) if queued == token), None
+                    )
+                    if handover is not None:
+                        pending, client.pending, client.catching_up = (
+                            client.pending[handover:],
+                            [],
+                            False,
+                        )
+                        for item in pending:
+                            client.push(item)
+                        break
+                    delta = to_delta(change)
+                    if delta is not None:
+                        client.queue.put_nowait((token, delta))
+                        delivered += 1
+                        if delivered > HISTORY_FEED_CATCHUP_LIMIT:
+                            raise OverflowError(
+                                f"more than {HISTORY_FEED_CATCHUP_LIMIT} changes to replay"
+                            )
+            metrics.incr("history_feed_resumes_total", source="catch_up")
+        except asyncio.CancelledError:
+            self.unsubscribe(client)
+            raise
+        except Exception as e:
+            print(f"History feed catch-up from {resume[:16]}... failed, sending a reset: {e!r}")
+            metrics.incr("history_feed_resumes_total", source="reset")
+            # Start over: the client refetches, then applies what arrived since
+            pending, client.pending, client.catching_up = client.pending, [], False
+            while not client.queue.empty():
+                client.queue.get_nowait()
+            client.push(RESET)
+            for item in pending:
+                client.push(item)
+
+    def unsubscribe(self, client: FeedClient):
+        self._clients.discard(client)
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self._clients),
+            "buffered": len(self._buffer),
+            "running": self._task is not None and not self._task.done(),
+        }
+
+
+history_feed = HistoryFeed()
+
+
+async def _check(url: str) -> bool:
+    """Insert, update and delete a chat and check the live deltas and both resume paths."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    mongo = AsyncIOMotorClient(url)
+    db = mongo.get_database("videre_history_feed_check")
+    feed, other = HistoryFeed(), HistoryFeed()  # `other` stands in for a second API process
+    try:
+        await db.chat_histories.drop()
+        live = await feed.subscribe(db)
+        chat = await db.chat_histories.insert_one(
+            {"topic": "feed check", "manim_code": "x" * 1000, "created_at": datetime.utcnow()}
+        )
+        await db.chat_histories.update_one({"_id": chat.inserted_id}, {"$set": {"video_url": "https://example"}})
+        await db.chat_histories.delete_one({"_id": chat.inserted_id})
+
+        async def read(client: FeedClient, count: int) -> list[Item]:
+            items = []
+            while len(items) < count:
+                item = await client.next(timeout=10)
+                if item is None:
+                    break
+                items.append(item)
+            return items
+
+        got = await read(live, 3)
+        ops = [delta["op"] for _, delta in got]
+        checks = {
+            "live deltas": ops == ["upsert", "update", "delete"],
+            "heavy fields left out": bool(got) and "manim_code" not in got[0][1].get("doc", {}),
+        }
+        if len(got) == 3:
+            first = got[0][0]
+            buffered = await read(await feed.subscribe(db, first), 2)
+            checks["resume from buffer"] = [token for token, _ in buffered] == [
+                got[1][0],
+                got[2][0],
+            ]
+            caught_up = await read(await other.subscribe(db, first), 2)
+            checks["resume by catch-up"] = [token for token, _ in caught_up] == [
+                got[1][0],
+                got[2][0],
+            ]
+        for name, ok in checks.items():
+            print(f"{'ok  ' if ok else 'FAIL'} {name}")
+        return len(checks) == 4 and all(checks.values())
+    except FeedUnavailableError as e:
+        print(f"FAIL change streams unavailable (is {url} a replica set?): {e}")
+        return False
+    finally:
+        await feed.stop()
+        await other.stop()
+        await mongo.drop_database("videre_history_feed_check")
+        mongo.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    sys.exit(
+        0 if asyncio.run(_check(sys.argv[1] if len(sys.argv) > 1 else settings.mongodb_url)) else 1
+    )
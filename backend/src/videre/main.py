@@ -1,24 +1,77 @@
 import asyncio
 import json
-import os
+import posixpath
+import subprocess
+import time
 from datetime import datetime
-from pathlib import Path
-from typing import List, Optional
+from typing import Literal
 
 from bson import ObjectId
-from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import (
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    WebSocket,
+    WebSocketDisconnect,
+)
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 
 # from .integration import integrate
+from .batch import running_batches, start_batch
+from .config import settings
 from .database import close_db, connect_db, get_database
-from .models import ChatHistory, ChatHistoryListResponse, ChatHistoryResponse, ChatMessage
-from .utils.create_video import generate_video_with_gtts
-from .utils.send_to_aws import create_presigned_url, upload_file_to_s3
-
-load_dotenv()
+from .history_feed import FeedUnavailableError, encode_event, history_feed
+from .history_feed import SlowConsumerError as FeedSlowConsumer
+from .models import (
+    BatchPayload,
+    BatchResponse,
+    ChatHistory,
+    ChatHistoryListResponse,
+    ChatHistoryResponse,
+    ChatHistorySummary,
+    ChatSearchHit,
+    ChatSearchResponse,
+)
+from .pipeline import publish_result, record_result, schedule_upgrade, start_upgrades, stop_upgrades
+from .progress import SlowConsumerError, Subscriber, encode_frame, progress_hub
+from .scheduling import RejectedError, generation_scheduler, tenant_id
+from .utils import render_cache, render_profiling
+from .utils.create_video import generate_video_with_gtts, render_video, video_render_lock
+from .utils.file_response import RangeFileResponse
+from .utils.history_search import (
+    LIST_PROJECTION,
+    SearchError,
+    SearchQuery,
+    after_cursor,
+    backfill_search_terms,
+    decode_cursor,
+    encode_cursor,
+    ensure_search_indexes,
+    search_chat_histories,
+    search_terms,
+)
+from .utils.manim_script import extract_narration, find_scene_class
+from .utils.metrics import metrics
+from .utils.model_router import model_router
+from .utils.package_video import publish_video
+from .utils.render_profiles import render_policy
+from .utils.render_queue import RenderJobError, ensure_render_job_indexes
+from .utils.response_cache import chat_key, list_key, response_cache
+from .utils.scene_graph import SceneGraph, SceneGraphError, block_hashes, compile_scene
+from .utils.script_index import load_script_index, script_index
+from .utils.storage import (
+    LOCAL_MEDIA_ROUTE,
+    LocalStorage,
+    StorageError,
+    content_type_for,
+    get_storage,
+    video_key,
+)
 
 app = FastAPI()
 app.add_middleware(
@@ -29,45 +82,117 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Fire-and-forget startup work, referenced until done so it isn't garbage-collected
+_background_tasks: set[asyncio.Task] = set()
+
+def _background_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Background task {task.get_name()} failed: {task.exception()!r}")
+
+async def _backfill_search_terms():
+    updated = await backfill_search_terms(get_database())
+    if updated:
+        print(f"Backfilled search terms on {updated} chat histories")
+
 @app.on_event("startup")
 async def startup_db_client():
     await connect_db()
+    await ensure_render_job_indexes(get_database())
+    await ensure_search_indexes(get_database())
+    await render_profiling.ensure_profiling_indexes(get_database())
+    await load_script_index()
+    start_upgrades(get_database())
+    # One-off migration for older chats; runs in the background
+    task = asyncio.create_task(_backfill_search_terms(), name="backfill_search_terms")
+    _background_tasks.add(task)
+    task.add_done_callback(_background_done)
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await history_feed.stop()
+    stop_upgrades()
     await close_db()
 
 class TopicPayload(BaseModel):
     topic: str
+    # Hedged codegen: number of candidate scripts to race (None = server default)
+    candidates: int | None = Field(None, ge=1, le=4)
+    # Profile the render (phase timings + pstats, see /api/profiling/renders)
+    profiling: bool = False
+    # Scheduling class; bulk submissions should use "batch" (see scheduling.py)
+    priority: Literal["interactive", "batch"] = "interactive"
+
+class RenderPayload(BaseModel):
+    manim_code: str
+    profiling: bool = False
 
 @app.get("/")
 async def read_root():
     return {"message": "Hello, FastAPI!"}
 
+@app.get("/api/metrics")
+async def get_metrics():
+    """In-process counters and latency summaries."""
+    return {
+        **metrics.snapshot(),
+        "response_cache": response_cache.stats(),
+        "render_profiles": render_policy.stats(),
+        "render_cache": render_cache.stats(),
+        "codegen_models": model_router.stats(),
+        "history_feed": history_feed.stats(),
+        "scheduler": generation_scheduler.stats(),
+    }
+
+def request_tenant(x_tenant_id: str | None = Header(None)) -> str:
+    """The requesting tenant, from the X-Tenant-Id header ("anonymous" without a configured one)."""
+    try:
+        return tenant_id(x_tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # Disable nginx buffering
+}
+
 async def _emit_event(event_type: str, data: dict):
     """Helper function to format SSE events"""
     event_data = json.dumps({"type": event_type, **data})
     return f"data: {event_data}\n\n"
 
 @app.post("/api/integrate")
-async def integrate_endpoint(payload: TopicPayload):
+async def integrate_endpoint(payload: TopicPayload, tenant: str = Depends(request_tenant)):
     """Accept a JSON payload { topic: str } and stream video generation progress via SSE.
 
     This endpoint streams the following events:
+    - rejected: A tenant limit refused the request (reason, retry_after_seconds)
+    - queued: Waiting for a generation slot (position)
     - video_generation_start: Video generation has started
     - video_generation_complete: Video generation has completed
-    - saving_start: Starting to save/upload video to S3
-    - saving_complete: Video has been saved/uploaded to S3
+    - saving_start: Starting to save/upload video to storage
+    - saving_complete: Video has been saved/uploaded to storage
     - complete: Final completion with video_id
     """
     async def event_stream():
+        chat_id = None
+        charged = False
+        generation_task = None
+        db = get_database()
         try:
             print(payload)
 
+            # Refuse a full queue before the quota is charged or a chat is created
+            generation_scheduler.admit(tenant)
+            await generation_scheduler.charge_daily_quota(db, tenant)
+            charged = True
+
             # Create initial chat history entry
-            db = get_database()
             chat_entry = {
                 "topic": payload.topic,
+                "search_terms": search_terms(payload.topic),
+                "tenant": tenant,
                 "chat_messages": [],
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
@@ -75,22 +200,43 @@ async def integrate_endpoint(payload: TopicPayload):
             chat_result = await db.chat_histories.insert_one(chat_entry)
             chat_id = str(chat_result.inserted_id)
 
+            # Mirror every event to WebSocket subscribers of this chat
+            async def emit(event_type: str, data: dict, coalesce: str | None = None):
+                progress_hub.publish(chat_id, event_type, data, coalesce)
+                return await _emit_event(event_type, data)
+            await response_cache.invalidate_lists()
+
             # Queue to stream events in real-time
             event_queue = asyncio.Queue()
 
             # Event callback function to put events in the queue
             async def emit_status(event_type: str, data: dict):
-                event_str = await _emit_event(event_type, data)
+                event_str = await emit(event_type, data, coalesce="status")
                 await event_queue.put(event_str)
                 # Add a small delay to ensure the event is processed
                 await asyncio.sleep(0)
 
             # Start video generation
-            yield await _emit_event("video_generation_start", {"message": "Starting video generation..."})
-
-            # Generate video with event callback (run in background)
+            yield await emit("video_generation_start", {"message": "Starting video generation..."})
+
+            async def on_queued(position: int):
+                await emit_status(
+                    "queued",
+                    {
+                        "message": f"Waiting for a generation slot (position {position})...",
+                        "position": position,
+                    },
+                )
+
+            # Generate video with event callback (run in background) once the tenant's turn comes
             async def generate_task():
-                return await generate_video_with_gtts(payload.topic, emit_status)
+                async with generation_scheduler.slot(tenant, payload.priority, on_queued):
+                    return await generate_video_with_gtts(
+                        payload.topic,
+                        emit_status,
+                        hedge=payload.candidates,
+                        profiling=payload.profiling,
+                    )
 
             generation_task = asyncio.create_task(generate_task())
 
@@ -100,7 +246,7 @@ async def integrate_endpoint(payload: TopicPayload):
                     # Wait for events with a short timeout
                     event = await asyncio.wait_for(event_queue.get(), timeout=0.5)
                     yield event
-                except asyncio.TimeoutError:
+                except TimeoutError:
                     # Send a heartbeat comment to keep connection alive
                     yield ": heartbeat\n\n"
                     continue
@@ -112,72 +258,389 @@ async def integrate_endpoint(payload: TopicPayload):
             while not event_queue.empty():
                 event = await event_queue.get()
                 yield event
-            
-            if not result or result[0] is None or result[1] is None:
-                yield await _emit_event("error", {"message": "Failed to generate video - no valid result returned"})
+
+            if result is None:
+                yield await emit(
+                    "error", {"message": "Failed to generate video - no valid result returned"}
+                )
                 return
-            
-            video_uuid, scene_class_name = result
-            
-            yield await _emit_event("video_generation_complete", {"message": "Video generated successfully."})
-            
-            # Manim saves the video relative to project_root where it's run from
-            # Path: project_root / "media" / "videos" / "generated_scene" / "1080p60" / f"{scene_class_name}.mp4"
-            project_root = Path(__file__).parent.parent
-            video_path = project_root / "media" / "videos" / "generated_scene" / "1080p60" / f"{scene_class_name}.mp4"
-            
-            if not video_path.exists():
-                yield await _emit_event("error", {"message": f"Video file not found at {video_path}"})
+
+            video_uuid = result.video_uuid
+
+            yield await emit(
+                "video_generation_complete", {"message": "Video generated successfully."}
+            )
+
+            video_path = result.render.video_path
+
+            if not result.render.uploaded and not video_path.exists():
+                yield await emit("error", {"message": f"Video file not found at {video_path}"})
                 return
-            
-            # Start saving/uploading to S3
-            yield await _emit_event("saving_start", {"message": "Uploading video to S3..."})
-            
-            upload_file_to_s3(str(video_path), video_uuid)
-            
-            yield await _emit_event("saving_complete", {"message": "Video uploaded to AWS successfully."})
-            
-            # Construct the S3 URL
-            bucket_name = os.getenv("AWS_MP4_S3_BUCKET_ID", "videre-s3")
-            aws_region = os.getenv("AWS_REGION", "us-east-1")
-
-            video_url = create_presigned_url(video_uuid)
-            print(video_url)
 
-            yield await _emit_event("url_created", {"message": "Presigned URL created successfully."})
+            # Start saving/uploading to storage
+            yield await emit("saving_start", {"message": "Uploading video..."})
+
+            published = await publish_result(result)
+
+            yield await emit("saving_complete", {"message": "Video uploaded successfully."})
 
             # Update chat history with video information
-            await db.chat_histories.update_one(
-                {"_id": ObjectId(chat_id)},
-                {
-                    "$set": {
-                        "video_url": video_url,
-                        "video_id": video_uuid,
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
+            video_url = await record_result(db, chat_id, payload.topic, result, published)
+            print(video_url)
+
+            yield await emit("url_created", {"message": "Presigned URL created successfully."})
 
             # Final completion event with video_id and chat_id
-            yield await _emit_event("complete", {
-                "success": True,
-                "video_id": video_uuid,
-                "video_url": video_url,
-                "chat_id": chat_id
-            })
+            previews = published.get("previews")
+            yield await emit(
+                "complete",
+                {
+                    "success": True,
+                    "video_id": video_uuid,
+                    "video_url": video_url,
+                    "poster_url": f"/api/videos/{video_uuid}/previews/{previews['poster']}"
+                    if previews
+                    else None,
+                    "chat_id": chat_id,
+                },
+            )
 
+        except RejectedError as e:
+            if chat_id is not None:
+                # The queue filled up after admission: nothing was generated,
+                # so undo the charge and the chat
+                progress_hub.publish(chat_id, "rejected", e.to_event())
+                await db.chat_histories.delete_one({"_id": ObjectId(chat_id)})
+                await response_cache.invalidate_lists()
+            if charged:
+                await generation_scheduler.refund_daily_quota(db, tenant)
+            yield await _emit_event("rejected", e.to_event())
         except Exception as e:
+            if chat_id is not None:
+                progress_hub.publish(chat_id, "error", {"message": str(e)})
             yield await _emit_event("error", {"message": str(e)})
+        finally:
+            # The client went away (or the stream ended): stop waiting for a slot and stop rendering
+            if generation_task is not None:
+                generation_task.cancel()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.websocket("/api/progress")
+async def progress_socket(websocket: WebSocket):
+    """Progress of many jobs (chat ids, batch ids) over one connection.
 
+    Send {"op": "subscribe" | "unsubscribe", "jobs": [...]}; receive compact
+    frames {"j": job_id, "t": event_type, "d": data}. See progress.py.
+    """
+    await websocket.accept()
+    subscriber = Subscriber()
+    metrics.incr("progress_connections_total")
+
+    async def receive():
+        while True:
+            message = await websocket.receive_json()
+            jobs = [str(job) for job in message.get("jobs", [])]
+            if message.get("op") == "subscribe":
+                progress_hub.subscribe(subscriber, jobs)
+            elif message.get("op") == "unsubscribe":
+                progress_hub.unsubscribe(subscriber, jobs)
+            else:
+                await websocket.send_text(
+                    encode_frame({"t": "error", "d": {"message": "Unknown op"}})
+                )
+
+    async def send():
+        while True:
+            await websocket.send_text(encode_frame(await subscriber.next_frame()))
+
+    tasks = [asyncio.create_task(receive()), asyncio.create_task(send())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if isinstance(task.exception(), SlowConsumerError):
+                metrics.incr("progress_slow_consumers_total")
+                await websocket.close(code=1013, reason="Too slow; reconnect and resubscribe")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        progress_hub.unsubscribe(subscriber, list(subscriber.jobs))
+
+
+async def _batch_event_stream(batch):
+    """Follow a running batch's aggregate progress as SSE."""
+    seen = 0
+    while True:
+        events = await batch.wait_for_events(seen, timeout=0.5)
+        if not events:
+            if batch.finished:
+                return
+            # Send a heartbeat comment to keep connection alive
+            yield ": heartbeat\n\n"
+            continue
+        for event in events:
+            yield f"data: {json.dumps(event)}\n\n"
+        seen += len(events)
+
+@app.post("/api/batches")
+async def create_batch(payload: BatchPayload, tenant: str = Depends(request_tenant)):
+    """Generate a whole syllabus as one pipelined batch and stream aggregate progress via SSE.
+
+    Events: batch_start (with chat_ids), batch_progress (a topic changed stage,
+    with counts per stage), batch_complete. The batch keeps running if the
+    client disconnects; reattach with GET /api/batches/{batch_id}/events.
+    A single `rejected` event if the topics exceed the tenant's daily quota.
+    """
+    try:
+        await generation_scheduler.charge_daily_quota(get_database(), tenant, len(payload.topics))
+    except RejectedError as e:
+        rejected = await _emit_event("rejected", e.to_event())
+        return StreamingResponse(
+            iter([rejected]), media_type="text/event-stream", headers=SSE_HEADERS
+        )
+    batch = await start_batch(get_database(), payload.title, payload.topics, tenant)
     return StreamingResponse(
-        event_stream(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",  # Disable nginx buffering
+        _batch_event_stream(batch), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+@app.get("/api/batches/{batch_id}/events")
+async def follow_batch(batch_id: str):
+    """Reattach to the progress stream of a batch running on this server."""
+    batch = running_batches.get(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch is not running")
+    return StreamingResponse(
+        _batch_event_stream(batch), media_type="text/event-stream", headers=SSE_HEADERS
+    )
+
+
+@app.get("/api/batches/{batch_id}", response_model=BatchResponse)
+async def get_batch(batch_id: str):
+    """Get a batch and the status of each of its topics."""
+    db = get_database()
+
+    try:
+        doc = await db.batches.find_one({"_id": ObjectId(batch_id)})
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid batch ID format")
+
+    if not doc:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    return BatchResponse(id=str(doc["_id"]), **{k: v for k, v in doc.items() if k != "_id"})
+
+
+@app.post("/api/videos/{video_id}/render", response_model=ChatHistoryResponse)
+async def rerender_video(
+    video_id: str, payload: RenderPayload, tenant: str = Depends(request_tenant)
+):
+    """Re-render an edited script for an existing video.
+
+    Renders in the video's persistent workspace, so only animations and
+    voiceover blocks that changed since the last render are re-rendered.
+    """
+    db = get_database()
+    doc = await db.chat_histories.find_one({"video_id": video_id})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    scene_class_name = find_scene_class(payload.manim_code)
+    if scene_class_name is None:
+        raise HTTPException(status_code=400, detail="Script must define a VoiceoverScene subclass")
+    return await _rerender(
+        db, doc, tenant, payload.manim_code, scene_class_name, profiling=payload.profiling
+    )
+
+
+@app.post("/api/videos/{video_id}/scene-graph", response_model=ChatHistoryResponse)
+async def rerender_scene_graph(
+    video_id: str, graph: SceneGraph, profiling: bool = False, tenant: str = Depends(request_tenant)
+):
+    """Re-render a video from an edited scene graph.
+
+    The graph is compiled locally, and the compiler is deterministic, so
+    unchanged blocks hit the workspace's caches and only edited blocks render.
+    """
+    db = get_database()
+    doc = await db.chat_histories.find_one({"video_id": video_id})
+    if not doc:
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    scene_class_name = (
+        find_scene_class(doc.get("manim_code") or "") or f"Scene_{video_id.replace('-', '_')}"
+    )
+    try:
+        manim_code = compile_scene(graph, scene_class_name)
+    except SceneGraphError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await _rerender(db, doc, tenant, manim_code, scene_class_name, graph, profiling)
+
+
+async def _rerender(
+    db,
+    doc: dict,
+    tenant: str,
+    manim_code: str,
+    scene_class_name: str,
+    graph: SceneGraph | None = None,
+    profiling: bool = False,
+) -> ChatHistoryResponse:
+    video_id = doc["video_id"]
+    render_stats = dict(doc.get("render_stats") or {})
+
+    async with video_render_lock(video_id):
+        started = time.monotonic()
+        try:
+            async with generation_scheduler.slot(tenant, "interactive"):
+                # Prefer the worker that holds this video's cached workspace
+                render = await render_video(
+                    manim_code, scene_class_name, video_id,
+                    affinity_worker=render_stats.get("worker_id"),
+                    profiling=profiling or render_profiling.sampled(),
+                )
+        except RejectedError as e:
+            raise HTTPException(status_code=429, detail=e.to_event())
+        except subprocess.CalledProcessError as e:
+            raise HTTPException(status_code=422, detail=f"Render failed: {e.stderr[-2000:]}")
+        except RenderJobError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        render_seconds = round(time.monotonic() - started, 2)
+
+        published = render.published
+        if not render.uploaded:
+            published = await publish_video(render.video_path, video_id, render.profile)
+        video_url = await get_storage().url_for(published.get("video_key") or video_key(video_id))
+
+    render_stats["rerender_seconds"] = render_seconds
+    if render.worker_id:
+        render_stats["worker_id"] = render.worker_id
+    render_stats["rerenders"] = render_stats.get("rerenders", 0) + 1
+    render_stats["render_profile"] = render.profile.name
+    render_stats.pop("upgraded_from", None)
+    if render.load:
+        render_stats["render_load"] = render.load
+    if render.profiling:
+        render_stats["profiling"] = render_profiling.chat_summary(render.profiling)
+    else:
+        render_stats.pop("profiling", None)
+    if graph is not None:
+        render_stats["scene_graph_blocks"] = block_hashes(graph)
+    else:
+        render_stats.pop("scene_graph_blocks", None)
+
+    narration = extract_narration(manim_code)
+    await db.chat_histories.update_one(
+        {"_id": doc["_id"]},
+        {
+            "$set": {
+                "manim_code": manim_code,
+                "narration": narration,
+                "render_stats": render_stats,
+                # An edited script no longer matches its scene graph
+                "scene_graph": graph.model_dump() if graph is not None else None,
+                "video_url": video_url,
+                "hls_manifest_key": published.get("hls_manifest_key"),
+                "video_key": published.get("video_key"),
+                "content_hash": published.get("content_hash"),
+                "previews": published.get("previews"),
+                "updated_at": datetime.utcnow()
+            }
         }
     )
+    await response_cache.invalidate_chat(str(doc["_id"]))
+    script_index.add(str(doc["_id"]), doc["topic"], narration, video_id)
+    if render.profiling:
+        await render_profiling.record(
+            db, str(doc["_id"]), video_id, doc["topic"], render.profiling, render.profile.name
+        )
+    await schedule_upgrade(
+        db, str(doc["_id"]), video_id, scene_class_name, manim_code, render.profile
+    )
+
+    updated_doc = await db.chat_histories.find_one({"_id": doc["_id"]})
+    return ChatHistoryResponse.from_doc(updated_doc)
+
+
+@app.get("/api/profiling/renders")
+async def list_profiled_renders(
+    limit: int = Query(20, ge=1, le=100),
+    phase: str | None = Query(None, pattern="^(tts|tex|text|frames|encode|other)$"),
+    hotspots: int = Query(10, ge=0, le=20),
+):
+    """Slowest profiled renders, overall or in one phase, with top hotspots and pstats link."""
+    return {"renders": await render_profiling.slowest(get_database(), limit, phase, hotspots)}
+
+
+@app.get("/api/videos/{video_id}/hls/{playlist:path}")
+async def get_hls_playlist(video_id: str, playlist: str):
+    """Serve an HLS playlist with its segments rewritten to storage URLs (presigned on S3).
+
+    Nested playlists stay relative, so players resolve them back to this endpoint.
+    """
+    if not playlist.endswith(".m3u8") or ".." in playlist.split("/"):
+        raise HTTPException(status_code=404, detail="Playlist not found")
+
+    doc = await get_database().chat_histories.find_one(
+        {"video_id": video_id}, {"hls_manifest_key": 1}
+    )
+    if not doc or not doc.get("hls_manifest_key"):
+        raise HTTPException(status_code=404, detail="Playlist not found")
+
+    storage = get_storage()
+    # Content-addressed prefix (hls/<sha256>), shared by identical videos
+    prefix = posixpath.dirname(doc["hls_manifest_key"])
+    try:
+        text = await storage.read_text(f"{prefix}/{playlist}")
+    except StorageError:
+        raise HTTPException(status_code=404, detail="Playlist not found")
+
+    base = posixpath.dirname(f"{prefix}/{playlist}")
+    lines = []
+    for line in text.splitlines():
+        if line and not line.startswith("#") and not line.endswith(".m3u8"):
+            line = await storage.url_for(f"{base}/{line}")
+        lines.append(line)
+
+    return Response(
+        "\n".join(lines) + "\n",
+        media_type="application/vnd.apple.mpegurl",
+        # Must expire well before the presigned segment URLs do
+        headers={"Cache-Control": "private, max-age=300"},
+    )
+
+
+@app.get("/api/videos/{video_id}/previews/{name}")
+async def get_video_preview(video_id: str, name: str):
+    """Redirect to a preview image (poster, thumbnail or sprite sheet) in storage."""
+    doc = await get_database().chat_histories.find_one({"video_id": video_id}, {"previews": 1})
+    previews = (doc or {}).get("previews")
+    if not previews:
+        raise HTTPException(status_code=404, detail="Preview not found")
+    names = {previews["poster"], previews["sprite"]["file"], *previews["thumbnails"].values()}
+    if name not in names:
+        raise HTTPException(status_code=404, detail="Preview not found")
+    url = await get_storage().url_for(f"{previews['prefix']}/{name}")
+    # Must expire well before the presigned URL does
+    return RedirectResponse(url, headers={"Cache-Control": "private, max-age=300"})
+
+
+@app.get(LOCAL_MEDIA_ROUTE + "/{key:path}")
+async def get_local_media(key: str, request: Request):
+    """Serve objects from local storage (STORAGE_BACKEND=local) with Range support."""
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=404, detail="Not found")
+    try:
+        path = storage.path_for(key)
+    except StorageError:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Not found")
+    return RangeFileResponse(path, content_type_for(key), request.headers.get("range"))
 
 
 @app.post("/api/chat-history", response_model=ChatHistoryResponse)
@@ -185,80 +648,152 @@ async def create_chat_history(chat: ChatHistory):
     """Create a new chat history entry."""
     db = get_database()
     chat_dict = chat.model_dump(exclude={"id"})
+    chat_dict["search_terms"] = search_terms(chat.topic)
     chat_dict["created_at"] = datetime.utcnow()
     chat_dict["updated_at"] = datetime.utcnow()
 
     result = await db.chat_histories.insert_one(chat_dict)
     chat_dict["_id"] = str(result.inserted_id)
+    await response_cache.invalidate_lists()
 
-    return ChatHistoryResponse(
-        id=str(result.inserted_id),
-        topic=chat_dict["topic"],
-        video_url=chat_dict.get("video_url"),
-        video_id=chat_dict.get("video_id"),
-        created_at=chat_dict["created_at"],
-        updated_at=chat_dict["updated_at"],
-        chat_messages=chat_dict.get("chat_messages", [])
-    )
+    return ChatHistoryResponse.from_doc(chat_dict)
 
 
 @app.get("/api/chat-history", response_model=ChatHistoryListResponse)
-async def get_chat_histories(skip: int = 0, limit: int = 50):
-    """Get all chat histories with pagination."""
-    db = get_database()
-
-    # Get total count
-    total = await db.chat_histories.count_documents({})
+async def get_chat_histories(
+    skip: int = 0, limit: int = Query(50, ge=1, le=200), cursor: str | None = None
+):
+    """Get all chat histories with pagination (first pages served from cache).
+
+    Prefer `cursor` (the previous page's `next_cursor`) over `skip` for deep
+    pages: it seeks on the (created_at, _id) index instead of scanning past
+    `skip` entries.
+    """
+    if cursor is not None:
+        try:
+            keyset = after_cursor(decode_cursor(cursor))
+        except SearchError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def load():
+        db = get_database()
+
+        # Metadata count: O(1), unlike count_documents({}) which scans
+        total = await db.chat_histories.estimated_document_count()
+
+        # Get paginated results, sorted by most recent first
+        if cursor is not None:
+            query = db.chat_histories.find(keyset, LIST_PROJECTION)
+        else:
+            query = db.chat_histories.find({}, LIST_PROJECTION).skip(skip)
+        query = query.sort([("created_at", -1), ("_id", -1)]).limit(limit + 1)
+        docs = await query.to_list(limit + 1)
+        chats = [ChatHistorySummary.from_doc(doc) for doc in docs[:limit]]
+        next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+
+        return ChatHistoryListResponse(
+            total=total, chats=chats, next_cursor=next_cursor
+        ).model_dump_json().encode()
+
+    if cursor is not None or skip > settings.response_cache_list_max_skip:
+        body = await load()
+    else:
+        body = await response_cache.get_or_load(list_key(skip, limit), load)
+    return Response(body, media_type="application/json")
+
+
+@app.get("/api/chat-history/search", response_model=ChatSearchResponse)
+async def search_chat_histories_endpoint(
+    q: str = "",
+    mode: str = "text",
+    has_video: bool | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: str | None = None,
+):
+    """Search chat histories by topic and message content.
+
+    `mode=text` ranks by relevance; `mode=prefix` is typeahead over topic words
+    (newest first). Without `q` this lists chats matching the filters.
+    """
+    query = SearchQuery(q, mode, has_video, created_after, created_before, limit, cursor)
+    try:
+        result = await search_chat_histories(get_database(), query)
+    except SearchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # Get paginated results, sorted by most recent first
-    cursor = db.chat_histories.find().sort("created_at", -1).skip(skip).limit(limit)
     chats = []
+    for doc in result["chats"]:
+        hit = ChatSearchHit.from_doc(doc)
+        hit.score = doc.get("score")
+        chats.append(hit)
+    return ChatSearchResponse(chats=chats, next_cursor=result["next_cursor"])
+
+
+@app.get("/api/chat-history/events")
+async def chat_history_events(request: Request, resume: str | None = None):
+    """Stream inserts, updates and deletes of chat histories as SSE deltas.
+
+    Each event id is a resume token; reconnecting with it (Last-Event-ID, or
+    `resume`) replays what was missed. See history_feed.py.
+    """
+    db = get_database()
+    try:
+        await history_feed.start(db)
+    except FeedUnavailableError as e:
+        raise HTTPException(
+            status_code=503, detail=f"Change streams unavailable (needs a replica set): {e}"
+        )
+    resume = resume or request.headers.get("last-event-id") or None
 
-    async for doc in cursor:
-        chats.append(ChatHistoryResponse(
-            id=str(doc["_id"]),
-            topic=doc["topic"],
-            video_url=doc.get("video_url"),
-            video_id=doc.get("video_id"),
-            created_at=doc["created_at"],
-            updated_at=doc["updated_at"],
-            chat_messages=doc.get("chat_messages", [])
-        ))
+    async def event_stream():
+        client = await history_feed.subscribe(db, resume)
+        metrics.incr("history_feed_connections_total")
+        try:
+            while True:
+                item = await client.next(timeout=15)
+                if item is None:
+                    # Send a heartbeat comment to keep connection alive
+                    yield ": heartbeat\n\n"
+                    continue
+                yield encode_event(item)
+        except FeedSlowConsumer:
+            metrics.incr("history_feed_slow_consumers_total")
+        finally:
+            history_feed.unsubscribe(client)
 
-    return ChatHistoryListResponse(total=total, chats=chats)
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
 
 
 @app.get("/api/chat-history/{chat_id}", response_model=ChatHistoryResponse)
 async def get_chat_history(chat_id: str):
-    """Get a specific chat history by ID."""
-    db = get_database()
-
+    """Get a specific chat history by ID (served from cache when possible)."""
     try:
-        doc = await db.chat_histories.find_one({"_id": ObjectId(chat_id)})
+        object_id = ObjectId(chat_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid chat ID format")
 
-    if not doc:
-        raise HTTPException(status_code=404, detail="Chat history not found")
+    async def load():
+        doc = await get_database().chat_histories.find_one({"_id": object_id})
+        return ChatHistoryResponse.from_doc(doc).model_dump_json().encode() if doc else None
 
-    return ChatHistoryResponse(
-        id=str(doc["_id"]),
-        topic=doc["topic"],
-        video_url=doc.get("video_url"),
-        video_id=doc.get("video_id"),
-        created_at=doc["created_at"],
-        updated_at=doc["updated_at"],
-        chat_messages=doc.get("chat_messages", [])
-    )
+    body = await response_cache.get_or_load(chat_key(chat_id), load)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Chat history not found")
+    return Response(body, media_type="application/json")
 
 
 @app.put("/api/chat-history/{chat_id}", response_model=ChatHistoryResponse)
 async def update_chat_history(chat_id: str, chat: ChatHistory):
-    """Update an existing chat history."""
+    """Update an existing chat history: only the fields sent in the body (see ChatHistory)."""
     db = get_database()
 
     try:
-        chat_dict = chat.model_dump(exclude={"id"})
+        chat_dict = chat.model_dump(exclude={"id", "created_at", "updated_at"}, exclude_unset=True)
+        chat_dict["search_terms"] = search_terms(chat.topic)
+        if "manim_code" in chat_dict:
+            chat_dict["narration"] = extract_narration(chat.manim_code or "")
         chat_dict["updated_at"] = datetime.utcnow()
 
         result = await db.chat_histories.update_one(
@@ -269,17 +804,15 @@ async def update_chat_history(chat_id: str, chat: ChatHistory):
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Chat history not found")
 
+        await response_cache.invalidate_chat(chat_id)
         updated_doc = await db.chat_histories.find_one({"_id": ObjectId(chat_id)})
+        if updated_doc.get("manim_code") and updated_doc.get("video_id"):
+            script_index.add(chat_id, updated_doc["topic"], updated_doc.get("narration", []),
+                             updated_doc["video_id"])
+        else:
+            script_index.remove(chat_id)
 
-        return ChatHistoryResponse(
-            id=str(updated_doc["_id"]),
-            topic=updated_doc["topic"],
-            video_url=updated_doc.get("video_url"),
-            video_id=updated_doc.get("video_id"),
-            created_at=updated_doc["created_at"],
-            updated_at=updated_doc["updated_at"],
-            chat_messages=updated_doc.get("chat_messages", [])
-        )
+        return ChatHistoryResponse.from_doc(updated_doc)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -295,6 +828,9 @@ async def delete_chat_history(chat_id: str):
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Chat history not found")
 
+        await response_cache.invalidate_chat(chat_id)
+        script_index.remove(chat_id)
+
         return {"message": "Chat history deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -1,6 +1,6 @@
 """Pydantic models for chat history and video data."""
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any
 
 from pydantic import BaseModel, Field
 
@@ -13,13 +13,22 @@ class ChatMessage(BaseModel):
 
 
 class ChatHistory(BaseModel):
-    """Complete chat history for a video generation session."""
-    id: Optional[str] = Field(None, alias="_id")
+    """The client-writable fields of a chat history (create and update bodies).
+
+    The pipeline also stores fields clients must not overwrite or forge, and
+    that these bodies therefore leave out: `hls_manifest_key`, `video_key` and
+    `content_hash` (content-addressed storage of the MP4), `previews` (see
+    package_video.publish_previews), `narration` (derived from the script),
+    `render_stats`, `reused_from`, `scene_graph` (JSON the script was compiled
+    from), `batch_id`, `tenant` (who requested it, X-Tenant-Id) and
+    `search_terms`.
+    """
+    id: str | None = Field(None, alias="_id")
     topic: str
-    video_url: Optional[str] = None
-    video_id: Optional[str] = None
-    chat_messages: List[ChatMessage] = []
-    manim_code: Optional[str] = None
+    video_url: str | None = None
+    video_id: str | None = None
+    chat_messages: list[ChatMessage] = []
+    manim_code: str | None = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -30,18 +39,114 @@ class ChatHistory(BaseModel):
         }
 
 
-class ChatHistoryResponse(BaseModel):
-    """Response model for chat history."""
+class ChatHistorySummary(BaseModel):
+    """A chat history in lists and search results.
+
+    Fetch the chat itself for its script, scene graph and messages.
+    """
+
     id: str
     topic: str
-    video_url: Optional[str] = None
-    video_id: Optional[str] = None
+    video_url: str | None = None
+    video_id: str | None = None
+    hls_url: str | None = None  # API path of the HLS master playlist
+    # API paths of the preview images (redirect to storage), and the sprite's tile geometry
+    poster_url: str | None = None
+    thumbnail_urls: dict[str, str] = {}  # by width
+    sprite_url: str | None = None
+    sprite: dict[str, Any] | None = None
+    render_stats: dict[str, Any] = {}
+    reused_from: str | None = None
+    batch_id: str | None = None
+    tenant: str | None = None
     created_at: datetime
     updated_at: datetime
-    chat_messages: List[ChatMessage] = []
+
+    @classmethod
+    def from_doc(cls, doc: dict[str, Any]):
+        """Build a response from a raw `chat_histories` document."""
+        return cls(**cls._fields(doc))
+
+    @classmethod
+    def _fields(cls, doc: dict[str, Any]) -> dict[str, Any]:
+        previews = doc.get("previews") if doc.get("video_id") else None
+        preview_base = f"/api/videos/{doc.get('video_id')}/previews"
+        return dict(
+            id=str(doc["_id"]),
+            topic=doc["topic"],
+            video_url=doc.get("video_url"),
+            video_id=doc.get("video_id"),
+            hls_url=f"/api/videos/{doc['video_id']}/hls/master.m3u8"
+                if doc.get("hls_manifest_key") else None,
+            poster_url=f"{preview_base}/{previews['poster']}" if previews else None,
+            thumbnail_urls={
+                width: f"{preview_base}/{name}" for width, name in previews["thumbnails"].items()
+            } if previews else {},
+            sprite_url=f"{preview_base}/{previews['sprite']['file']}" if previews else None,
+            sprite=previews["sprite"] if previews else None,
+            render_stats=doc.get("render_stats") or {},
+            reused_from=doc.get("reused_from"),
+            batch_id=doc.get("batch_id"),
+            tenant=doc.get("tenant"),
+            created_at=doc["created_at"],
+            updated_at=doc["updated_at"],
+        )
+
+
+class ChatHistoryResponse(ChatHistorySummary):
+    """Response model for chat history."""
+    manim_code: str | None = None
+    scene_graph: dict[str, Any] | None = None
+    chat_messages: list[ChatMessage] = []
+
+    @classmethod
+    def _fields(cls, doc: dict[str, Any]) -> dict[str, Any]:
+        return dict(
+            super()._fields(doc),
+            manim_code=doc.get("manim_code"),
+            scene_graph=doc.get("scene_graph"),
+            chat_messages=doc.get("chat_messages", []),
+        )
 
 
 class ChatHistoryListResponse(BaseModel):
     """Response model for list of chat histories."""
     total: int
-    chats: List[ChatHistoryResponse]
+    chats: list[ChatHistorySummary]
+    # Keyset cursor for the page after this one (pass as `cursor`)
+    next_cursor: str | None = None
+
+
+class ChatSearchHit(ChatHistorySummary):
+    """A search result; `score` is set for relevance-ranked (text) searches."""
+    score: float | None = None
+
+
+class ChatSearchResponse(BaseModel):
+    """One page of search results; pass `next_cursor` back to get the next one."""
+    chats: list[ChatSearchHit]
+    next_cursor: str | None = None
+
+
+class BatchPayload(BaseModel):
+    """A syllabus to generate as one batch."""
+    title: str
+    topics: list[str] = Field(..., min_length=1, max_length=100)
+
+
+class BatchItemResponse(BaseModel):
+    topic: str
+    chat_id: str | None = None
+    status: str
+    error: str | None = None
+
+
+class BatchResponse(BaseModel):
+    """Response model for a batch and the status of each of its topics."""
+    id: str
+    title: str
+    status: str
+    tenant: str | None = None
+    items: list[BatchItemResponse]
+    created_at: datetime
+    updated_at: datetime
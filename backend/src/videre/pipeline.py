@@ -0,0 +1,228 @@
+"""Post-render stages shared by single (`/api/integrate`) and batch generation."""
+from __future__ import annotations
+
+import asyncio
+import traceback
+import uuid
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+from .utils import render_profiling
+from .utils.create_video import GeneratedVideo, render_video, video_render_lock
+from .utils.metrics import metrics
+from .utils.package_video import publish_video
+from .utils.render_profiles import RENDER_UPGRADE, RenderProfile, render_policy
+from .utils.render_queue import RENDER_JOB_TIMEOUT_SECONDS, RENDER_MODE
+from .utils.response_cache import response_cache
+from .utils.script_index import script_index
+from .utils.storage import get_storage, video_key
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+# How often pending upgrades re-check the load, and when one gives up
+UPGRADE_POLL_SECONDS = 30
+UPGRADE_MAX_WAIT_SECONDS = 6 * 3600
+# A running upgrade whose process died is retried after this long
+UPGRADE_LEASE_SECONDS = RENDER_JOB_TIMEOUT_SECONDS + 600
+
+_upgrades: set[asyncio.Task] = set()
+
+
+async def publish_result(result: GeneratedVideo) -> dict:
+    """Package and upload a rendered video, unless a render worker already did."""
+    if result.render.uploaded:
+        return result.render.published
+    return await publish_video(result.render.video_path, result.video_uuid, result.render.profile)
+
+
+async def record_result(
+    db: AsyncIOMotorDatabase, chat_id: str, topic: str, result: GeneratedVideo, published: dict
+) -> str:
+    """Store the video and its script on the chat history. Returns the video URL."""
+    video_url = await get_storage().url_for(
+        published.get("video_key") or video_key(result.video_uuid)
+    )
+
+    await db.chat_histories.update_one(
+        {"_id": ObjectId(chat_id)},
+        {
+            "$set": {
+                "video_url": video_url,
+                "video_id": result.video_uuid,
+                "hls_manifest_key": published.get("hls_manifest_key"),
+                "video_key": published.get("video_key"),
+                "content_hash": published.get("content_hash"),
+                "previews": published.get("previews"),
+                "manim_code": result.manim_code,
+                "narration": result.narration,
+                "render_stats": result.render_stats,
+                "reused_from": result.reused_from,
+                "scene_graph": result.scene_graph,
+                "updated_at": datetime.utcnow()
+            }
+        }
+    )
+    await response_cache.invalidate_chat(chat_id)
+    script_index.add(chat_id, topic, result.narration, result.video_uuid)
+    if result.render.profiling:
+        await render_profiling.record(
+            db,
+            chat_id,
+            result.video_uuid,
+            topic,
+            result.render.profiling,
+            result.render.profile.name,
+        )
+    await schedule_upgrade(
+        db,
+        chat_id,
+        result.video_uuid,
+        result.scene_class_name,
+        result.manim_code,
+        result.render.profile,
+    )
+    return video_url
+
+
+async def schedule_upgrade(
+    db: AsyncIOMotorDatabase,
+    chat_id: str,
+    video_uuid: str,
+    scene_class_name: str,
+    manim_code: str,
+    profile: RenderProfile | None,
+):
+    """With RENDER_UPGRADE, queue a re-render of a video that was degraded under load.
+
+    Upgrades are stored in `render_upgrades` (one per chat; a newer render
+    replaces the pending one) and run by `run_upgrades` in any API process
+    once the load drops, so they survive restarts.
+    """
+    if not RENDER_UPGRADE or profile is None or profile.rank >= render_policy.best.rank:
+        return
+    now = datetime.utcnow()
+    await db.render_upgrades.update_one(
+        {"_id": chat_id},
+        {"$set": {
+            "video_uuid": video_uuid,
+            "scene_class_name": scene_class_name,
+            "manim_code": manim_code,
+            "profile": profile.name,
+            "status": "pending",
+            "lease_token": None,
+            "lease_expires_at": None,
+            "created_at": now,
+        }},
+        upsert=True,
+    )
+
+
+def start_upgrades(db: AsyncIOMotorDatabase):
+    """Start this process's `run_upgrades` loop (with RENDER_UPGRADE)."""
+    if RENDER_UPGRADE and not _upgrades:
+        task = asyncio.create_task(run_upgrades(db))
+        _upgrades.add(task)
+        task.add_done_callback(_upgrades.discard)
+
+
+def stop_upgrades():
+    for task in _upgrades:
+        task.cancel()
+
+
+async def run_upgrades(db: AsyncIOMotorDatabase):
+    """Run queued upgrades one at a time while the render policy would pick the best profile."""
+    await db.render_upgrades.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+    while True:
+        await asyncio.sleep(UPGRADE_POLL_SECONDS)
+        try:
+            now = datetime.utcnow()
+            expired = await db.render_upgrades.delete_many(
+                {
+                    "status": "pending",
+                    "created_at": {"$lt": now - timedelta(seconds=UPGRADE_MAX_WAIT_SECONDS)},
+                }
+            )
+            if expired.deleted_count:
+                metrics.incr("render_upgrades_total", expired.deleted_count, outcome="expired")
+            if not await db.render_upgrades.count_documents(
+                {"status": {"$in": ["pending", "running"]}}, limit=1
+            ):
+                continue
+            load = await render_policy.current_load(db if RENDER_MODE == "queue" else None)
+            if render_policy.choose(load) != render_policy.best:
+                continue
+            upgrade = await _lease_upgrade(db)
+            if upgrade is not None:
+                outcome = await _upgrade(db, upgrade)
+                metrics.incr("render_upgrades_total", outcome=outcome)
+                # A newer render of the chat may have replaced the upgrade meanwhile
+                await db.render_upgrades.delete_one(
+                    {"_id": upgrade["_id"], "lease_token": upgrade["lease_token"]}
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Render upgrade loop error: {e}")
+            traceback.print_exc()
+
+
+async def _lease_upgrade(db: AsyncIOMotorDatabase) -> dict | None:
+    """Claim the oldest pending upgrade, or one whose API process died while running it."""
+    now = datetime.utcnow()
+    return await db.render_upgrades.find_one_and_update(
+        {"$or": [
+            {"status": "pending"},
+            {"status": "running", "lease_expires_at": {"$lt": now}},
+        ]},
+        {"$set": {
+            "status": "running",
+            "lease_token": uuid.uuid4().hex,
+            "lease_expires_at": now + timedelta(seconds=UPGRADE_LEASE_SECONDS),
+        }},
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _upgrade(db: AsyncIOMotorDatabase, upgrade: dict) -> str:
+    """Re-render an upgrade at the best profile and swap it in. Returns the outcome."""
+    chat_id, video_uuid, manim_code = upgrade["_id"], upgrade["video_uuid"], upgrade["manim_code"]
+    best = render_policy.best
+    try:
+        async with video_render_lock(video_uuid):
+            render = await render_video(
+                manim_code, upgrade["scene_class_name"], video_uuid, profile=best
+            )
+            published = render.published
+            if not render.uploaded:
+                published = await publish_video(render.video_path, video_uuid, best)
+        video_url = await get_storage().url_for(published.get("video_key") or video_key(video_uuid))
+    except Exception as e:
+        print(f"Upgrade render of {video_uuid} to {best.name} failed: {e}")
+        traceback.print_exc()
+        return "failed"
+
+    # Only if the script wasn't edited and re-rendered in the meantime
+    update = await db.chat_histories.update_one(
+        {"_id": ObjectId(chat_id), "video_id": video_uuid, "manim_code": manim_code},
+        {
+            "$set": {
+                "video_url": video_url,
+                "hls_manifest_key": published.get("hls_manifest_key"),
+                "video_key": published.get("video_key"),
+                "content_hash": published.get("content_hash"),
+                "previews": published.get("previews"),
+                "render_stats.render_profile": best.name,
+                "render_stats.upgraded_from": upgrade["profile"],
+                "updated_at": datetime.utcnow(),
+            }
+        },
+    )
+    if update.matched_count:
+        await response_cache.invalidate_chat(chat_id)
+    return "done" if update.matched_count else "superseded"
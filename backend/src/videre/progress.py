@@ -0,0 +1,117 @@
+"""Multiplexed job progress over one WebSocket per client.
+
+Generations (`/api/integrate`, keyed by chat id) and batches (keyed by batch
+id) publish their events to `progress_hub` as well as to their own SSE
+streams. A client opens one WebSocket (`/api/progress`) and subscribes to any
+number of job ids:
+
+    -> {"op": "subscribe", "jobs": ["<id>", ...]}
+    -> {"op": "unsubscribe", "jobs": ["<id>", ...]}
+    <- {"j": "<id>", "t": "<event type>", "d": {...}}
+
+On subscribe the client first gets the job's latest event, if any.
+
+Publishing never waits on a client. Each connection has an outbox, and
+intermediate progress events carry a coalescing key: a newer event with the
+same key replaces the queued one. So a slow consumer skips intermediate
+progress but always gets the latest state and every milestone event. A
+consumer that falls behind on milestones too (more than OUTBOX_LIMIT queued)
+is disconnected.
+"""
+import asyncio
+import json
+from collections import OrderedDict, deque
+
+from .utils.metrics import metrics
+
+OUTBOX_LIMIT = 1000
+# How many finished jobs keep their last event for late subscribers
+LAST_EVENT_JOBS = 10000
+
+
+class SlowConsumerError(Exception):
+    pass
+
+
+class Subscriber:
+    """One connection's subscriptions and pending frames."""
+
+    def __init__(self):
+        self.jobs: set[str] = set()
+        self._order: deque[tuple[str | None, dict]] = deque()
+        self._coalesced: dict[str, dict] = {}
+        self._ready = asyncio.Event()
+        self.overflowed = False
+
+    def push(self, frame: dict, coalesce: str | None = None):
+        if coalesce is not None:
+            key = f"{frame['j']}\0{coalesce}"
+            if key in self._coalesced:
+                # Still queued: replace it in place, the old one is never sent
+                self._coalesced[key] = frame
+                metrics.incr("progress_frames_coalesced_total")
+                return
+            self._coalesced[key] = frame
+            self._order.append((key, frame))
+        else:
+            self._order.append((None, frame))
+        if len(self._order) > OUTBOX_LIMIT:
+            self.overflowed = True
+        self._ready.set()
+
+    async def next_frame(self) -> dict:
+        while not self._order:
+            self._ready.clear()
+            await self._ready.wait()
+        if self.overflowed:
+            raise SlowConsumerError()
+        key, frame = self._order.popleft()
+        if key is not None:
+            frame = self._coalesced.pop(key)
+        return frame
+
+
+class ProgressHub:
+    def __init__(self):
+        self._subscribers: dict[str, set[Subscriber]] = {}
+        self._last: OrderedDict[str, dict] = OrderedDict()
+
+    def publish(self, job_id: str, event_type: str, data: dict, coalesce: str | None = None):
+        """Fan an event out to the job's subscribers. Never blocks.
+
+        Events with the same `coalesce` key supersede each other in a slow
+        consumer's outbox; events without one are always delivered.
+        """
+        frame = {"j": job_id, "t": event_type, "d": data}
+        self._last[job_id] = frame
+        self._last.move_to_end(job_id)
+        while len(self._last) > LAST_EVENT_JOBS:
+            self._last.popitem(last=False)
+        for subscriber in self._subscribers.get(job_id, ()):
+            subscriber.push(frame, coalesce)
+        metrics.incr("progress_frames_published_total")
+
+    def subscribe(self, subscriber: Subscriber, job_ids):
+        for job_id in job_ids:
+            if job_id in subscriber.jobs:
+                continue
+            subscriber.jobs.add(job_id)
+            self._subscribers.setdefault(job_id, set()).add(subscriber)
+            if job_id in self._last:
+                subscriber.push(self._last[job_id], coalesce="snapshot")
+
+    def unsubscribe(self, subscriber: Subscriber, job_ids):
+        for job_id in job_ids:
+            subscriber.jobs.discard(job_id)
+            subscribers = self._subscribers.get(job_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[job_id]
+
+
+progress_hub = ProgressHub()
+
+
+def encode_frame(frame: dict) -> str:
+    return json.dumps(frame, separators=(",", ":"), default=str)
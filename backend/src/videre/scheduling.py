@@ -0,0 +1,344 @@
+"""Per-tenant fair scheduling of generations.
+
+Every generation request carries a tenant (the `X-Tenant-Id` header) and a
+priority class: "interactive" for
+`/api/integrate` and re-renders, "batch" for `/api/batches`. A job holds one
+of GENERATION_SLOTS while it generates or renders its video. When the slots
+are busy, jobs wait in `generation_scheduler`, which hands out freed slots by
+weighted fair queuing (self-clocked: each job gets a virtual finish tag
+`max(V, last tag of its flow) + 1 / weight`, the smallest tag runs next and
+sets V). A flow is one tenant's jobs of one class, weighted by the tenant's
+weight times the class weight (PRIORITY_WEIGHTS). So one tenant submitting
+many topics gets its share instead of the whole capacity, interactive work
+overtakes batch work without starving it, and an idle system still gives a
+lone tenant every slot up to its concurrency limit.
+
+Only tenants listed in TENANT_LIMITS are told apart. A missing or unlisted
+header is "anonymous", so a client cannot dodge its share or quota by sending
+a fresh id per request, and per-tenant state stays bounded by the configured
+list. The header is not authenticated: put the API behind a proxy that sets
+it if tenants must not impersonate each other.
+
+Limits per tenant:
+- concurrency: slots one tenant holds at once; more jobs wait,
+- queue: jobs one tenant may have waiting; more are rejected ("queue_full"),
+- daily quota: new videos per UTC day, counted in the `tenant_usage`
+  collection so it holds across API processes ("daily_quota").
+
+Rejections raise `RejectedError`, sent to the client as a `rejected` SSE
+event. Scheduling is per API process; in RENDER_MODE=queue it bounds how many
+renders each API node hands to the workers at once.
+
+Environment variables supported:
+- GENERATION_SLOTS (default: 4) - generations running at once per API process
+- PRIORITY_WEIGHTS (default: interactive:4,batch:1)
+- TENANT_WEIGHT (default: 1), TENANT_MAX_CONCURRENT (default: 4),
+  TENANT_MAX_QUEUED (default: 20), TENANT_DAILY_QUOTA (default: 0 = unlimited)
+  - defaults for every tenant
+- TENANT_LIMITS (default: unset) - the known tenants and their overrides,
+  `<tenant>:<weight>:<max concurrent>:<daily quota>,...`
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import re
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+
+from pymongo import ReturnDocument
+
+from .config import settings
+from .utils.metrics import metrics
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+GENERATION_SLOTS = settings.generation_slots
+PRIORITY_WEIGHTS = settings.priority_weights
+TENANT_LIMITS = settings.tenant_limits
+
+DEFAULT_TENANT = "anonymous"
+PRIORITIES = ("interactive", "batch")
+_TENANT_RE = re.compile(r"^[A-Za-z0-9_.@-]{1,64}$")
+
+
+class RejectedError(Exception):
+    """A generation refused by a tenant limit; sent to the client as a `rejected` event."""
+
+    def __init__(self, reason: str, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def to_event(self) -> dict:
+        event = {"reason": self.reason, "message": str(self)}
+        if self.retry_after is not None:
+            event["retry_after_seconds"] = round(self.retry_after)
+        return event
+
+
+@dataclass
+class TenantLimits:
+    weight: float = settings.tenant_weight
+    max_concurrent: int = settings.tenant_max_concurrent
+    max_queued: int = settings.tenant_max_queued
+    daily_quota: int = settings.tenant_daily_quota  # 0 = unlimited
+
+
+def parse_tenant_limits(spec: str) -> dict[str, TenantLimits]:
+    """`acme:3:8:500` -> acme gets weight 3, 8 slots at once, 500 videos a day.
+
+    Empty fields keep the default.
+    """
+    limits = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        tenant, *values = part.strip().split(":")
+        default = TenantLimits()
+        weight, max_concurrent, daily_quota = (values + [None] * 3)[:3]
+        limits[tenant] = TenantLimits(
+            weight=float(weight) if weight else default.weight,
+            max_concurrent=int(max_concurrent) if max_concurrent else default.max_concurrent,
+            daily_quota=int(daily_quota) if daily_quota else default.daily_quota,
+        )
+    return limits
+
+
+def parse_priority_weights(spec: str) -> dict[str, float]:
+    """`interactive:4,batch:1` -> {"interactive": 4.0, "batch": 1.0}."""
+    weights = {priority: 1.0 for priority in PRIORITIES}
+    for part in spec.split(","):
+        if part.strip():
+            priority, _, weight = part.strip().partition(":")
+            weights[priority] = float(weight or 1)
+    return weights
+
+
+def tenant_id(header: str | None) -> str:
+    """The tenant named by a request header; ValueError if it is not a plain identifier.
+
+    Tenants without an entry in TENANT_LIMITS are "anonymous".
+    """
+    if not header:
+        return DEFAULT_TENANT
+    if not _TENANT_RE.match(header):
+        raise ValueError("Tenant id must be 1-64 letters, digits or _.@-")
+    return header if generation_scheduler.is_configured(header) else DEFAULT_TENANT
+
+
+@dataclass
+class _Waiter:
+    tenant: str
+    priority: str
+    tag: float
+    seq: int
+    future: asyncio.Future
+    enqueued_at: float
+
+
+@dataclass
+class _Tenant:
+    running: int = 0
+    granted: int = 0
+    rejected: int = 0
+    last_tags: dict[str, float] = field(
+        default_factory=dict
+    )  # priority -> finish tag of its last job
+
+
+class FairScheduler:
+    """Weighted fair queuing of generation slots across tenants and priority classes."""
+
+    def __init__(
+        self,
+        slots: int = GENERATION_SLOTS,
+        limits: dict[str, TenantLimits] | None = None,
+        priority_weights: dict[str, float] | None = None,
+    ):
+        self.slots = max(1, slots)
+        self._limits = limits if limits is not None else parse_tenant_limits(TENANT_LIMITS)
+        self._priority_weights = priority_weights or parse_priority_weights(PRIORITY_WEIGHTS)
+        self._flows: dict[tuple[str, str], deque[_Waiter]] = {}
+        self._tenants: dict[str, _Tenant] = {}
+        self._running = 0
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+
+    def is_configured(self, tenant: str) -> bool:
+        return tenant in self._limits
+
+    def limits(self, tenant: str) -> TenantLimits:
+        return self._limits.get(tenant) or TenantLimits()
+
+    def queued(self, tenant: str) -> int:
+        return sum(len(self._flows.get((tenant, priority), ())) for priority in PRIORITIES)
+
+    async def charge_daily_quota(self, db: AsyncIOMotorDatabase, tenant: str, count: int = 1):
+        """Count `count` new videos against today's quota; RejectedError if that exceeds it."""
+        quota = self.limits(tenant).daily_quota
+        if quota <= 0:
+            return
+        now = datetime.utcnow()
+        day = now.strftime("%Y-%m-%d")
+        usage = await db.tenant_usage.find_one_and_update(
+            {"_id": f"{tenant}:{day}"},
+            {"$inc": {"videos": count}, "$setOnInsert": {"tenant": tenant, "day": day}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if usage["videos"] > quota:
+            await db.tenant_usage.update_one({"_id": usage["_id"]}, {"$inc": {"videos": -count}})
+            midnight = datetime(now.year, now.month, now.day) + timedelta(days=1)
+            self._reject(tenant, RejectedError(
+                "daily_quota",
+                f"Daily quota of {quota} videos reached for tenant {tenant!r}",
+                retry_after=(midnight - now).total_seconds(),
+            ))
+
+    async def refund_daily_quota(self, db: AsyncIOMotorDatabase, tenant: str, count: int = 1):
+        """Give back videos charged by `charge_daily_quota` that were never generated."""
+        if self.limits(tenant).daily_quota <= 0:
+            return
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        await db.tenant_usage.update_one(
+            {"_id": f"{tenant}:{day}", "videos": {"$gte": count}}, {"$inc": {"videos": -count}}
+        )
+
+    def admit(self, tenant: str):
+        """RejectedError if the tenant already has its maximum of jobs waiting.
+
+        Check this before charging quota.
+        """
+        limits = self.limits(tenant)
+        if self.queued(tenant) >= limits.max_queued:
+            self._reject(
+                tenant,
+                RejectedError(
+                    "queue_full",
+                    f"Too many generations waiting for tenant {tenant!r} "
+                    f"(limit {limits.max_queued})",
+                ),
+            )
+
+    def _reject(self, tenant: str, rejection: RejectedError):
+        self._tenants.setdefault(tenant, _Tenant()).rejected += 1
+        metrics.incr("generation_rejections_total", tenant=tenant, reason=rejection.reason)
+        raise rejection
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        tenant: str,
+        priority: str = "interactive",
+        on_queued: Callable[[int], Awaitable[None]] | None = None,
+    ) -> AsyncIterator[None]:
+        """Hold a generation slot for the block, waiting for the tenant's fair turn.
+
+        `on_queued(position)` is awaited if the job has to wait. RejectedError if
+        the tenant already has its maximum of jobs waiting.
+        """
+        self.admit(tenant)
+        limits = self.limits(tenant)
+        state = self._tenants.setdefault(tenant, _Tenant())
+        loop = asyncio.get_running_loop()
+        weight = limits.weight * self._priority_weights.get(priority, 1.0)
+        tag = max(self._virtual_time, state.last_tags.get(priority, 0.0)) + 1.0 / weight
+        state.last_tags[priority] = tag
+        waiter = _Waiter(tenant, priority, tag, next(self._seq), loop.create_future(), loop.time())
+        self._flows.setdefault((tenant, priority), deque()).append(waiter)
+        self._dispatch()
+
+        try:
+            if not waiter.future.done() and on_queued is not None:
+                await on_queued(self.position(waiter))
+            await waiter.future
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release(tenant)  # granted just before the caller went away
+            else:
+                waiter.future.cancel()
+                self._remove(waiter)
+            raise
+
+        waited = loop.time() - waiter.enqueued_at
+        metrics.observe("generation_wait_seconds", waited, tenant=tenant, priority=priority)
+        try:
+            yield
+        finally:
+            self._release(tenant)
+
+    def position(self, waiter: _Waiter) -> int:
+        """1-based place of a waiting job among all waiting jobs, by finish tag."""
+        ahead = sum(
+            1 for flow in self._flows.values() for other in flow
+            if (other.tag, other.seq) < (waiter.tag, waiter.seq)
+        )
+        return ahead + 1
+
+    def _remove(self, waiter: _Waiter):
+        flow = self._flows.get((waiter.tenant, waiter.priority))
+        if flow is not None and waiter in flow:
+            flow.remove(waiter)
+            if not flow:
+                del self._flows[(waiter.tenant, waiter.priority)]
+
+    def _release(self, tenant: str):
+        self._running -= 1
+        self._tenants[tenant].running -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Start waiting jobs, smallest finish tag first, while slots are free."""
+        while self._running < self.slots:
+            best = None
+            for (tenant, _), flow in self._flows.items():
+                if self._tenants[tenant].running >= self.limits(tenant).max_concurrent:
+                    continue
+                head = flow[0]
+                if best is None or (head.tag, head.seq) < (best.tag, best.seq):
+                    best = head
+            if best is None:
+                return
+            flow = self._flows[(best.tenant, best.priority)]
+            flow.popleft()
+            if not flow:
+                del self._flows[(best.tenant, best.priority)]
+            state = self._tenants[best.tenant]
+            state.running += 1
+            state.granted += 1
+            self._running += 1
+            self._virtual_time = max(self._virtual_time, best.tag)
+            best.future.set_result(None)
+
+    def stats(self) -> dict:
+        tenants = {}
+        for tenant, state in self._tenants.items():
+            limits = self.limits(tenant)
+            tenants[tenant] = {
+                "running": state.running,
+                "queued": {
+                    priority: len(self._flows.get((tenant, priority), ()))
+                    for priority in PRIORITIES
+                },
+                "granted": state.granted,
+                "rejected": state.rejected,
+                "weight": limits.weight,
+                "max_concurrent": limits.max_concurrent,
+                "daily_quota": limits.daily_quota,
+            }
+        return {
+            "slots": self.slots,
+            "running": self._running,
+            "queued": sum(len(flow) for flow in self._flows.values()),
+            "priority_weights": self._priority_weights,
+            "tenants": tenants,
+        }
+
+
+generation_scheduler = FairScheduler()
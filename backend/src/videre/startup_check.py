@@ -0,0 +1,60 @@
+"""Import-time regression check for the API and worker entry points.
+
+Imports each entry point in a fresh interpreter and fails if it takes longer
+than the budget or pulls in an SDK that should only load on first use:
+
+    cd backend/src && uv run python -m videre.startup_check [--budget 1.5]
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+ENTRY_POINTS = ["videre.main", "videre.worker"]
+
+# Loaded lazily by the code that needs them (Claude client, S3 storage,
+# Context7 fetch, database connect)
+LAZY_MODULES = ["anthropic", "boto3", "aiohttp", "motor"]
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+print(json.dumps({{
+    "seconds": time.perf_counter() - started,
+    "loaded": [name for name in {lazy!r} if name in sys.modules],
+}}))
+"""
+
+
+def probe(module: str) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, lazy=LAZY_MODULES)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Check startup import time")
+    parser.add_argument(
+        "--budget", type=float, default=1.5, help="max import seconds per entry point"
+    )
+    parser.add_argument("--runs", type=int, default=3, help="take the fastest of this many runs")
+    args = parser.parse_args()
+
+    failed = False
+    for module in ENTRY_POINTS:
+        results = [probe(module) for _ in range(args.runs)]
+        seconds = min(result["seconds"] for result in results)
+        loaded = results[0]["loaded"]
+        ok = seconds <= args.budget and not loaded
+        failed |= not ok
+        status = "ok" if ok else "FAIL"
+        print(f"{status:4} {module}: {seconds:.3f}s (budget {args.budget}s)"
+              + (f", eagerly imports {', '.join(loaded)}" if loaded else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
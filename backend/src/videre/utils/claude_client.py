@@ -1,54 +1,237 @@
-"""A minimal async client wrapper for Anthropic/Claude using the official SDK.
+"""A shared async client wrapper for Anthropic/Claude using the official SDK.
 
-This module provides `run_claude_completion` which uses the Anthropic Python SDK
-to interact with Claude's API.
+All Claude traffic goes through one `AsyncAnthropic` client and `create_message`,
+which applies:
+- a global concurrency limit (semaphore),
+- token buckets for requests and tokens per minute, so bursts queue locally
+  instead of turning into 429s,
+- exponential backoff with full jitter on 429 / 529 / 5xx / connection errors,
+  honoring `retry-after` headers.
+
+Time spent waiting for capacity is recorded as the `claude_queue_wait_seconds`
+metric. The `anthropic` SDK is imported on first use, not at startup.
 
 Environment variables supported:
-- CLAUDE_API_KEY (required)
+- CLAUDE_API_KEY or ANTHROPIC_API_KEY (required)
+- CLAUDE_BASE_URL (optional) - e.g. a local fake server (`python -m videre.fake_llm`)
+- CLAUDE_MAX_CONCURRENCY (default: 8)
+- CLAUDE_REQUESTS_PER_MINUTE (default: 50)
+- CLAUDE_TOKENS_PER_MINUTE (default: 80000)
+- CLAUDE_MAX_RETRIES (default: 5)
 """
+from __future__ import annotations
+
 import asyncio
-import os
-from functools import partial
+import random
+import time
+from typing import TYPE_CHECKING
+
+from ..config import settings
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    import anthropic
+
+CLAUDE_API_KEY = settings.claude_api_key
+CLAUDE_BASE_URL = settings.claude_base_url
+DEFAULT_MODEL = "claude-sonnet-4-5-20250929"
 
-import anthropic
-from dotenv import load_dotenv
+CLAUDE_MAX_CONCURRENCY = settings.claude_max_concurrency
+CLAUDE_REQUESTS_PER_MINUTE = settings.claude_requests_per_minute
+CLAUDE_TOKENS_PER_MINUTE = settings.claude_tokens_per_minute
+CLAUDE_MAX_RETRIES = settings.claude_max_retries
 
-load_dotenv()
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
 
-# Get API key from environment
-CLAUDE_API_KEY = os.getenv("CLAUDE_API_KEY")
 
 class ClaudeError(RuntimeError):
-    pass
+    """A failed request. `retryable` is False for client errors (bad request, auth)."""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: int | None = None,
+        retryable: bool = False,
+        timeout: bool = False,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.timeout = timeout
+
+
+class TokenBucket:
+    """Continuously refilling bucket of `per_minute` units."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float):
+        # Never ask for more than a full bucket, or we would wait forever
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def refund(self, amount: float):
+        """Return over-estimated units (may go negative to charge under-estimates)."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+_client: anthropic.AsyncAnthropic | None = None
+_semaphore: asyncio.Semaphore | None = None
+_request_bucket = TokenBucket(CLAUDE_REQUESTS_PER_MINUTE)
+_token_bucket = TokenBucket(CLAUDE_TOKENS_PER_MINUTE)
+
+
+def _get_client() -> anthropic.AsyncAnthropic:
+    global _client, _semaphore
+    if not CLAUDE_API_KEY:
+        raise ClaudeError("No API key found. Set CLAUDE_API_KEY in the environment")
+    if _client is None:
+        import anthropic
+
+        # Retries are handled here so they also respect the rate limiter
+        _client = anthropic.AsyncAnthropic(
+            api_key=CLAUDE_API_KEY, base_url=CLAUDE_BASE_URL, max_retries=0
+        )
+        _semaphore = asyncio.Semaphore(CLAUDE_MAX_CONCURRENCY)
+    return _client
+
+
+def _estimate_tokens(messages: list, max_tokens: int) -> int:
+    chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return chars // 4 + max_tokens
+
+
+def _retry_delay(error: anthropic.APIError, attempt: int) -> float:
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    # Full jitter: uniform in [0, base * 2^attempt]
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def _is_retryable(error: Exception) -> bool:
+    import anthropic
+
+    if isinstance(
+        error, (anthropic.APIConnectionError, anthropic.APITimeoutError, asyncio.TimeoutError)
+    ):
+        return True
+    return (
+        isinstance(error, anthropic.APIStatusError) and error.status_code in RETRYABLE_STATUS_CODES
+    )
+
+
+async def create_message(
+    *,
+    model: str = DEFAULT_MODEL,
+    max_tokens: int,
+    messages: list,
+    max_retries: int = CLAUDE_MAX_RETRIES,
+    attempt_timeout: float | None = None,
+    timing: dict | None = None,
+    **kwargs,
+):
+    """`messages.create` through the shared client, limiter and retry policy.
+
+    `attempt_timeout` bounds each upstream call, not the time spent queueing for
+    capacity; a timed out attempt is retried like a connection error. If `timing`
+    is given, `timing["upstream_seconds"]` is set to the last attempt's duration.
+    """
+    client = _get_client()
+    estimated = _estimate_tokens(messages, max_tokens)
+
+    for attempt in range(max_retries + 1):
+        queued_at = time.monotonic()
+        async with _semaphore:
+            await _request_bucket.acquire(1)
+            await _token_bucket.acquire(estimated)
+            metrics.observe("claude_queue_wait_seconds", time.monotonic() - queued_at)
+
+            started = time.monotonic()
+            try:
+                response = await asyncio.wait_for(
+                    client.messages.create(
+                        model=model, max_tokens=max_tokens, messages=messages, **kwargs
+                    ),
+                    attempt_timeout,
+                )
+            except Exception as e:
+                # A failed attempt used no tokens; the retry charges its own
+                _token_bucket.refund(estimated)
+                if timing is not None:
+                    timing["upstream_seconds"] = time.monotonic() - started
+                status_code = getattr(e, "status_code", None)
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                metrics.incr(
+                    "claude_errors_total",
+                    model=model,
+                    status="timeout" if timed_out else status_code or "n/a",
+                )
+                retryable = _is_retryable(e)
+                if not retryable or attempt == max_retries:
+                    raise ClaudeError(
+                        f"Claude request failed: {str(e) or 'upstream call timed out'}",
+                        status_code=status_code,
+                        retryable=retryable,
+                        timeout=timed_out,
+                    ) from e
+                delay = _retry_delay(e, attempt)
+            else:
+                if timing is not None:
+                    timing["upstream_seconds"] = time.monotonic() - started
+                metrics.observe("claude_request_seconds", time.monotonic() - started, model=model)
+                usage = response.usage
+                _token_bucket.refund(estimated - (usage.input_tokens + usage.output_tokens))
+                return response
+
+        print(f"Claude request failed (attempt {attempt + 1}), retrying in {delay:.1f}s")
+        metrics.incr("claude_retries_total", model=model)
+        await asyncio.sleep(delay)
+
 
 async def run_claude_completion(
     prompt: str,
-    model="claude-sonnet-4-5-20250929",
+    model=DEFAULT_MODEL,
     max_tokens: int = 500,
     temperature: float = 0.7,
+    max_retries: int = CLAUDE_MAX_RETRIES,
+    attempt_timeout: float | None = None,
+    timing: dict | None = None,
 ) -> str:
     """Run a completion using the Anthropic Claude API and return the text output.
-    
-    Uses the official Anthropic Python SDK for reliable API interaction.
-    Available models: claude-sonnet-4-5-20250929
-    """
-    if not CLAUDE_API_KEY:
-        raise ClaudeError("No API key found. Set CLAUDE_API_KEY in the environment")
 
-    client = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
-
-    try:
-        loop = asyncio.get_event_loop()
-        response = await loop.run_in_executor(
-            None,
-            partial(
-                client.messages.create,
-                model=model,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                messages=[{"role": "user", "content": prompt}]
-            )
-        )
-        return response.content[0].text
-    except Exception as e:
-        raise ClaudeError(f"Claude request failed: {str(e)}")
+    Available models: claude-sonnet-4-5-20250929, claude-haiku-4-5-20251001
+    """
+    response = await create_message(
+        model=model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        messages=[{"role": "user", "content": prompt}],
+        max_retries=max_retries,
+        attempt_timeout=attempt_timeout,
+        timing=timing,
+    )
+    return response.content[0].text
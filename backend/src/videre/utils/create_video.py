@@ -1,30 +1,127 @@
 import asyncio
-import os
-import re
+import shutil
 import subprocess
-import tempfile
+import time
 import traceback
 import uuid
+from dataclasses import dataclass, field
 from pathlib import Path
 
-from anthropic import AsyncAnthropic
-from dotenv import load_dotenv
-from .fetch_context7_docs import fetch_context7_docs
+from ..config import settings
+from ..database import get_database
+from .docs_index import retrieve_docs
+from .dry_run import DRY_RUN_ENABLED, DryRunError, validate_and_repair
+from .hedged_codegen import HEDGE_CANDIDATES, generate_hedged
+from .manim_script import clean_code, extract_narration, rename_scene_class
+from .metrics import metrics
+from .model_router import model_router, topic_complexity
+from .narration import NARRATION_PRESYNTHESIS, NARRATION_SPEC_FILE, narration_plan, write_spec
+from .narration import record_stats as record_narration_stats
+from .render_cache import config_file, record_stats
+from .render_profiles import RenderProfile, default_profile, render_policy
+from .render_profiling import chat_summary
+from .render_profiling import collect as collect_profile
+from .render_profiling import sampled as profiling_sampled
+from .render_queue import RENDER_MODE, enqueue_render, wait_for_job
+from .scene_graph import (
+    SceneGraph,
+    SceneGraphError,
+    block_hashes,
+    compile_scene,
+    parse_scene_graph,
+    schema_prompt,
+)
+from .script_index import SCRIPT_REUSE_THRESHOLD, ScriptMatch, find_similar_script
 
-async def generate_video_with_gtts(topic, event_callback=None):
-    # Generate UUID for this video
-    video_uuid = str(uuid.uuid4())
-    scene_class_name = f"Scene_{video_uuid.replace('-', '_')}"  # Python class names can't have hyphens
+# Each video gets a persistent workspace (script + Manim media dir) so that
+# re-renders of an edited script hit Manim's partial movie file cache and the
+# voiceover audio cache instead of starting from scratch.
+RENDER_WORKSPACE_DIR = settings.render_workspace_dir
+SCENE_MODULE_NAME = "generated_scene"
+CODEGEN_FORMAT = settings.codegen_format
+SCENE_GRAPH_REPAIR_ATTEMPTS = settings.scene_graph_repair_attempts
+
+
+# One render at a time per video workspace
+_render_locks: dict[str, asyncio.Lock] = {}
+
+
+def video_workspace(video_uuid: str) -> Path:
+    return RENDER_WORKSPACE_DIR / video_uuid
+
+
+def profiling_dir(video_uuid: str) -> Path:
+    return video_workspace(video_uuid) / "profiling"
+
+
+def video_render_lock(video_uuid: str) -> asyncio.Lock:
+    return _render_locks.setdefault(video_uuid, asyncio.Lock())
+
+
+@dataclass
+class RenderResult:
+    """Where a render ended up: a local file, or already published by a render worker."""
+    video_path: Path | None = None
+    uploaded: bool = False
+    worker_id: str | None = None
+    published: dict = field(default_factory=dict)  # see package_video.publish_video
+    profile: RenderProfile | None = None
+    load: dict = field(default_factory=dict)  # see RenderLoad.to_stats, when the profile was chosen
+    profiling: dict = field(default_factory=dict)  # see render_profiling.collect, when profiled
+
+
+@dataclass
+class GeneratedVideo:
+    """Result of a successful generation + render."""
+    video_uuid: str
+    scene_class_name: str
+    manim_code: str
+    narration: list[str] = field(default_factory=list)
+    scene_graph: dict | None = None  # when compiled from a scene graph
+    render_stats: dict = field(default_factory=dict)
+    reused_from: str | None = None  # chat_id of the stored script reused for this video
+    render: RenderResult | None = None  # set once rendered
 
-    # Load environment variables
-    load_dotenv()
-    API_KEY = os.getenv("ANTHROPIC_API_KEY")
-    ELEVEN_API_KEY = os.getenv("ELEVEN_API_KEY")
 
+def _example_prompt(example: ScriptMatch | None) -> str:
+    if example is None:
+        return ""
+    return f"""
+    Here is a script that rendered successfully for the related topic "{example.topic}".
+    Use it as a starting point for structure and API usage, but adapt the narration
+    and visuals fully to the new topic:
+
+    {example.manim_code}
+    """
+
+
+def _transcript_prompt(transcript: str | None) -> str:
+    if not transcript:
+        return ""
+    return f"""
+    Use this narration transcript, split across the voiceover blocks, as the spoken script:
+
+    {transcript}
+    """
+
+
+async def generate_manim_code(
+    topic,
+    scene_class_name,
+    example: ScriptMatch | None = None,
+    transcript: str | None = None,
+    temperature: float = 1.0,
+) -> tuple[str, str]:
+    """Ask Claude for a complete Manim + voiceover script for `topic`.
+
+    The model is picked per request by the model router. Returns (code, model).
+    """
     try:
-        context7_docs = await fetch_context7_docs()
+        context7_docs = await retrieve_docs(topic)
     except Exception as e:
-        print(f"Warning: could not fetch Context7 docs: {e}")
+        print(f"Warning: could not retrieve Context7 docs: {e}")
+        context7_docs = ""
+    if not context7_docs:
         context7_docs = "No context available (fallback)."
 
     max_tokens = 4096
@@ -33,16 +130,17 @@ async def generate_video_with_gtts(topic, event_callback=None):
 
     use library /manimcommunity/manim-voiceover
 
-    Use Context7’s live docs to ensure correctness:
+    Use these Context7 doc snippets to ensure correctness:
 
     {context7_docs}
-
-    You are an expert educator and Manim animator. 
+    {_example_prompt(example)}
+    {_transcript_prompt(transcript)}
+    You are an expert educator and Manim animator.
     Given the topic: "{topic}", generate **one complete, end-to-end script and runnable Manim code** that teaches this concept visually. Follow these rules:
 
     1. Create a **clear, step-by-step 1-minute script** (~150–180 words) for GTTS narration.
-    2. The narration must include **specific examples, concrete values, and reasoning**. 
-    - For instance, if explaining a graph traversal: "We visit node A first because its distance 3 is the smallest among neighbors. Then we go to node B with distance 5..." 
+    2. The narration must include **specific examples, concrete values, and reasoning**.
+    - For instance, if explaining a graph traversal: "We visit node A first because its distance 3 is the smallest among neighbors. Then we go to node B with distance 5..."
     - The script should explicitly describe every step, value, and choice.
     3. Immediately generate **complete, runnable Python code** using Manim + manim-voiceover that visualizes each step.
     4. Visuals must exactly match the narration: animate nodes, arrows, numbers, highlighting choices, distances, and transitions.
@@ -72,84 +170,375 @@ async def generate_video_with_gtts(topic, event_callback=None):
 
     print("Generating highly specific Manim code + voiceover...")
 
-    async_client = AsyncAnthropic(api_key=API_KEY)
+    text, model = await model_router.complete(
+        prompt, topic, max_tokens=max_tokens, temperature=temperature
+    )
+
+    # Robust cleanup of any markdown backticks or language hints
+    return clean_code(text), model
+
+
+async def generate_scene_graph(
+    topic,
+    scene_class_name,
+    transcript: str | None = None,
+    temperature: float = 1.0,
+) -> tuple[str, str, SceneGraph]:
+    """Ask Claude for a JSON scene graph for `topic` and compile it locally.
+
+    Far fewer output tokens than a full script. A response that fails the
+    schema check is sent back with the errors (SCENE_GRAPH_REPAIR_ATTEMPTS
+    times). Returns (code, model, graph); SceneGraphError if it never validates.
+    """
+    prompt = f"""
+    {_transcript_prompt(transcript)}
+    You are an expert educator. Given the topic: "{topic}", plan a 1-minute explainer video
+    (~150-180 words of narration) as a JSON scene graph matching this JSON schema:
+
+    {schema_prompt()}
 
-    response = await async_client.messages.create(
-        max_tokens=max_tokens,
-        messages=[{"role": "user", "content": prompt}],
-        model="claude-sonnet-4-5-20250929",
+    Rules:
+    1. Split the narration into 4-10 blocks; each block's visuals appear while its
+       narration is spoken.
+    2. The narration must include specific examples, concrete values and reasoning,
+       step by step.
+    3. A block with new visuals replaces the previous block's visuals; the title stays
+       until replaced.
+    4. Use "highlight" (with the target's id, and index/node/edge where it applies) to point at what
+       the narration is talking about; the target must be on screen.
+    5. Formulas are LaTeX math, without surrounding $ signs.
+
+    Return **only the JSON object**, no explanations, no markdown.
+    """
+
+    print("Generating scene graph...")
+    max_tokens = 2048
+    text, model = await model_router.complete(
+        prompt, topic, max_tokens=max_tokens, temperature=temperature
     )
+    for attempt in range(SCENE_GRAPH_REPAIR_ATTEMPTS + 1):
+        try:
+            graph = parse_scene_graph(text)
+        except SceneGraphError as e:
+            metrics.incr("scene_graph_validations_total", outcome="fail")
+            if attempt == SCENE_GRAPH_REPAIR_ATTEMPTS:
+                model_router.record_outcome(model, "schema", False)
+                raise
+            repair_prompt = f"""{prompt}
 
-    manim_code = response.content[0].text.strip()
-    
-    if event_callback:
-        await event_callback("video_generation_manim_generated", {"message": "Manim code generated. Preparing to render video..."})
+    Your previous answer failed validation:
 
-    # Robust cleanup of any markdown backticks or language hints
-    manim_code = re.sub(r"^```(?:python)?", "", manim_code, flags=re.MULTILINE).strip()
-    manim_code = re.sub(r"```$", "", manim_code, flags=re.MULTILINE).strip()
+    {str(e)[:2000]}
 
-    print("=" * 60)
-    print("GENERATED MANIM CODE:")
-    print("=" * 60)
-    print(manim_code)
-    print("=" * 60)
+    Previous answer:
+
+    {text}
+
+    Return the corrected JSON object only.
+    """
+            text, model = await model_router.complete(
+                repair_prompt, topic, max_tokens=max_tokens, temperature=temperature
+            )
+        else:
+            metrics.incr("scene_graph_validations_total", outcome="pass")
+            model_router.record_outcome(model, "schema", attempt == 0)
+            return compile_scene(graph, scene_class_name), model, graph
 
-    # Save Manim code to a temporary file
-    temp_dir = tempfile.mkdtemp()
-    manim_file = Path(temp_dir) / "generated_scene.py"
+
+async def render_manim_code(
+    manim_code,
+    scene_class_name,
+    video_uuid,
+    event_callback=None,
+    profile: RenderProfile | None = None,
+    profiling: bool = False,
+) -> Path:
+    """Render `manim_code` in the video's workspace at `profile` and return the MP4 path.
+
+    Raises CalledProcessError on failure. Unchanged animations and voiceover
+    blocks from a previous render of the same video are served from cache.
+    With `profiling`, the runner leaves a profile in `profiling_dir`. The
+    narration is synthesized concurrently before Manim starts (narration.py).
+    """
+    profile = profile or default_profile()
+    workspace = video_workspace(video_uuid)
+    media_dir = workspace / "media"
+    media_dir.mkdir(parents=True, exist_ok=True)
+
+    # Save Manim code into the workspace; the module name must stay stable
+    # because Manim keys its partial movie directory on it
+    manim_file = workspace / f"{SCENE_MODULE_NAME}.py"
     with open(manim_file, "w") as f:
         f.write(manim_code)
 
-    print(f"Saved Manim code to temporary file: {manim_file}")
-    
+    print(f"Saved Manim code to: {manim_file}")
+
     if event_callback:
-        await event_callback("video_generation_status", {"message": "Rendering video with Manim (this may take a minute)..."})
+        await event_callback(
+            "video_generation_status",
+            {"message": "Rendering video with Manim (this may take a minute)..."},
+        )
+
+    # Run Manim using uv from project root (using async subprocess)
+    project_root = Path(__file__).parent.parent.parent
+
+    # Use asyncio.create_subprocess_exec for non-blocking execution. The runner
+    # wraps the Manim CLI so formulas and text come from the host's shared cache
+    command = ["uv", "run", "python", "-m", "videre.utils.manim_runner"]
+    if profiling:
+        shutil.rmtree(profiling_dir(video_uuid), ignore_errors=True)
+        command += ["--profile", str(profiling_dir(video_uuid))]
+    plan = narration_plan(manim_code) if NARRATION_PRESYNTHESIS else None
+    if plan:
+        write_spec(plan, workspace / NARRATION_SPEC_FILE, media_dir)
+        command += ["--narration", str(workspace / NARRATION_SPEC_FILE)]
+    command += [
+        profile.quality_flag, str(manim_file), scene_class_name,
+        "--media_dir", str(media_dir),
+        "--config_file", str(config_file()),
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *command,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=str(project_root),
+    )
 
     try:
-        # Run Manim using uv from project root (using async subprocess)
-        project_root = Path(__file__).parent.parent.parent
-
-        # Use asyncio.create_subprocess_exec for non-blocking execution
-        process = await asyncio.create_subprocess_exec(
-            "uv", "run", "manim", "-qh", str(manim_file), scene_class_name,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            cwd=str(project_root),
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        # Lease lost or request abandoned: don't leave Manim rendering for nobody
+        process.kill()
+        await process.wait()
+        raise
+    record_stats(stdout.decode())
+    record_narration_stats(stdout.decode())
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(
+            process.returncode,
+            command,
+            stdout.decode(),
+            stderr.decode()
         )
 
-        stdout, stderr = await process.communicate()
+    print("Manim run complete.")
+
+    if event_callback:
+        await event_callback(
+            "video_generation_rendering_complete", {"message": "Video rendering complete!"}
+        )
+    print(stdout.decode())
+    if stderr:
+        print("STDERR:")
+        print(stderr.decode())
+
+    return media_dir / "videos" / SCENE_MODULE_NAME / profile.output_dir / f"{scene_class_name}.mp4"
+
+
+def _record_render(profile: RenderProfile, seconds: float):
+    metrics.incr("render_profile_total", profile=profile.name)
+    metrics.observe("render_seconds", seconds)
+    metrics.observe("render_profile_seconds", seconds, profile=profile.name)
+    metrics.observe("render_normalized_seconds", seconds / profile.cost)
+
+
+async def render_video(
+    manim_code, scene_class_name, video_uuid, event_callback=None, affinity_worker=None,
+    profile: RenderProfile | None = None, profiling: bool = False,
+) -> RenderResult:
+    """Render locally, or hand the job to the render workers when RENDER_MODE=queue.
 
-        if process.returncode != 0:
-            raise subprocess.CalledProcessError(
-                process.returncode,
-                ["uv", "run", "manim", "-qh", str(manim_file), scene_class_name],
-                stdout.decode(),
-                stderr.decode()
+    Without an explicit `profile`, the render policy picks one from the
+    current render load. With `profiling`, the render is profiled (see
+    render_profiling.py) and RenderResult.profiling has the summary.
+    """
+    db = get_database() if RENDER_MODE == "queue" else None
+    load = {}
+    if profile is None:
+        render_load = await render_policy.current_load(db)
+        profile = render_policy.choose(render_load)
+        load = render_load.to_stats()
+        if profile != render_policy.best:
+            print(f"Render load {load}: rendering {video_uuid} at {profile.name}")
+
+    if db is None:
+        render_policy.local_renders[profile.name] += 1
+        started = time.monotonic()
+        try:
+            video_path = await render_manim_code(
+                manim_code, scene_class_name, video_uuid, event_callback, profile, profiling
             )
+        finally:
+            render_policy.local_renders[profile.name] -= 1
+        _record_render(profile, time.monotonic() - started)
+        summary = await collect_profile(profiling_dir(video_uuid), video_uuid) if profiling else {}
+        return RenderResult(video_path=video_path, profile=profile, load=load, profiling=summary)
+
+    job_id = await enqueue_render(
+        db,
+        video_uuid,
+        scene_class_name,
+        manim_code,
+        affinity_worker,
+        profile.name,
+        profiling=profiling,
+    )
+    print(f"Queued render job {job_id} for video {video_uuid}")
+    result = await wait_for_job(db, job_id, event_callback)
+    if result.get("render_seconds") is not None:
+        _record_render(profile, result["render_seconds"])
+    return RenderResult(
+        uploaded=True, worker_id=result.get("worker_id"), published=result.get("published", {}),
+        profile=profile, load=load, profiling=result.get("profiling") or {},
+    )
+
+
+async def prepare_script(topic, hedge: int | None = None) -> GeneratedVideo:
+    """Reuse a stored script for (nearly) the same topic, or generate a new one.
+
+    With `hedge` > 1 (default: HEDGE_CANDIDATES), that many candidates are
+    generated concurrently and the first that passes a dry run is kept.
+    With CODEGEN_FORMAT=scene_graph, new scripts are compiled from a scene graph.
+    Other new scripts are dry-run (and repaired) here; DryRunError if that fails.
+    """
+    hedge = hedge or HEDGE_CANDIDATES
+    # Generate UUID for this video
+    video_uuid = str(uuid.uuid4())
+    scene_class_name = (
+        f"Scene_{video_uuid.replace('-', '_')}"  # Python class names can't have hyphens
+    )
+    render_stats = {}
+    scene_graph = None
+
+    try:
+        match = await find_similar_script(topic)
+    except Exception as e:
+        print(f"Warning: script index lookup failed: {e}")
+        match = None
 
-        print("Manim run complete.")
+    started = time.monotonic()
+    reused_from = None
+    if match is not None and match.topic_score >= SCRIPT_REUSE_THRESHOLD and match.numbers_match:
+        print(
+            f"Reusing script from chat {match.chat_id} "
+            f"({match.topic!r}, score {match.topic_score:.2f})"
+        )
+        manim_code = rename_scene_class(match.manim_code, scene_class_name)
+        render_stats["generation_mode"] = "reused"
+        reused_from = match.chat_id
+    elif hedge > 1:
+        candidate = await generate_hedged(topic, scene_class_name, example=match, k=hedge)
+        manim_code = candidate.manim_code
+        render_stats["generation_mode"] = "hedged"
+        render_stats["hedge"] = {
+            "candidates": hedge,
+            "winner": candidate.index,
+            "strategy": candidate.strategy,
+            "validated": candidate.validation.ok,
+        }
+        render_stats["model"] = candidate.model
+    elif CODEGEN_FORMAT == "scene_graph":
+        manim_code, render_stats["model"], graph = await generate_scene_graph(
+            topic, scene_class_name
+        )
+        render_stats["generation_mode"] = "scene_graph"
+        render_stats["scene_graph_blocks"] = block_hashes(graph)
+        scene_graph = graph.model_dump()
+    else:
+        manim_code, render_stats["model"] = await generate_manim_code(
+            topic, scene_class_name, example=match
+        )
+        render_stats["generation_mode"] = "few_shot" if match is not None else "fresh"
+    render_stats["generation_seconds"] = round(time.monotonic() - started, 2)
+    if "model" in render_stats:
+        render_stats["topic_complexity"] = topic_complexity(topic)
 
-        if event_callback:
-            await event_callback("video_generation_rendering_complete", {"message": "Video rendering complete!"})
-        print(stdout.decode())
-        if stderr:
-            print("STDERR:")
-            print(stderr.decode())
+    # A winning hedged candidate already passed its dry run, and reused scripts rendered
+    # before; a hedged fallback (no candidate passed) is repaired like a fresh script
+    needs_dry_run = render_stats["generation_mode"] in ("few_shot", "fresh", "scene_graph") or (
+        render_stats["generation_mode"] == "hedged" and not render_stats["hedge"]["validated"]
+    )
+    if DRY_RUN_ENABLED and needs_dry_run:
+        manim_code, validation, repairs = await validate_and_repair(
+            manim_code, scene_class_name, topic=topic
+        )
+        render_stats["dry_run"] = {**validation.to_stats(), "repairs": repairs}
+        # The model's own script passed only if it needed no repair
+        model_router.record_outcome(
+            render_stats["model"], "dry_run", validation.ok and repairs == 0
+        )
+        if not validation.ok:
+            raise DryRunError(validation)
+        if repairs:
+            # The repaired script no longer matches the graph
+            scene_graph = None
 
-        # Manim saves the video relative to project_root (where we run it from)
-        # The video will be at: project_root / "media" / "videos" / "generated_scene" / "1080p60" / f"{scene_class_name}.mp4"
-        print(f"Video should be saved as: {scene_class_name}.mp4")
-        print(f"Video UUID: {video_uuid}")
+    print("=" * 60)
+    print("GENERATED MANIM CODE:")
+    print("=" * 60)
+    print(manim_code)
+    print("=" * 60)
 
-        return video_uuid, scene_class_name
+    return GeneratedVideo(
+        video_uuid=video_uuid,
+        scene_class_name=scene_class_name,
+        manim_code=manim_code,
+        narration=extract_narration(manim_code),
+        render_stats=render_stats,
+        reused_from=reused_from,
+        scene_graph=scene_graph,
+    )
+
+
+async def render_script(
+    video: GeneratedVideo, event_callback=None, profiling: bool = False
+) -> GeneratedVideo | None:
+    """Render a prepared script. Returns None if rendering failed.
+
+    With `profiling` (or when sampled, see RENDER_PROFILING_SAMPLE_RATE), the render is profiled.
+    """
+    try:
+        started = time.monotonic()
+        render = await render_video(
+            video.manim_code, video.scene_class_name, video.video_uuid, event_callback,
+            profiling=profiling or profiling_sampled(),
+        )
+        video.render_stats["render_seconds"] = round(time.monotonic() - started, 2)
+        if render.worker_id:
+            video.render_stats["worker_id"] = render.worker_id
+        video.render_stats["render_profile"] = render.profile.name
+        if render.load:
+            video.render_stats["render_load"] = render.load
+        if render.profiling:
+            video.render_stats["profiling"] = chat_summary(render.profiling)
+
+        print(f"Video UUID: {video.video_uuid}")
+        video.render = render
+        model_router.record_outcome(video.render_stats.get("model"), "render", True)
+        return video
 
     except subprocess.CalledProcessError as e:
         print(f"Error running Manim: {e}")
         print(f"STDOUT: {e.stdout}")
         print(f"STDERR: {e.stderr}")
-        return None, None
+        model_router.record_outcome(video.render_stats.get("model"), "render", False)
+        return None
     except Exception as e:
         print(f"Unexpected error: {e}")
         traceback.print_exc()
-        return None, None
+        return None
+
+
+async def generate_video_with_gtts(
+    topic, event_callback=None, hedge=None, profiling: bool = False
+) -> GeneratedVideo | None:
+    video = await prepare_script(topic, hedge)
+
+    if event_callback:
+        await event_callback(
+            "video_generation_manim_generated",
+            {"message": "Manim code generated. Preparing to render video..."},
+        )
+
+    return await render_script(video, event_callback, profiling)
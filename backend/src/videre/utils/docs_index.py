@@ -0,0 +1,235 @@
+"""Local BM25 retrieval index over the Manim / manim-voiceover docs.
+
+Context7 is only used as the ingest source: the docs are fetched, split into
+snippets and indexed on disk. Each generation request then retrieves the top-k
+snippets for its topic instead of pasting the whole dump into the prompt.
+
+The index rebuilds incrementally: snippets are keyed by content hash, so when
+the docs change only new snippets are tokenized and removed ones are dropped.
+
+Environment variables supported:
+- DOCS_INDEX_PATH (default: <backend/src>/.cache/docs_index.json)
+- DOCS_INDEX_TTL_SECONDS (default: 86400) - how often to re-fetch the docs
+- DOCS_INDEX_FETCH_TIMEOUT_SECONDS (default: 30) - the whole Context7 fetch
+- DOCS_INDEX_RETRY_SECONDS (default: 600) - wait after a failed fetch before
+  trying again; requests in between get the last good index
+"""
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+from pathlib import Path
+
+from ..config import settings
+from .fetch_context7_docs import fetch_context7_docs
+from .metrics import metrics
+
+DOCS_INDEX_PATH = settings.docs_index_path
+DOCS_INDEX_TTL_SECONDS = settings.docs_index_ttl_seconds
+DOCS_INDEX_FETCH_TIMEOUT_SECONDS = settings.docs_index_fetch_timeout_seconds
+DOCS_INDEX_RETRY_SECONDS = settings.docs_index_retry_seconds
+
+# (library, topic) pairs pulled from Context7 when (re)building the index
+DOCS_SOURCES = [
+    ("manimcommunity/manim-voiceover", "manim-voiceover"),
+    ("manimcommunity/manim", "mobjects animations"),
+]
+DOCS_SOURCE_TOKENS = 20000
+
+# Topic keywords -> Manim constructs the generated scene will probably need
+CONSTRUCT_HINTS = {
+    ("graph", "network", "node", "edge", "tree", "dijkstra", "bfs", "dfs", "traversal"):
+        ["Graph", "Dot", "Line", "Arrow", "Circle"],
+    ("function", "plot", "curve", "derivative", "integral", "calculus", "axis", "axes"):
+        ["Axes", "plot", "NumberPlane", "MathTex"],
+    ("equation", "formula", "math", "algebra", "proof", "theorem", "matrix", "probability"):
+        ["MathTex", "Tex", "Matrix", "TransformMatchingTex"],
+    ("code", "algorithm", "program", "python", "sort", "search", "recursion", "function"):
+        ["Code", "Rectangle", "SurroundingRectangle"],
+    ("pointer", "linked", "list", "stack", "queue", "array", "flow", "pipeline"):
+        ["Arrow", "Square", "VGroup", "Indicate"],
+}
+# Always retrieved alongside the topic terms: the voiceover API itself
+BASE_QUERY = ["VoiceoverScene", "voiceover", "tracker", "set_speech_service", "GTTSService"]
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_SEPARATOR_RE = re.compile(r"\n-{10,}\n")
+
+
+def tokenize(text: str) -> list[str]:
+    return [t.lower() for t in _TOKEN_RE.findall(text) if len(t) > 1]
+
+
+def split_snippets(docs: str, max_chars: int = 1500) -> list[str]:
+    """Split a Context7 txt dump into snippets.
+
+    Context7 separates snippets with a line of dashes; anything longer than
+    `max_chars` is further split on blank lines.
+    """
+    snippets = []
+    for block in _SEPARATOR_RE.split(docs):
+        block = block.strip()
+        if not block:
+            continue
+        if len(block) <= max_chars:
+            snippets.append(block)
+            continue
+        current = ""
+        for paragraph in block.split("\n\n"):
+            if current and len(current) + len(paragraph) > max_chars:
+                snippets.append(current.strip())
+                current = ""
+            current += paragraph + "\n\n"
+        if current.strip():
+            snippets.append(current.strip())
+    return snippets
+
+
+def construct_terms(topic: str) -> list[str]:
+    """Manim construct names likely needed for a topic."""
+    words = set(tokenize(topic))
+    terms = []
+    for keywords, constructs in CONSTRUCT_HINTS.items():
+        if words.intersection(keywords):
+            terms.extend(constructs)
+    return terms
+
+
+class DocsIndex:
+    """BM25 index over doc snippets, persisted as JSON."""
+
+    def __init__(self, path: Path = DOCS_INDEX_PATH):
+        self.path = path
+        self.built_at = 0.0
+        # snippet hash -> {"text": str, "tf": {term: count}, "len": int}
+        self.snippets: dict[str, dict] = {}
+        self.df: Counter = Counter()
+        self.avgdl = 0.0
+
+    def load(self) -> bool:
+        if not self.path.exists():
+            return False
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return False
+        self.built_at = data.get("built_at", 0.0)
+        self.snippets = data.get("snippets", {})
+        self._recompute_stats()
+        return True
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"built_at": self.built_at, "snippets": self.snippets}))
+        os.replace(tmp_path, self.path)
+
+    def update(self, docs: str) -> int:
+        """Re-index `docs`, reusing every snippet that did not change.
+
+        Returns the number of snippets that had to be tokenized.
+        """
+        snippets = {}
+        added = 0
+        for text in split_snippets(docs):
+            key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            if key in snippets:
+                continue
+            if key in self.snippets:
+                snippets[key] = self.snippets[key]
+                continue
+            tokens = tokenize(text)
+            snippets[key] = {"text": text, "tf": dict(Counter(tokens)), "len": len(tokens)}
+            added += 1
+        self.snippets = snippets
+        self.built_at = time.time()
+        self._recompute_stats()
+        return added
+
+    def _recompute_stats(self):
+        self.df = Counter()
+        total_len = 0
+        for snippet in self.snippets.values():
+            self.df.update(snippet["tf"].keys())
+            total_len += snippet["len"]
+        self.avgdl = total_len / len(self.snippets) if self.snippets else 0.0
+
+    def search(self, query_terms: list[str], k: int = 6) -> list[str]:
+        if not self.snippets:
+            return []
+        n = len(self.snippets)
+        query = Counter(t.lower() for t in query_terms)
+        scored = []
+        for snippet in self.snippets.values():
+            tf = snippet["tf"]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * snippet["len"] / (self.avgdl or 1))
+            score = 0.0
+            for term, weight in query.items():
+                freq = tf.get(term)
+                if not freq:
+                    continue
+                idf = math.log(1 + (n - self.df[term] + 0.5) / (self.df[term] + 0.5))
+                score += weight * idf * freq * (BM25_K1 + 1) / (freq + norm)
+            if score > 0:
+                scored.append((score, snippet["text"]))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [text for _, text in scored[:k]]
+
+
+_index: DocsIndex | None = None
+_refresh_lock = asyncio.Lock()
+_retry_at = 0.0  # no refetch before this time after a failed one
+
+
+async def get_docs_index() -> DocsIndex:
+    """Return the shared index, re-fetching the docs when it is stale."""
+    global _index, _retry_at
+    async with _refresh_lock:
+        if _index is None:
+            _index = DocsIndex()
+            _index.load()
+
+        if time.time() - _index.built_at < DOCS_INDEX_TTL_SECONDS and _index.snippets:
+            return _index
+        if time.time() < _retry_at:
+            return _index
+
+        try:
+            # Bounded: every request waiting on the lock waits on this fetch
+            docs = await asyncio.wait_for(
+                asyncio.gather(*[
+                    fetch_context7_docs(topic=topic, library=library, tokens=DOCS_SOURCE_TOKENS)
+                    for library, topic in DOCS_SOURCES
+                ]),
+                DOCS_INDEX_FETCH_TIMEOUT_SECONDS,
+            )
+        except Exception as e:
+            # Keep serving the last good index if Context7 is unreachable, and
+            # back off instead of re-fetching on every request
+            _retry_at = time.time() + DOCS_INDEX_RETRY_SECONDS
+            print(
+                f"Warning: could not refresh docs index ({e!r}), "
+                f"retrying in {DOCS_INDEX_RETRY_SECONDS}s"
+            )
+            metrics.incr("docs_index_refresh_failures_total")
+            return _index
+
+        added = _index.update("\n----------------------------------------\n".join(docs))
+        _index.save()
+        print(f"Docs index rebuilt: {len(_index.snippets)} snippets ({added} new)")
+        return _index
+
+
+async def retrieve_docs(topic: str, k: int = 6) -> str:
+    """Top-k doc snippets relevant to `topic` and the constructs it likely needs."""
+    index = await get_docs_index()
+    query = tokenize(topic) + construct_terms(topic) + BASE_QUERY
+    snippets = index.search(query, k=k)
+    return "\n\n---\n\n".join(snippets)
@@ -0,0 +1,204 @@
+"""Quick validation of generated scripts before the full render.
+
+A generated scene that only crashes halfway through a 1080p60 render wastes
+minutes of render time and the TTS calls made up to that point. `dry_run`
+executes construct() in a subprocess (dry_run_runner.py) with animations
+skipped and a silent speech service. Runtime errors show up within seconds,
+and the result names the voiceover block that failed. `validate_and_repair`
+can then ask Claude to fix that block and try again.
+
+Environment variables supported:
+- DRY_RUN_ENABLED (default: 1) - dry-run generated scripts before rendering
+- DRY_RUN_REPAIR_ATTEMPTS (default: 1) - Claude repair rounds after a failed dry run
+- DRY_RUN_TIMEOUT_SECONDS (default: 120)
+- DRY_RUN_WORDS_PER_MINUTE (default: 150) - pace used for the silent narration
+"""
+import ast
+import asyncio
+import json
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from ..config import settings
+from .dry_run_runner import RESULT_MARKER
+from .manim_script import (
+    clean_code,
+    find_scene_class,
+    voiceover_block_at,
+    voiceover_calls,
+    voiceover_text,
+)
+from .metrics import metrics
+from .model_router import model_router
+from .render_cache import record_stats
+
+DRY_RUN_ENABLED = settings.dry_run_enabled
+DRY_RUN_REPAIR_ATTEMPTS = settings.dry_run_repair_attempts
+DRY_RUN_TIMEOUT_SECONDS = settings.dry_run_timeout_seconds
+
+
+@dataclass
+class ValidationResult:
+    ok: bool
+    error: str | None = None
+    lineno: int | None = None
+    # The voiceover block the error happened in (index into voiceover_calls)
+    voiceover_index: int | None = None
+    voiceover_text: str | None = None
+    seconds: float = 0.0
+
+    def describe(self) -> str:
+        if self.ok:
+            return "ok"
+        where = f" (line {self.lineno})" if self.lineno else ""
+        if self.voiceover_index is not None:
+            where += f" in voiceover block {self.voiceover_index + 1}: {self.voiceover_text!r}"
+        return f"{self.error}{where}"
+
+    def to_stats(self) -> dict:
+        return {
+            "ok": self.ok,
+            "error": self.error,
+            "lineno": self.lineno,
+            "voiceover_index": self.voiceover_index,
+            "seconds": round(self.seconds, 2),
+        }
+
+
+class DryRunError(RuntimeError):
+    def __init__(self, result: ValidationResult):
+        super().__init__(f"Generated script failed its dry run: {result.describe()}")
+        self.result = result
+
+
+def check_static(manim_code: str, scene_class_name: str) -> ValidationResult:
+    """Syntax and structure checks that need no Manim install."""
+    try:
+        ast.parse(manim_code)
+    except SyntaxError as e:
+        return ValidationResult(False, f"SyntaxError: {e.msg}", lineno=e.lineno)
+    if find_scene_class(manim_code) != scene_class_name:
+        return ValidationResult(
+            False, f"Script must define class {scene_class_name}(VoiceoverScene)"
+        )
+    if not voiceover_calls(manim_code):
+        return ValidationResult(False, "Script has no voiceover blocks")
+    return ValidationResult(True)
+
+
+def _locate(result: ValidationResult, manim_code: str) -> ValidationResult:
+    if result.lineno is None:
+        return result
+    index = voiceover_block_at(manim_code, result.lineno)
+    if index is not None:
+        result.voiceover_index = index
+        result.voiceover_text = voiceover_text(voiceover_calls(manim_code)[index])
+    return result
+
+
+async def dry_run(
+    manim_code: str, scene_class_name: str, timeout: float = DRY_RUN_TIMEOUT_SECONDS
+) -> ValidationResult:
+    """Run construct() with animations skipped and silent narration."""
+    started = time.monotonic()
+    static = check_static(manim_code, scene_class_name)
+    if not static.ok:
+        metrics.incr("dry_run_total", outcome="static_error")
+        return _locate(static, manim_code)
+
+    project_root = Path(__file__).parent.parent.parent
+    with tempfile.TemporaryDirectory() as temp_dir:
+        manim_file = Path(temp_dir) / "generated_scene.py"
+        manim_file.write_text(manim_code)
+
+        process = await asyncio.create_subprocess_exec(
+            "uv", "run", "python", "-m", "videre.utils.dry_run_runner",
+            str(manim_file), scene_class_name, str(Path(temp_dir) / "media"),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=str(project_root),
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except TimeoutError:
+            process.kill()
+            await process.wait()
+            metrics.incr("dry_run_total", outcome="timeout")
+            return ValidationResult(False, f"Dry run timed out after {timeout}s", seconds=timeout)
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+
+    report = None
+    record_stats(stdout.decode(errors="replace"))
+    for line in stdout.decode(errors="replace").splitlines():
+        if line.startswith(RESULT_MARKER):
+            report = json.loads(line[len(RESULT_MARKER):])
+    if report is None:
+        # The runner itself crashed (e.g. Manim not importable)
+        result = ValidationResult(
+            False, stderr.decode(errors="replace")[-2000:] or "Dry run produced no result"
+        )
+    else:
+        result = ValidationResult(report["ok"], report["error"], lineno=report["lineno"])
+
+    result.seconds = time.monotonic() - started
+    metrics.incr("dry_run_total", outcome="ok" if result.ok else "runtime_error")
+    metrics.observe("dry_run_seconds", result.seconds)
+    return _locate(result, manim_code)
+
+
+def _repair_prompt(manim_code: str, result: ValidationResult) -> str:
+    block = ""
+    if result.voiceover_text:
+        block = (
+            f'\nThe error happened inside the voiceover block with text "{result.voiceover_text}".'
+        )
+    return f"""
+    The following Manim + manim-voiceover script fails when construct() runs.
+
+    Error{f" at line {result.lineno}" if result.lineno else ""}:
+    {result.error}
+    {block}
+
+    Fix the error with the smallest possible change. Keep the narration, the
+    class name, the imports and the speech service exactly as they are.
+
+    Return **only the full corrected Python code**, no explanations, no markdown.
+
+    {manim_code}
+    """
+
+
+async def validate_and_repair(
+    manim_code: str,
+    scene_class_name: str,
+    attempts: int = DRY_RUN_REPAIR_ATTEMPTS,
+    topic: str = "",
+) -> tuple[str, ValidationResult, int]:
+    """Dry-run the script, asking Claude to fix it up to `attempts` times.
+
+    Repairs go through the model router, routed on `topic` like the generation.
+
+    Returns (final code, its validation result, number of repairs made).
+    """
+    result = await dry_run(manim_code, scene_class_name)
+    repairs = 0
+    while not result.ok and repairs < attempts:
+        print(f"Dry run failed: {result.describe()}. Requesting repair...")
+        repairs += 1
+        metrics.incr("dry_run_repairs_total")
+        text, _ = await model_router.complete(
+            _repair_prompt(manim_code, result), topic, max_tokens=4096, temperature=0.2
+        )
+        repaired = clean_code(text)
+        repaired_result = await dry_run(repaired, scene_class_name)
+        # Keep the repair unless it broke the script's structure
+        if repaired_result.ok or check_static(repaired, scene_class_name).ok:
+            manim_code, result = repaired, repaired_result
+    if result.ok and repairs:
+        metrics.incr("dry_run_repaired_total")
+    return manim_code, result, repairs
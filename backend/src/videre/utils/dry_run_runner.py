@@ -0,0 +1,125 @@
+"""Subprocess entry point for dry runs (see dry_run.py).
+
+    python -m videre.utils.dry_run_runner <script.py> <SceneClass> <media_dir>
+
+Runs the scene's construct() with animations skipped and nothing written,
+using a speech service that returns silent audio of the estimated narration
+length instead of calling a TTS provider. Prints one JSON line prefixed with
+RESULT_MARKER: {"ok", "error", "lineno", "voiceovers"}.
+"""
+import importlib.util
+import json
+import os
+import re
+import sys
+import traceback
+import wave
+from pathlib import Path
+
+from ..config import settings
+from . import manim_runner
+from .render_cache import RENDER_CACHE_DIR
+
+RESULT_MARKER = "DRY_RUN_RESULT "
+WORDS_PER_MINUTE = settings.dry_run_words_per_minute
+SAMPLE_RATE = 8000
+
+# Services the generated scripts may import; all are replaced by the silent one
+SPEECH_SERVICES = [
+    ("manim_voiceover.services.gtts", "GTTSService"),
+    ("manim_voiceover.services.elevenlabs", "ElevenLabsService"),
+    ("manim_voiceover.services.azure", "AzureService"),
+    ("manim_voiceover.services.openai", "OpenAIService"),
+    ("manim_voiceover.services.coqui", "CoquiService"),
+    ("manim_voiceover.services.pyttsx3", "PyTTSX3Service"),
+    ("manim_voiceover.services.recorder", "RecorderService"),
+]
+
+
+def estimate_seconds(text: str) -> float:
+    words = len(re.sub(r"<[^>]+>", " ", text).split())
+    return max(0.5, words * 60.0 / WORDS_PER_MINUTE)
+
+
+def write_silence(path: Path, seconds: float):
+    with wave.open(str(path), "wb") as audio:
+        audio.setnchannels(1)
+        audio.setsampwidth(2)
+        audio.setframerate(SAMPLE_RATE)
+        audio.writeframes(b"\0\0" * int(seconds * SAMPLE_RATE))
+
+
+def _install_silent_service(voiceovers: list):
+    from manim_voiceover.services.base import SpeechService
+
+    class SilentSpeechService(SpeechService):
+        def __init__(self, *args, **kwargs):
+            super().__init__(transcription_model=None)
+
+        def generate_from_text(
+            self, text: str, cache_dir: str = None, path: str = None, **kwargs
+        ) -> dict:
+            voiceovers.append(text)
+            cache_dir = cache_dir or self.cache_dir
+            audio_path = path or f"silent_{len(voiceovers)}.wav"
+            write_silence(Path(cache_dir) / audio_path, estimate_seconds(text))
+            return {
+                "input_text": text,
+                "input_data": {"input_text": text, "service": "silent"},
+                "original_audio": audio_path,
+            }
+
+    for module_name, class_name in SPEECH_SERVICES:
+        try:
+            module = importlib.import_module(module_name)
+        except Exception:
+            continue
+        setattr(module, class_name, SilentSpeechService)
+
+
+def _failing_line(tb, script_path: str):
+    """Innermost traceback line that belongs to the generated script."""
+    lineno = None
+    for frame in traceback.extract_tb(tb):
+        if os.path.abspath(frame.filename) == script_path:
+            lineno = frame.lineno
+    return lineno
+
+
+def run(script_path: str, scene_class_name: str, media_dir: str) -> dict:
+    from manim import config
+    from manim.renderer.cairo_renderer import CairoRenderer
+
+    config.media_dir = media_dir
+    config.quality = "low_quality"
+    config.disable_caching = True
+    config.dry_run = True
+    # Formulas compiled here are reused by the full render, and vice versa
+    manim_runner.configure(RENDER_CACHE_DIR)
+    manim_runner.install(RENDER_CACHE_DIR)
+
+    voiceovers: list = []
+    _install_silent_service(voiceovers)
+
+    script_path = os.path.abspath(script_path)
+    try:
+        spec = importlib.util.spec_from_file_location("generated_scene", script_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        scene_class = getattr(module, scene_class_name)
+        scene = scene_class(renderer=CairoRenderer(skip_animations=True))
+        scene.render()
+    except Exception as e:
+        return {
+            "ok": False,
+            "error": "".join(traceback.format_exception_only(type(e), e)).strip(),
+            "lineno": _failing_line(e.__traceback__, script_path),
+            "voiceovers": len(voiceovers),
+        }
+    return {"ok": True, "error": None, "lineno": None, "voiceovers": len(voiceovers)}
+
+
+if __name__ == "__main__":
+    result = run(*sys.argv[1:4])
+    print(RESULT_MARKER + json.dumps(result), flush=True)
+    manim_runner.flush_stats(RENDER_CACHE_DIR)
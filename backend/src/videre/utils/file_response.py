@@ -0,0 +1,116 @@
+"""File response with HTTP Range support and zero-copy sends.
+
+Used to serve videos from local storage. Seeking in a `<video>` element issues
+`Range: bytes=N-` requests, so single ranges are answered with 206 Partial
+Content. The body is sent with the ASGI `http.response.zerocopysend`
+extension (os.sendfile under the hood) when the server offers it, falls back
+to `http.response.pathsend` for whole files, and otherwise streams chunks.
+"""
+import os
+import re
+from email.utils import formatdate
+from pathlib import Path
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 256 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Parse a single-range `Range` header into [start, end). None means whole file.
+
+    Raises ValueError for unsatisfiable ranges. Multi-range requests are
+    answered with the whole file, which RFC 9110 allows.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start:
+        # Suffix range: the last N bytes
+        if not end:
+            return None
+        length = min(int(end), size)
+        if length == 0:
+            raise ValueError("Range not satisfiable")
+        return size - length, size
+    start = int(start)
+    end = min(int(end) + 1, size) if end else size
+    if start >= size or start >= end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+class RangeFileResponse(Response):
+    def __init__(self, path: Path, media_type: str, range_header: str | None = None):
+        super().__init__(media_type=media_type)
+        self.path = Path(path)
+        self.media_type = media_type
+        self.range_header = range_header
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        stat = os.stat(self.path)
+        size = stat.st_size
+        headers = [
+            (b"content-type", self.media_type.encode()),
+            (b"accept-ranges", b"bytes"),
+            (b"last-modified", formatdate(stat.st_mtime, usegmt=True).encode()),
+            (b"etag", f'"{int(stat.st_mtime)}-{size}"'.encode()),
+        ]
+
+        try:
+            byte_range = parse_range(self.range_header, size)
+        except ValueError:
+            await send({
+                "type": "http.response.start",
+                "status": 416,
+                "headers": headers + [(b"content-range", f"bytes */{size}".encode())],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        start, end = byte_range or (0, size)
+        status = 206 if byte_range else 200
+        headers.append((b"content-length", str(end - start).encode()))
+        if byte_range:
+            headers.append((b"content-range", f"bytes {start}-{end - 1}/{size}".encode()))
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        extensions = scope.get("extensions") or {}
+        if "http.response.zerocopysend" in extensions:
+            with open(self.path, "rb") as f:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": f.fileno(),
+                    "offset": start,
+                    "count": end - start,
+                    "more_body": False,
+                })
+            return
+        if "http.response.pathsend" in extensions and not byte_range:
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            return
+
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": remaining > 0}
+                )
+            if remaining > 0 or start == end:
+                await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,140 @@
+"""Hedged code generation: race K candidate scripts, keep the first that validates.
+
+A single Claude response either renders or fails, and a failure means starting
+over. In hedged mode K candidates are requested concurrently, each with a
+strategy:
+- `direct`: the usual one-shot prompt,
+- `staged`: refine -> transcript -> code (see integration.py),
+- `scene_graph`: a JSON scene graph compiled locally (see scene_graph.py).
+
+Each candidate is validated as soon as it arrives (static checks, then a dry
+run). The first one that passes wins and the others are cancelled, so both
+tail latency and the failure rate drop at the cost of extra tokens.
+
+Environment variables supported:
+- HEDGE_CANDIDATES (default: 1, i.e. off) - K
+- HEDGE_STRATEGIES (default: direct,staged) - assigned to candidates round-robin;
+  scene_graph is also available
+- HEDGE_VALIDATE_TIMEOUT_SECONDS (default: 120) - dry run timeout per candidate
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+
+from ..config import settings
+from ..integration import create_transcript, refine_query
+from .dry_run import ValidationResult, check_static, dry_run
+from .metrics import metrics
+from .model_router import model_router
+from .script_index import ScriptMatch
+
+HEDGE_CANDIDATES = settings.hedge_candidates
+HEDGE_STRATEGIES = settings.hedge_strategies.split(",")
+HEDGE_VALIDATE_TIMEOUT_SECONDS = settings.hedge_validate_timeout_seconds
+
+# Spread direct candidates a little so they are not near-duplicates
+DIRECT_TEMPERATURES = [1.0, 0.7, 0.9, 0.5]
+
+
+class HedgeError(RuntimeError):
+    pass
+
+
+@dataclass
+class Candidate:
+    index: int
+    strategy: str
+    manim_code: str = ""
+    model: str | None = None
+    validation: ValidationResult | None = None
+    seconds: float = 0.0
+
+
+async def _generate(
+    candidate: Candidate, topic, scene_class_name, example: ScriptMatch | None
+) -> tuple[str, str]:
+    # Imported here: create_video imports this module
+    from .create_video import generate_manim_code, generate_scene_graph
+
+    temperature = DIRECT_TEMPERATURES[candidate.index % len(DIRECT_TEMPERATURES)]
+    if candidate.strategy == "scene_graph":
+        manim_code, model, _ = await generate_scene_graph(
+            topic, scene_class_name, temperature=temperature
+        )
+        return manim_code, model
+    if candidate.strategy == "staged":
+        transcript = await create_transcript(await refine_query(topic))
+        if transcript.startswith("Unable to create transcript"):
+            raise HedgeError("Staged strategy could not produce a transcript")
+        return await generate_manim_code(
+            topic, scene_class_name, example=example, transcript=transcript
+        )
+    return await generate_manim_code(
+        topic, scene_class_name, example=example, temperature=temperature
+    )
+
+
+async def _run_candidate(candidate: Candidate, topic, scene_class_name, example) -> Candidate:
+    started = time.monotonic()
+    metrics.incr("hedge_candidates_started_total", strategy=candidate.strategy)
+    candidate.manim_code, candidate.model = await _generate(
+        candidate, topic, scene_class_name, example
+    )
+    candidate.validation = await dry_run(
+        candidate.manim_code, scene_class_name, HEDGE_VALIDATE_TIMEOUT_SECONDS
+    )
+    model_router.record_outcome(candidate.model, "dry_run", candidate.validation.ok)
+    candidate.seconds = time.monotonic() - started
+    outcome = "valid" if candidate.validation.ok else "invalid"
+    metrics.incr(f"hedge_candidates_{outcome}_total", strategy=candidate.strategy)
+    return candidate
+
+
+async def generate_hedged(
+    topic,
+    scene_class_name,
+    example: ScriptMatch | None = None,
+    k: int = HEDGE_CANDIDATES,
+    strategies: list[str] = HEDGE_STRATEGIES,
+) -> Candidate:
+    """Race `k` candidates and return the first that validates.
+
+    If none validates, the first syntactically usable candidate is returned
+    (with its failed `validation`) so the caller can repair it before any
+    render; HedgeError if there is none at all.
+    """
+    started = time.monotonic()
+    candidates = [Candidate(i, strategies[i % len(strategies)]) for i in range(k)]
+    tasks = [
+        asyncio.create_task(_run_candidate(c, topic, scene_class_name, example))
+        for c in candidates
+    ]
+    fallback: Candidate | None = None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                candidate = await next_done
+            except Exception as e:
+                print(f"Hedged candidate failed: {e}")
+                continue
+            if candidate.validation.ok:
+                print(f"Hedged candidate {candidate.index} ({candidate.strategy}) won "
+                      f"after {candidate.seconds:.1f}s")
+                metrics.incr("hedge_winner_total", strategy=candidate.strategy)
+                metrics.observe("hedge_time_to_valid_seconds", time.monotonic() - started)
+                return candidate
+            print(f"Hedged candidate {candidate.index} ({candidate.strategy}) "
+                  f"failed validation: {candidate.validation.error[:300]}")
+            if fallback is None and check_static(candidate.manim_code, scene_class_name).ok:
+                fallback = candidate
+    finally:
+        cancelled = sum(1 for task in tasks if not task.done())
+        for task in tasks:
+            task.cancel()
+        if cancelled:
+            metrics.incr("hedge_candidates_cancelled_total", cancelled)
+
+    metrics.incr("hedge_no_valid_candidate_total")
+    if fallback is None:
+        raise HedgeError(f"None of {k} hedged candidates produced a usable script")
+    return fallback
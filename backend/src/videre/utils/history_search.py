@@ -0,0 +1,187 @@
+"""Server-side search over chat histories, backed by Mongo indexes.
+
+Two query modes:
+- `text`: relevance-ranked full-text search over topics (weighted) and chat
+  message content, through a Mongo text index.
+- `prefix`: typeahead over topic words. Every chat history stores its
+  lower-cased topic words in `search_terms` (multikey index); complete words
+  must all match, and the last, partial word matches as an anchored prefix,
+  which Mongo turns into an index range scan.
+
+Both modes (and a plain listing without a query) take the same filters
+(created_at range, has video) and use keyset pagination: the opaque cursor
+encodes the sort key of the last hit. In prefix mode and plain listings the
+cursor is an index seek, so deep pages cost the same as the first one instead
+of growing with `skip`. In text mode Mongo has to score every matching chat
+before the cursor can skip past the earlier pages, so each page costs
+O(matches); the top-k sort keeps memory at one page, and narrower queries or
+filters keep it cheap.
+"""
+import asyncio
+import base64
+import json
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, UpdateOne
+
+from .docs_index import tokenize
+
+SEARCH_MODES = ("text", "prefix")
+# Projection for result lists: the large fields are fetched per chat instead
+LIST_PROJECTION = {
+    "chat_messages": 0,
+    "manim_code": 0,
+    "narration": 0,
+    "scene_graph": 0,
+    "search_terms": 0,
+}
+BACKFILL_BATCH_SIZE = 1000
+
+
+class SearchError(ValueError):
+    pass
+
+
+def search_terms(topic: str) -> list[str]:
+    """Distinct lower-cased topic words, stored on each chat for prefix search."""
+    return sorted(set(tokenize(topic or "")))
+
+
+async def ensure_search_indexes(db):
+    await db.chat_histories.create_index(
+        [("topic", TEXT), ("chat_messages.content", TEXT)],
+        weights={"topic": 10, "chat_messages.content": 1},
+        name="chat_text",
+    )
+    await db.chat_histories.create_index(
+        [("search_terms", ASCENDING), ("created_at", DESCENDING)], name="chat_search_terms"
+    )
+    await db.chat_histories.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
+    await db.chat_histories.create_index("video_id")
+
+
+async def backfill_search_terms(db) -> int:
+    """Add `search_terms` to chat histories written before it existed."""
+    updated = 0
+    batch = []
+    cursor = db.chat_histories.find({"search_terms": {"$exists": False}}, {"topic": 1})
+    async for doc in cursor:
+        batch.append(
+            UpdateOne(
+                {"_id": doc["_id"]}, {"$set": {"search_terms": search_terms(doc.get("topic"))}}
+            )
+        )
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            await db.chat_histories.bulk_write(batch, ordered=False)
+            updated += len(batch)
+            batch = []
+            await asyncio.sleep(0)
+    if batch:
+        await db.chat_histories.bulk_write(batch, ordered=False)
+        updated += len(batch)
+    return updated
+
+
+def encode_cursor(doc: dict[str, Any]) -> str:
+    key = {"id": str(doc["_id"]), "t": doc["created_at"].isoformat()}
+    if "score" in doc:
+        key["s"] = doc["score"]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict[str, Any]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        key["id"] = ObjectId(key["id"])
+        key["t"] = datetime.fromisoformat(key["t"])
+        return key
+    except Exception:
+        raise SearchError("Invalid cursor")
+
+
+def after_cursor(key: dict[str, Any]) -> dict[str, Any]:
+    """Filter for entries after `key` in (created_at, _id) descending order."""
+    return {"$or": [
+        {"created_at": {"$lt": key["t"]}},
+        {"created_at": key["t"], "_id": {"$lt": key["id"]}},
+    ]}
+
+
+@dataclass
+class SearchQuery:
+    q: str = ""
+    mode: str = "text"
+    has_video: bool | None = None
+    created_after: datetime | None = None
+    created_before: datetime | None = None
+    limit: int = 20
+    cursor: str | None = None
+
+    def filters(self) -> dict[str, Any]:
+        query: dict[str, Any] = {}
+        if self.has_video is True:
+            query["video_id"] = {"$ne": None}
+        elif self.has_video is False:
+            query["video_id"] = None
+        created = {}
+        if self.created_after:
+            created["$gte"] = self.created_after
+        if self.created_before:
+            created["$lt"] = self.created_before
+        if created:
+            query["created_at"] = created
+        return query
+
+    def prefix_filter(self) -> dict[str, Any]:
+        words = self.q.lower().split()
+        partial = None if self.q.endswith(" ") else words.pop()
+        complete = [t for word in words for t in tokenize(word)]
+        clauses = []
+        if complete:
+            clauses.append({"search_terms": {"$all": complete}})
+        if partial:
+            # Anchored and escaped: an index range scan on search_terms
+            clauses.append({"search_terms": {"$regex": "^" + re.escape(partial)}})
+        return {"$and": clauses} if clauses else {}
+
+
+async def search_chat_histories(db, query: SearchQuery) -> dict[str, Any]:
+    """Returns {"chats": [docs...], "next_cursor": str | None}."""
+    if query.mode not in SEARCH_MODES:
+        raise SearchError(f"Unknown search mode: {query.mode}")
+    key = decode_cursor(query.cursor) if query.cursor else None
+    match = query.filters()
+
+    if query.q.strip() and query.mode == "text":
+        match["$text"] = {"$search": query.q}
+        pipeline: list[dict[str, Any]] = [
+            {"$match": match},
+            {"$project": LIST_PROJECTION},
+            {"$addFields": {"score": {"$meta": "textScore"}}},
+        ]
+        if key is not None:
+            # $meta can't appear in a find filter, so page on it after scoring
+            pipeline.append({"$match": {"$or": [
+                {"score": {"$lt": key.get("s", 0)}},
+                {"score": key.get("s", 0), "_id": {"$lt": key["id"]}},
+            ]}})
+        pipeline += [{"$sort": {"score": -1, "_id": -1}}, {"$limit": query.limit + 1}]
+        docs = await db.chat_histories.aggregate(pipeline).to_list(query.limit + 1)
+    else:
+        if query.q.strip():
+            match.update(query.prefix_filter())
+        if key is not None:
+            match = {"$and": [match, after_cursor(key)]}
+        cursor = (
+            db.chat_histories.find(match, LIST_PROJECTION)
+            .sort([("created_at", DESCENDING), ("_id", DESCENDING)])
+            .limit(query.limit + 1)
+        )
+        docs = await cursor.to_list(query.limit + 1)
+
+    next_cursor = encode_cursor(docs[query.limit - 1]) if len(docs) > query.limit else None
+    return {"chats": docs[:query.limit], "next_cursor": next_cursor}
@@ -0,0 +1,322 @@
+"""Subprocess entry point that runs Manim against the shared Tex/Text cache.
+
+    python -m videre.utils.manim_runner [--profile <dir>] [--narration <spec.json>] \\
+        <manim CLI args...>
+    python -m videre.utils.manim_runner --warm <spec.json>
+
+Manim caches compiled formulas (latex + dvisvgm) and Pango text as SVGs keyed
+by a hash of their input, in `tex_dir` and `text_dir`. Pointing every render
+at the same directories (see render_cache.py) lets new videos reuse them, but
+Manim assumes it owns those directories. So this runner:
+- serializes the compilation of each key across processes with an flock
+  (striped), so a render never reads an SVG another one is still writing,
+- relies on `no_latex_cleanup` in the shared config, because Manim's cleanup
+  deletes every non-SVG file in tex_dir, including another render's
+  in-flight .tex/.dvi,
+- counts hits and misses, printed as one line prefixed with STATS_MARKER and
+  added to the cache's cumulative stats file.
+
+`--warm` instantiates the MathTex/Tex/Text calls listed in a spec file (see
+render_cache.warm) to precompile them.
+
+`--profile <dir>` runs the render under cProfile and times its phases (TTS,
+tex and text compilation, frame rendering, encoding; each exclusive of the
+phases nested in it). It writes PSTATS_FILE and a SUMMARY_FILE with the phase
+timings and top hotspots to `dir` (see render_profiling.py).
+
+`--narration <spec.json>` synthesizes the script's voiceover clips
+concurrently before Manim starts, so the render finds them in its voiceover
+cache (see narration.py). With TTS_SERVICE=fake, every speech service is
+replaced by the local fake first.
+"""
+import ast
+import cProfile
+import fcntl
+import functools
+import hashlib
+import importlib
+import json
+import pstats
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+
+STATS_MARKER = "RENDER_CACHE_STATS "
+STATS_FILE = "stats.json"
+LOCK_STRIPES = 64
+
+PSTATS_FILE = "render.pstats"
+SUMMARY_FILE = "summary.json"
+PROFILE_HOTSPOTS = 20
+# phase: (module, attribute) of the functions whose time counts towards it
+PHASES = {
+    "tts": [("manim_voiceover.services.base", "SpeechService._wrap_generate_from_text")],
+    "tex": [
+        ("manim.utils.tex_file_writing", "tex_to_svg_file"),
+        ("manim.mobject.text.tex_mobject", "tex_to_svg_file"),
+    ],
+    "text": [
+        ("manim.mobject.text.text_mobject", "Text._text2svg"),
+        ("manim.mobject.text.text_mobject", "MarkupText._text2svg"),
+    ],
+    "frames": [("manim.renderer.cairo_renderer", "CairoRenderer.update_frame")],
+    "encode": [
+        ("manim.scene.scene_file_writer", f"SceneFileWriter.{name}")
+        for name in (
+            "write_frame",
+            "open_partial_movie_stream",
+            "close_partial_movie_stream",
+            "combine_to_movie",
+            "combine_files",
+        )
+    ],
+}
+
+_stats: dict[str, dict[str, float]] = {}
+_phase_seconds: dict[str, float] = {}
+_phase_stack: list[list] = []  # [phase, seconds spent in nested phases]
+
+
+@contextmanager
+def _flock(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _key_lock(cache_dir: Path, key) -> Path:
+    digest = hashlib.sha256(repr(key).encode()).digest()
+    return cache_dir / "locks" / f"{int.from_bytes(digest[:4], 'big') % LOCK_STRIPES}.lock"
+
+
+def _record(kind: str, svg_file, started: float):
+    """A hit if the SVG predates this call (Manim found it and skipped compiling)."""
+    stats = _stats.setdefault(kind, {"hits": 0, "misses": 0, "miss_seconds": 0.0})
+    try:
+        hit = Path(svg_file).stat().st_mtime < started
+    except OSError:
+        hit = False
+    if hit:
+        stats["hits"] += 1
+    else:
+        stats["misses"] += 1
+        stats["miss_seconds"] += time.time() - started
+
+
+def install(cache_dir: Path):
+    """Wrap Manim's Tex and Text SVG generation with per-key locks and hit counting."""
+    import manim.mobject.text.tex_mobject as tex_mobject
+    import manim.utils.tex_file_writing as tex_file_writing
+    from manim.mobject.text.text_mobject import MarkupText, Text
+
+    original_tex = tex_file_writing.tex_to_svg_file
+
+    def tex_to_svg_file(expression, environment=None, tex_template=None):
+        key = ("tex", expression, environment, getattr(tex_template, "body", None))
+        with _flock(_key_lock(cache_dir, key)):
+            started = time.time()
+            svg_file = original_tex(expression, environment, tex_template)
+            _record("tex", svg_file, started)
+        return svg_file
+
+    tex_file_writing.tex_to_svg_file = tex_to_svg_file
+    # tex_mobject imports the function by name
+    if hasattr(tex_mobject, "tex_to_svg_file"):
+        tex_mobject.tex_to_svg_file = tex_to_svg_file
+
+    for cls in (Text, MarkupText):
+        original_text = cls._text2svg
+
+        def _text2svg(self, *args, _original=original_text, **kwargs):
+            try:
+                key = ("text", self._text2hash(*args, **kwargs))
+            except Exception:
+                key = ("text", getattr(self, "text", None))
+            with _flock(_key_lock(cache_dir, key)):
+                started = time.time()
+                svg_file = _original(self, *args, **kwargs)
+                _record("text", svg_file, started)
+            return svg_file
+
+        cls._text2svg = _text2svg
+
+
+def configure(cache_dir: Path):
+    """Point an in-process Manim config at the shared cache (for runners that skip the CLI)."""
+    from manim import config
+
+    config.tex_dir = str(cache_dir / "Tex")
+    config.text_dir = str(cache_dir / "texts")
+    config.no_latex_cleanup = True
+
+
+def flush_stats(cache_dir: Path):
+    """Print this run's counts and add them to the cache's cumulative stats."""
+    print(STATS_MARKER + json.dumps(_stats), flush=True)
+    if not _stats:
+        return
+    path = cache_dir / STATS_FILE
+    with _flock(cache_dir / "locks" / "stats.lock"):
+        try:
+            totals = json.loads(path.read_text())
+        except (OSError, ValueError):
+            totals = {}
+        for kind, stats in _stats.items():
+            total = totals.setdefault(kind, {"hits": 0, "misses": 0, "miss_seconds": 0.0})
+            for field, value in stats.items():
+                total[field] = total.get(field, 0) + value
+        path.write_text(json.dumps(totals))
+
+
+def _timed(func, phase: str):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if threading.current_thread() is not threading.main_thread():
+            return func(*args, **kwargs)  # e.g. narration pre-synthesis; timed as a whole
+        _phase_stack.append([phase, 0.0])
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            _, nested = _phase_stack.pop()
+            _phase_seconds[phase] = _phase_seconds.get(phase, 0.0) + elapsed - nested
+            if _phase_stack:
+                _phase_stack[-1][1] += elapsed
+
+    return wrapper
+
+
+def install_phase_timers():
+    """Wrap the functions in PHASES (after `install`, so lock waits count too)."""
+    for phase, targets in PHASES.items():
+        for module_name, attribute in targets:
+            try:
+                owner = importlib.import_module(module_name)
+                *path, name = attribute.split(".")
+                for part in path:
+                    owner = getattr(owner, part)
+                func = getattr(owner, name)
+            except (ImportError, AttributeError):
+                continue  # not in this Manim version
+            if isinstance(owner, type):
+                # Only the class that defines it, so subclasses are not counted twice
+                if name not in vars(owner):
+                    continue
+            setattr(owner, name, _timed(func, phase))
+
+
+def _hotspots(profiler: cProfile.Profile, limit: int = PROFILE_HOTSPOTS) -> list[dict]:
+    """Functions with the most self time."""
+    stats = pstats.Stats(profiler).stats
+    top = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    hotspots = []
+    for (filename, lineno, function), (_, calls, self_seconds, cumulative_seconds, _) in top:
+        location = "/".join(Path(filename).parts[-2:]) if filename != "~" else "built-in"
+        hotspots.append({
+            "function": f"{function} ({location}:{lineno})",
+            "calls": calls,
+            "self_seconds": round(self_seconds, 3),
+            "cumulative_seconds": round(cumulative_seconds, 3),
+        })
+    return hotspots
+
+
+def write_profile(profile_dir: Path, profiler: cProfile.Profile, total_seconds: float):
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(str(profile_dir / PSTATS_FILE))
+    phases = {phase: round(seconds, 3) for phase, seconds in _phase_seconds.items()}
+    phases["other"] = round(max(total_seconds - sum(_phase_seconds.values()), 0.0), 3)
+    summary = {
+        "profiler": "cProfile",
+        "total_seconds": round(total_seconds, 3),
+        "phases": phases,
+        "hotspots": _hotspots(profiler),
+    }
+    (profile_dir / SUMMARY_FILE).write_text(json.dumps(summary))
+
+
+def _evaluate(node, namespace: dict):
+    """Literal arguments plus names from Manim (colors, constants); nothing callable."""
+    for child in ast.walk(node):
+        if isinstance(child, (ast.Call, ast.Lambda, ast.Subscript, ast.NamedExpr)) or (
+            isinstance(child, ast.Attribute) and child.attr.startswith("_")
+        ):
+            raise ValueError("not a constant argument")
+    return eval(compile(ast.Expression(node), "<warm>", "eval"), {"__builtins__": {}}, namespace)
+
+
+def warm(spec_path: str) -> dict:
+    """Instantiate each call in the spec ({"calls": [{"cls", "source"}]}) to fill the cache."""
+    import manim
+
+    namespace = {name: getattr(manim, name) for name in dir(manim) if not name.startswith("_")}
+    spec = json.loads(Path(spec_path).read_text())
+    compiled = failed = 0
+    for call in spec["calls"]:
+        try:
+            node = ast.parse(call["source"], mode="eval").body
+            args = [_evaluate(arg, namespace) for arg in node.args]
+            kwargs = {kw.arg: _evaluate(kw.value, namespace) for kw in node.keywords if kw.arg}
+            getattr(manim, call["cls"])(*args, **kwargs)
+            compiled += 1
+        except Exception as e:
+            failed += 1
+            print(f"Warm-up of {call['source'][:80]!r} failed: {e}", file=sys.stderr)
+    return {"compiled": compiled, "failed": failed}
+
+
+def main(argv):
+    from . import narration
+    from .render_cache import RENDER_CACHE_DIR
+
+    cache_dir = RENDER_CACHE_DIR
+    install(cache_dir)
+    profiler = profile_dir = narration_spec = None
+    while argv[:1] in (["--profile"], ["--narration"]):
+        if argv[0] == "--profile":
+            profile_dir = Path(argv[1])
+        else:
+            narration_spec = argv[1]
+        argv = argv[2:]
+    if profile_dir is not None:
+        install_phase_timers()
+        profiler = cProfile.Profile()
+    started = time.perf_counter()
+    try:
+        if argv[:1] == ["--warm"]:
+            configure(cache_dir)
+            print(json.dumps(warm(argv[1])), flush=True)
+            return 0
+        # The CLI gets the cache directories from --config_file (render_cache.config_file)
+        from manim.__main__ import main as manim_main
+
+        if narration.TTS_SERVICE == "fake":
+            narration.install_fake_tts()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            if narration_spec is not None:
+                _timed(narration.presynthesize, "tts")(narration_spec)
+            manim_main.main(args=argv, prog_name="manim", standalone_mode=False)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                write_profile(profile_dir, profiler, time.perf_counter() - started)
+        return 0
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        flush_stats(cache_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,76 @@
+"""Helpers for inspecting and rewriting generated Manim scripts."""
+import ast
+import re
+
+_SCENE_CLASS_RE = re.compile(r"^class\s+(\w+)\s*\(\s*VoiceoverScene\s*\)", re.MULTILINE)
+
+
+def clean_code(text: str) -> str:
+    """Strip markdown fences / language hints the model sometimes adds."""
+    text = re.sub(r"^```(?:python)?", "", text.strip(), flags=re.MULTILINE).strip()
+    return re.sub(r"```$", "", text, flags=re.MULTILINE).strip()
+
+
+def find_scene_class(code: str) -> str | None:
+    """Name of the first `VoiceoverScene` subclass defined in `code`."""
+    match = _SCENE_CLASS_RE.search(code)
+    return match.group(1) if match else None
+
+
+def rename_scene_class(code: str, scene_class_name: str) -> str:
+    """Rename the script's scene class so it can be rendered under a new video id."""
+    old_name = find_scene_class(code)
+    if old_name is None or old_name == scene_class_name:
+        return code
+    return re.sub(rf"\b{re.escape(old_name)}\b", scene_class_name, code)
+
+
+def _is_voiceover_call(node: ast.AST) -> bool:
+    return (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == "voiceover"
+    )
+
+
+def voiceover_calls(code: str) -> list[ast.Call]:
+    """All `self.voiceover(...)` calls in source order."""
+    tree = ast.parse(code)
+    calls = [node for node in ast.walk(tree) if _is_voiceover_call(node)]
+    return sorted(calls, key=lambda node: (node.lineno, node.col_offset))
+
+
+def voiceover_text(call: ast.Call) -> str | None:
+    """The literal narration of a voiceover call, if it is a constant string."""
+    args = [kw.value for kw in call.keywords if kw.arg == "text"] or call.args[:1]
+    if args and isinstance(args[0], ast.Constant) and isinstance(args[0].value, str):
+        return args[0].value
+    return None
+
+
+def extract_narration(code: str) -> list[str]:
+    """Literal narration strings of every voiceover block, in order."""
+    try:
+        calls = voiceover_calls(code)
+    except SyntaxError:
+        return []
+    return [text for text in map(voiceover_text, calls) if text]
+
+
+def voiceover_block_at(code: str, lineno: int) -> int | None:
+    """Index (into `voiceover_calls`) of the innermost voiceover block containing `lineno`."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    positions = [(call.lineno, call.col_offset) for call in voiceover_calls(code)]
+    found = None
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.With) or not (node.lineno <= lineno <= node.end_lineno):
+            continue
+        for item in node.items:
+            if _is_voiceover_call(item.context_expr):
+                call = item.context_expr
+                if found is None or node.lineno >= found[0]:
+                    found = (node.lineno, positions.index((call.lineno, call.col_offset)))
+    return found[1] if found else None
@@ -0,0 +1,72 @@
+"""Minimal in-process metrics: counters and latency summaries.
+
+Exposed as JSON by `GET /api/metrics`. Each summary keeps a bounded window of
+recent observations for percentiles.
+"""
+import threading
+from collections import defaultdict, deque
+
+SUMMARY_WINDOW = 1000
+
+_Key = tuple[str, tuple[tuple[str, str], ...]]
+
+
+def _key(name: str, labels: dict[str, object]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format(key: _Key) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[_Key, float] = defaultdict(float)
+        self._summaries: dict[_Key, dict] = {}
+
+    def incr(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            summary = self._summaries.setdefault(
+                _key(name, labels), {"count": 0, "sum": 0.0, "window": deque(maxlen=SUMMARY_WINDOW)}
+            )
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["window"].append(value)
+
+    def counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(_key(name, labels), 0)
+
+    def recent(self, name: str, **labels) -> list:
+        """Recent observations of a summary, oldest first."""
+        with self._lock:
+            summary = self._summaries.get(_key(name, labels))
+            return list(summary["window"]) if summary else []
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            summaries = {}
+            for key, summary in self._summaries.items():
+                window = sorted(summary["window"])
+                summaries[_format(key)] = {
+                    "count": summary["count"],
+                    "mean": summary["sum"] / summary["count"],
+                    "p50": window[len(window) // 2],
+                    "p95": window[min(len(window) - 1, int(len(window) * 0.95))],
+                    "max": window[-1],
+                }
+            return {
+                "counters": {_format(key): value for key, value in self._counters.items()},
+                "summaries": summaries,
+            }
+
+
+metrics = Metrics()
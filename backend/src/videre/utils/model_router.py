@@ -0,0 +1,233 @@
+"""Per-request model routing for script generation.
+
+Every topic used to go to the same model. The router picks one per request
+from:
+- the topic's complexity (`topic_complexity`): simple topics may go to a
+  cheaper model, complex ones only to models configured for them,
+- each model's recent latency, error rate and pass rate (dry run and render
+  outcomes of its scripts), as exponentially weighted averages over this
+  process's own traffic,
+- the latency and cost budgets.
+
+Among the models that fit, it prefers the lowest expected cost per usable
+script (cost / pass rate). The other models stay in the list as fallbacks: a
+timeout or an overloaded/unavailable model moves on to the next one after
+one quick retry instead of the client's full backoff. A model whose error
+rate crosses MAX_ERROR_RATE is skipped for COOLDOWN_SECONDS. A small share
+of requests (CODEGEN_EXPLORE_RATE) goes to another eligible model so its
+stats stay current.
+
+Point CLAUDE_BASE_URL at `python -m videre.fake_llm` to exercise routing and
+fallback without the real API.
+
+Environment variables supported:
+- CODEGEN_MODELS (default: sonnet 4.5 for everything, haiku 4.5 for simple
+  topics) - `<model>:<relative cost>:<max complexity>`, strongest first
+- CODEGEN_LATENCY_BUDGET_SECONDS (default: 120)
+- CODEGEN_COST_BUDGET (optional) - models above it are fallbacks only
+- CODEGEN_TIMEOUT_SECONDS (default: 180) - per upstream attempt, not counting
+  time queued for the client's concurrency and rate limits
+- CODEGEN_MIN_PASS_RATE (default: 0.6)
+- CODEGEN_EXPLORE_RATE (default: 0.05)
+"""
+import random
+import re
+import time
+from dataclasses import dataclass
+
+from ..config import settings
+from .claude_client import ClaudeError, run_claude_completion
+from .docs_index import tokenize
+from .metrics import metrics
+
+CODEGEN_LATENCY_BUDGET_SECONDS = settings.codegen_latency_budget_seconds
+CODEGEN_COST_BUDGET = settings.codegen_cost_budget
+CODEGEN_TIMEOUT_SECONDS = settings.codegen_timeout_seconds
+CODEGEN_MIN_PASS_RATE = settings.codegen_min_pass_rate
+CODEGEN_EXPLORE_RATE = settings.codegen_explore_rate
+
+EWMA_ALPHA = 0.2
+PRIOR_PASS_RATE = 0.8
+MAX_ERROR_RATE = 0.5
+COOLDOWN_SECONDS = 60
+FALLBACK_RETRIES = 1  # per model, before moving on to the next one
+
+# Topic words that usually mean long derivations or dense visuals
+COMPLEX_TERMS = (
+    "proof", "prove", "deriv", "theorem", "integral", "eigen", "fourier", "laplace",
+    "transform", "differential", "algorithm", "dynamic", "recurs", "complexity",
+    "optimi", "gradient", "probab", "bayes", "matrix", "matrices", "vector", "tensor",
+    "topolog", "quantum", "neural", "graph", "converge", "compare", "versus",
+)
+
+
+def topic_complexity(topic: str) -> float:
+    """0 (one plain word) to 1 (long, technical, with formulas)."""
+    words = tokenize(topic or "")
+    technical = sum(1 for word in words if word.startswith(COMPLEX_TERMS))
+    formula = bool(re.search(r"[=^+*/<>∫∑√]|\d", topic or ""))
+    return round(
+        min(len(words) / 12, 1) * 0.4 + min(technical / 2, 1) * 0.4 + (0.2 if formula else 0), 2
+    )
+
+
+@dataclass
+class ModelSpec:
+    name: str
+    cost: float
+    max_complexity: float
+
+
+def parse_models(spec: str) -> list[ModelSpec]:
+    models = []
+    for part in spec.split(","):
+        if part.strip():
+            name, cost, max_complexity = (part.strip().split(":") + ["1", "1"])[:3]
+            models.append(ModelSpec(name, float(cost), float(max_complexity)))
+    return models
+
+
+@dataclass
+class ModelStats:
+    latency: float | None = None  # EWMA of successful request seconds
+    error_rate: float = 0.0
+    pass_rate: float = PRIOR_PASS_RATE
+    requests: int = 0
+    outcomes: int = 0
+    cooldown_until: float = 0.0
+
+    def to_stats(self) -> dict:
+        return {
+            "latency_seconds": round(self.latency, 2) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "pass_rate": round(self.pass_rate, 3),
+            "requests": self.requests,
+            "outcomes": self.outcomes,
+            "cooling_down": self.cooldown_until > time.monotonic(),
+        }
+
+
+def _ewma(previous: float, value: float) -> float:
+    return previous + EWMA_ALPHA * (value - previous)
+
+
+class ModelRouter:
+    def __init__(self, models: list[ModelSpec]):
+        self.models = models
+        self._stats: dict[str, ModelStats] = {m.name: ModelStats() for m in models}
+
+    def stats_for(self, model: str) -> ModelStats:
+        return self._stats.setdefault(model, ModelStats())
+
+    def route(self, topic: str) -> list[ModelSpec]:
+        """Models to try for `topic`, best first; the rest are fallbacks."""
+        complexity = topic_complexity(topic)
+        now = time.monotonic()
+
+        def fits(model: ModelSpec) -> bool:
+            stats = self.stats_for(model.name)
+            return (
+                complexity <= model.max_complexity
+                and stats.cooldown_until <= now
+                and stats.pass_rate >= CODEGEN_MIN_PASS_RATE
+                and (stats.latency is None or stats.latency <= CODEGEN_LATENCY_BUDGET_SECONDS)
+                and (CODEGEN_COST_BUDGET is None or model.cost <= CODEGEN_COST_BUDGET)
+            )
+
+        eligible = sorted(
+            (m for m in self.models if fits(m)),
+            key=lambda m: m.cost / max(self.stats_for(m.name).pass_rate, 0.05),
+        )
+        if len(eligible) > 1 and random.random() < CODEGEN_EXPLORE_RATE:
+            eligible.insert(0, eligible.pop(random.randrange(1, len(eligible))))
+        # Fallbacks: strongest first, models cooling down last
+        rest = sorted(
+            (m for m in self.models if m not in eligible),
+            key=lambda m: self.stats_for(m.name).cooldown_until > now,
+        )
+        return eligible + rest
+
+    def record_request(self, model: str, seconds: float, ok: bool, reason: str = "ok"):
+        stats = self.stats_for(model)
+        stats.requests += 1
+        stats.error_rate = _ewma(stats.error_rate, 0.0 if ok else 1.0)
+        if ok:
+            stats.latency = seconds if stats.latency is None else _ewma(stats.latency, seconds)
+            metrics.observe("codegen_model_seconds", seconds, model=model)
+        elif stats.error_rate > MAX_ERROR_RATE:
+            stats.cooldown_until = time.monotonic() + COOLDOWN_SECONDS
+        metrics.incr("codegen_model_requests_total", model=model, outcome=reason)
+
+    def record_outcome(self, model: str | None, stage: str, passed: bool):
+        """A script from `model` passed or failed its dry run / render."""
+        if model is None:
+            return
+        stats = self.stats_for(model)
+        stats.outcomes += 1
+        stats.pass_rate = _ewma(stats.pass_rate, 1.0 if passed else 0.0)
+        metrics.incr(
+            "codegen_model_outcomes_total",
+            model=model,
+            stage=stage,
+            outcome="pass" if passed else "fail",
+        )
+
+    async def complete(
+        self, prompt: str, topic: str, max_tokens: int, temperature: float
+    ) -> tuple[str, str]:
+        """Run the completion on the routed model, falling back on timeouts and errors.
+
+        Returns (text, model used). Raises the last error if every model failed, and
+        a client error (bad request, auth) at once without counting it against a model.
+        """
+        models = self.route(topic)
+        error: Exception | None = None
+        for i, model in enumerate(models):
+            last = i == len(models) - 1
+            # Only the upstream call is timed; local queueing is not the model's latency
+            timing: dict = {}
+            try:
+                text = await run_claude_completion(
+                    prompt=prompt,
+                    model=model.name,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    attempt_timeout=CODEGEN_TIMEOUT_SECONDS,
+                    timing=timing,
+                    # The last model gets the client's full backoff
+                    **({} if last else {"max_retries": FALLBACK_RETRIES}),
+                )
+            except ClaudeError as e:
+                if not e.retryable:
+                    # A bad request or missing credentials fails on every model alike
+                    metrics.incr(
+                        "codegen_model_requests_total", model=model.name, outcome="client_error"
+                    )
+                    raise
+                self.record_request(
+                    model.name,
+                    timing.get("upstream_seconds", 0.0),
+                    False,
+                    "timeout" if e.timeout else "error",
+                )
+                error = e
+            else:
+                self.record_request(model.name, timing["upstream_seconds"], True)
+                if i > 0:
+                    metrics.incr("codegen_fallbacks_total", model=model.name)
+                return text, model.name
+            if not last:
+                print(
+                    f"Model {model.name} failed ({error!r}), falling back to {models[i + 1].name}"
+                )
+        raise (
+            error
+            if isinstance(error, ClaudeError)
+            else ClaudeError(f"All models failed: {error!r}")
+        )
+
+    def stats(self) -> dict:
+        return {name: stats.to_stats() for name, stats in self._stats.items()}
+
+
+model_router = ModelRouter(parse_models(settings.codegen_models))
@@ -0,0 +1,314 @@
+"""Narration pre-synthesis: every voiceover clip is generated before the render.
+
+Manim runs `construct()` top to bottom, and each `self.voiceover(...)` block
+waits for its TTS request before any of its animations render, so a script
+with twenty blocks pays for twenty requests in sequence. The narration is
+known before the render starts: `narration_plan` reads the speech service
+(class and literal constructor arguments) and every literal voiceover text
+with its literal TTS keyword arguments from the script's AST.
+
+The render runner (`manim_runner.py --narration <spec>`) then calls the same
+service for all clips with NARRATION_CONCURRENCY requests in flight, writing
+into the voiceover cache under the render's media dir (`synthesize`). When the
+scene reaches a voiceover block, its audio is already a cache hit. This runs
+on the host that renders, so it works the same for render workers. Clips the
+plan cannot see (computed texts) are synthesized by the render as before, and
+a clip that fails here is retried by the render.
+
+With TTS_SERVICE=fake the runner replaces every speech service with a fake
+that sleeps FAKE_TTS_LATENCY_SECONDS per clip and writes silence, so the
+pipeline runs without a TTS account. `python -m videre.utils.narration`
+times a cold and a warm pre-synthesis against it.
+
+Environment variables supported:
+- NARRATION_PRESYNTHESIS (default: 1) - synthesize narration before rendering
+- NARRATION_CONCURRENCY (default: 4) - TTS requests in flight per render
+- TTS_SERVICE (default: unset) - "fake" for the local fake TTS service
+- FAKE_TTS_LATENCY_SECONDS (default: 0.5) - latency of the fake per clip
+"""
+import argparse
+import ast
+import importlib
+import json
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from ..config import settings
+from .manim_script import voiceover_calls, voiceover_text
+from .metrics import metrics
+
+NARRATION_PRESYNTHESIS = settings.narration_presynthesis
+NARRATION_CONCURRENCY = settings.narration_concurrency
+TTS_SERVICE = settings.tts_service
+FAKE_TTS_LATENCY_SECONDS = settings.fake_tts_latency_seconds
+
+NARRATION_MARKER = "NARRATION_STATS "
+NARRATION_SPEC_FILE = "narration.json"
+# The cache-index writer services/base.py imports and calls, newest release first
+# (0.4: services.cache.append_voiceover_cache_entry, 0.3: helper.append_to_json_file)
+CACHE_APPEND_HOOKS = ("append_voiceover_cache_entry", "append_to_json_file")
+# voiceover() arguments consumed by the scene (subcaptions), not the TTS service
+SCENE_ONLY_KWARGS = {"subcaption", "max_subcaption_len", "subcaption_buff"}
+
+
+def _literal_kwargs(keywords: list[ast.keyword], skip=()) -> dict:
+    """Keyword arguments as values; ValueError if any is not a literal (or is **kwargs)."""
+    kwargs = {}
+    for keyword in keywords:
+        if keyword.arg is None:
+            raise ValueError("**kwargs")
+        if keyword.arg not in skip:
+            kwargs[keyword.arg] = ast.literal_eval(keyword.value)
+    return kwargs
+
+
+def _speech_service(tree: ast.AST) -> dict | None:
+    """The single `self.set_speech_service(Service(...))` call, if its arguments are literals."""
+    imports = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module:
+            for alias in node.names:
+                imports[alias.asname or alias.name] = (node.module, alias.name)
+
+    calls = [
+        node for node in ast.walk(tree)
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+        and node.func.attr == "set_speech_service"
+    ]
+    if len(calls) != 1 or not calls[0].args:
+        return None
+    constructor = calls[0].args[0]
+    if not (
+        isinstance(constructor, ast.Call) and isinstance(constructor.func, ast.Name)
+        and constructor.func.id in imports and not constructor.args
+    ):
+        return None
+    try:
+        kwargs = _literal_kwargs(constructor.keywords)
+    except ValueError:
+        return None
+    module, class_name = imports[constructor.func.id]
+    return {"module": module, "class": class_name, "kwargs": kwargs}
+
+
+def narration_plan(code: str) -> dict | None:
+    """The speech service and distinct literal clips of a script.
+
+    None if nothing can be pre-synthesized.
+    """
+    try:
+        tree = ast.parse(code)
+        calls = voiceover_calls(code)
+    except SyntaxError:
+        return None
+    service = _speech_service(tree)
+    if service is None:
+        return None
+
+    clips, seen = [], set()
+    for call in calls:
+        text = voiceover_text(call)
+        if not text or len(call.args) > 1 or any(kw.arg == "ssml" for kw in call.keywords):
+            continue
+        try:
+            kwargs = _literal_kwargs(call.keywords, skip={"text"} | SCENE_ONLY_KWARGS)
+        except ValueError:
+            continue
+        key = (text, json.dumps(kwargs, sort_keys=True, default=repr))
+        if key not in seen:
+            seen.add(key)
+            clips.append({"text": text, "kwargs": kwargs})
+    if not clips:
+        return None
+    return {"service": service, "clips": clips}
+
+
+def write_spec(plan: dict, path: Path, media_dir: Path, concurrency: int = NARRATION_CONCURRENCY):
+    """Spec file for `manim_runner.py --narration`."""
+    path.write_text(json.dumps({**plan, "media_dir": str(media_dir), "concurrency": concurrency}))
+
+
+def install_fake_tts(latency: float = FAKE_TTS_LATENCY_SECONDS):
+    """Replace every speech service the scripts may import with a local fake (runner side)."""
+    from manim_voiceover.helper import remove_bookmarks
+    from manim_voiceover.services.base import SpeechService
+
+    from .dry_run_runner import SPEECH_SERVICES, estimate_seconds, write_silence
+
+    class FakeTTSService(SpeechService):
+        """Takes `latency` like a TTS request, then writes silence as long as the narration."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(transcription_model=None)
+
+        def generate_from_text(
+            self, text: str, cache_dir: str = None, path: str = None, **kwargs
+        ) -> dict:
+            cache_dir = cache_dir or self.cache_dir
+            input_data = {"input_text": remove_bookmarks(text), "service": "fake", **kwargs}
+            cached = self.get_cached_result(input_data, cache_dir)
+            if cached is not None:
+                return cached
+            time.sleep(latency)
+            audio_path = path or self.get_audio_basename(input_data) + ".wav"
+            write_silence(Path(cache_dir) / audio_path, estimate_seconds(text))
+            return {"input_text": text, "input_data": input_data, "original_audio": audio_path}
+
+    for module_name, class_name in SPEECH_SERVICES:
+        try:
+            module = importlib.import_module(module_name)
+        except Exception:
+            continue
+        setattr(module, class_name, FakeTTSService)
+
+
+def synthesize(spec: dict) -> dict:
+    """Synthesize the spec's clips concurrently into the voiceover cache (runner side).
+
+    manim-voiceover reads and rewrites its cache index (cache.json) without
+    locking, so lookups and appends are serialized here by patching the
+    writer `services.base` calls (CACHE_APPEND_HOOKS); the TTS requests
+    themselves run in parallel. RuntimeError if this manim-voiceover has none
+    of those hooks. Returns counts of synthesized, cached and failed clips.
+    """
+    import manim_voiceover.services.base as base
+    from manim import config
+
+    config.media_dir = spec["media_dir"]
+    module = importlib.import_module(spec["service"]["module"])
+    service = getattr(module, spec["service"]["class"])(**spec["service"]["kwargs"])
+
+    hook = next((name for name in CACHE_APPEND_HOOKS if hasattr(base, name)), None)
+    if hook is None:
+        raise RuntimeError(
+            "unsupported manim-voiceover: services.base calls none of "
+            f"{', '.join(CACHE_APPEND_HOOKS)}, so cache writes cannot be serialized"
+        )
+    concurrency = max(1, spec.get("concurrency", NARRATION_CONCURRENCY))
+    lock = threading.Lock()
+    local = threading.local()
+    original_lookup = base.SpeechService.get_cached_result
+    original_append = getattr(base, hook)
+
+    def get_cached_result(self, input_data, cache_dir):
+        with lock:
+            entry = original_lookup(self, input_data, cache_dir)
+        local.hit = entry is not None
+        return entry
+
+    def append_entry(json_file, data):
+        if local.hit:
+            return  # already indexed
+        with lock:
+            original_append(json_file, data)
+
+    def run(clip: dict) -> bool:
+        local.hit = False
+        service._wrap_generate_from_text(clip["text"], **clip["kwargs"])
+        return local.hit
+
+    stats = {
+        "clips": len(spec["clips"]),
+        "synthesized": 0,
+        "cached": 0,
+        "failed": 0,
+        "concurrency": concurrency,
+    }
+    started = time.perf_counter()
+    base.SpeechService.get_cached_result = get_cached_result
+    setattr(base, hook, append_entry)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {pool.submit(run, clip): clip for clip in spec["clips"]}
+            for future in as_completed(futures):
+                try:
+                    stats["cached" if future.result() else "synthesized"] += 1
+                except Exception as e:
+                    stats["failed"] += 1
+                    print(
+                        f"Pre-synthesis of {futures[future]['text'][:60]!r} failed: {e}",
+                        file=sys.stderr,
+                    )
+    finally:
+        base.SpeechService.get_cached_result = original_lookup
+        setattr(base, hook, original_append)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+def presynthesize(spec_path: str):
+    """Run `synthesize` for a spec file and print its stats.
+
+    Never raises; the render synthesizes whatever is missing.
+    """
+    try:
+        stats = synthesize(json.loads(Path(spec_path).read_text()))
+    except Exception as e:
+        print(f"Narration pre-synthesis failed: {e}", file=sys.stderr)
+        stats = {"error": str(e)}
+    print(NARRATION_MARKER + json.dumps(stats), flush=True)
+
+
+def record_stats(stdout: str) -> dict:
+    """Count the clips a manim_runner run pre-synthesized."""
+    for line in stdout.splitlines():
+        if line.startswith(NARRATION_MARKER):
+            stats = json.loads(line[len(NARRATION_MARKER):])
+            if "error" in stats:
+                # The render still synthesizes every clip, one at a time
+                print(f"Narration pre-synthesis failed: {stats['error']}")
+                metrics.incr("narration_presynthesis_errors_total")
+                return stats
+            for outcome in ("synthesized", "cached", "failed"):
+                metrics.incr("narration_clips_total", stats[outcome], outcome=outcome)
+            metrics.observe("narration_presynthesis_seconds", stats["seconds"])
+            return stats
+    return {}
+
+
+def _check(clips: int, concurrency: int, latency: float):
+    """Pre-synthesize a script's narration twice with the fake TTS: cold, then from cache."""
+    narration = "\n".join(
+        f"        with self.voiceover(text='Step {i} of the explanation.') as tracker:\n"
+        f"            self.wait(tracker.duration)"
+        for i in range(clips)
+    )
+    code = (
+        "from manim import *\n"
+        "from manim_voiceover import VoiceoverScene\n"
+        "from manim_voiceover.services.gtts import GTTSService\n\n"
+        "class CheckScene(VoiceoverScene):\n"
+        "    def construct(self):\n"
+        "        self.set_speech_service(GTTSService())\n"
+        f"{narration}\n"
+    )
+    plan = narration_plan(code)
+    install_fake_tts(latency)
+    with tempfile.TemporaryDirectory() as media_dir:
+        spec = {**plan, "media_dir": media_dir, "concurrency": concurrency}
+        cold = synthesize(spec)
+        warm = synthesize(spec)
+    expected = -(-clips // max(concurrency, 1)) * latency
+    print(json.dumps({"cold": cold, "warm": warm, "sequential_seconds": round(clips * latency, 3)}))
+    ok = (
+        cold["synthesized"] == clips
+        and warm["cached"] == clips
+        and cold["seconds"] < expected + latency
+    )
+    print("ok" if ok else "FAILED: pre-synthesis was not concurrent or missed the cache")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check concurrent narration pre-synthesis with the fake TTS"
+    )
+    parser.add_argument("--clips", type=int, default=12)
+    parser.add_argument("--concurrency", type=int, default=NARRATION_CONCURRENCY)
+    parser.add_argument("--latency", type=float, default=FAKE_TTS_LATENCY_SECONDS)
+    args = parser.parse_args()
+    sys.exit(_check(args.clips, args.concurrency, args.latency))
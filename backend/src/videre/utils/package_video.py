@@ -0,0 +1,355 @@
+"""Post-render packaging: HLS ladder + fast-start MP4, uploaded in parallel.
+
+A single ffmpeg pass transcodes the rendered MP4 into an adaptive-bitrate HLS
+ladder with short segments and a master playlist, while a second (stream-copy)
+pass produces a fast-start MP4 fallback. Everything is then uploaded to S3
+concurrently through the configured storage backend.
+
+Alongside, another ffmpeg pass extracts the preview images: a poster frame,
+small thumbnails of it and a sprite sheet of evenly spaced frames for hover
+scrubbing (`publish_previews`). It uploads them while the video uploads, so
+list pages can show a video with a few kilobytes of JPEG instead of fetching
+the MP4.
+
+Published objects are content-addressed: the rendered MP4 is hashed and its
+SHA-256 names the MP4 (`videos/sha256/<hash>.mp4`), the HLS prefix
+(`hls/<hash>/`) and the previews prefix (`previews/<hash>/`). Regenerations,
+reused scripts and retries that produce an identical video find the objects
+already there (one HEAD each) and skip packaging and upload entirely.
+
+Environment variables supported:
+- HLS_PACKAGING (default: 1) - set to 0 to upload only the MP4
+- HLS_SEGMENT_SECONDS (default: 2)
+- VIDEO_PREVIEWS (default: 1) - set to 0 to skip poster, thumbnails and sprite
+- PREVIEW_THUMBNAIL_WIDTHS (default: 320,640)
+- PREVIEW_SPRITE_COLUMNS / PREVIEW_SPRITE_ROWS (default: 10 / 6) - sprite
+  frames, spread evenly over the video
+- PREVIEW_SPRITE_WIDTH (default: 160) - width of one sprite frame
+- FFMPEG_BINARY / FFPROBE_BINARY (default: ffmpeg / ffprobe)
+"""
+import asyncio
+import json
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from ..config import settings
+from .metrics import metrics
+from .render_profiles import RenderProfile
+from .storage import content_key, get_storage, sha256_file
+
+HLS_PACKAGING = settings.hls_packaging
+HLS_SEGMENT_SECONDS = settings.hls_segment_seconds
+FFMPEG_BINARY = settings.ffmpeg_binary
+FFPROBE_BINARY = settings.ffprobe_binary
+HLS_MASTER_PLAYLIST = "master.m3u8"
+
+VIDEO_PREVIEWS = settings.video_previews
+PREVIEW_THUMBNAIL_WIDTHS = [
+    int(width) for width in settings.preview_thumbnail_widths.split(",") if width.strip()
+]
+PREVIEW_SPRITE_COLUMNS = settings.preview_sprite_columns
+PREVIEW_SPRITE_ROWS = settings.preview_sprite_rows
+PREVIEW_SPRITE_WIDTH = settings.preview_sprite_width
+PREVIEW_MANIFEST = "previews.json"
+# Where in the video the poster frame is taken (share of the duration)
+POSTER_POSITION = 0.5
+
+
+@dataclass
+class Rendition:
+    name: str
+    height: int
+    video_bitrate: str
+    audio_bitrate: str = "128k"
+
+
+HLS_LADDER = [
+    Rendition("1080p", 1080, "5000k", "192k"),
+    Rendition("720p", 720, "2800k"),
+    Rendition("480p", 480, "1400k", "96k"),
+]
+
+
+def hls_prefix(content_hash: str) -> str:
+    return f"hls/{content_hash}"
+
+
+def previews_prefix(content_hash: str) -> str:
+    return f"previews/{content_hash}"
+
+
+async def _run(command: list[str]):
+    process = await asyncio.create_subprocess_exec(
+        *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f"{command[0]} failed: {stderr.decode()[-2000:]}")
+    return stdout.decode()
+
+
+async def has_audio(video_path: Path) -> bool:
+    output = await _run([
+        FFPROBE_BINARY, "-v", "error", "-select_streams", "a",
+        "-show_entries", "stream=index", "-of", "csv=p=0", str(video_path),
+    ])
+    return bool(output.strip())
+
+
+async def make_faststart_mp4(video_path: Path, output_path: Path):
+    """Remux with the moov atom up front so playback starts before the download ends."""
+    await _run([
+        FFMPEG_BINARY, "-y", "-v", "error", "-i", str(video_path),
+        "-c", "copy", "-movflags", "+faststart", str(output_path),
+    ])
+
+
+async def probe_video(video_path: Path) -> dict:
+    """Width, height and duration (seconds) of the video stream."""
+    output = await _run([
+        FFPROBE_BINARY, "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=width,height:format=duration", "-of", "json", str(video_path),
+    ])
+    probe = json.loads(output)
+    stream = probe["streams"][0]
+    return {
+        "width": stream["width"],
+        "height": stream["height"],
+        "duration": float(probe["format"]["duration"]),
+    }
+
+
+def _even(value: float) -> int:
+    return max(2, int(round(value / 2)) * 2)
+
+
+async def make_previews(video_path: Path, output_dir: Path) -> dict:
+    """Extract the poster, thumbnails and sprite sheet in one ffmpeg pass. Returns the manifest."""
+    video = await probe_video(video_path)
+    aspect = video["height"] / video["width"]
+    frames = PREVIEW_SPRITE_COLUMNS * PREVIEW_SPRITE_ROWS
+    sprite = {
+        "file": "sprite.jpg",
+        "columns": PREVIEW_SPRITE_COLUMNS,
+        "rows": PREVIEW_SPRITE_ROWS,
+        "frames": frames,
+        "width": _even(PREVIEW_SPRITE_WIDTH),
+        "height": _even(PREVIEW_SPRITE_WIDTH * aspect),
+        "interval_seconds": round(video["duration"] / frames, 3),
+    }
+    thumbnails = {str(width): f"thumb_{width}.jpg" for width in PREVIEW_THUMBNAIL_WIDTHS}
+    poster_at = video["duration"] * POSTER_POSITION
+
+    # One decode feeds everything: a single frame (poster + its thumbnails) and the sprite
+    stills = len(thumbnails) + 1
+    graph = [
+        "[0:v]split=2[still][scrub]",
+        f"[still]select='gte(t,{poster_at:.3f})',trim=end_frame=1,split={stills}"
+        + "".join(f"[s{i}]" for i in range(stills)),
+        *[f"[s{i + 1}]scale={_even(width)}:{_even(width * aspect)}[t{i}]"
+          for i, width in enumerate(PREVIEW_THUMBNAIL_WIDTHS)],
+        f"[scrub]fps={frames}/{video['duration']:.3f},scale={sprite['width']}:{sprite['height']},"
+        f"tile={PREVIEW_SPRITE_COLUMNS}x{PREVIEW_SPRITE_ROWS}[sprite]",
+    ]
+    outputs = [
+        ("[s0]", "poster.jpg", 2),
+        *[(f"[t{i}]", name, 4) for i, name in enumerate(thumbnails.values())],
+        ("[sprite]", sprite["file"], 5),
+    ]
+    command = [
+        FFMPEG_BINARY,
+        "-y",
+        "-v",
+        "error",
+        "-i",
+        str(video_path),
+        "-filter_complex",
+        ";".join(graph),
+    ]
+    for label, name, quality in outputs:
+        command += [
+            "-map",
+            label,
+            "-frames:v",
+            "1",
+            "-update",
+            "1",
+            "-q:v",
+            str(quality),
+            str(output_dir / name),
+        ]
+    await _run(command)
+    return {"poster": "poster.jpg", "thumbnails": thumbnails, "sprite": sprite}
+
+
+async def publish_previews(video_path: Path, content_hash: str) -> dict | None:
+    """Make and upload the video's previews unless they exist.
+
+    Returns their manifest (None if skipped).
+
+    The manifest gets a `prefix` with the storage prefix of its files.
+    """
+    if not VIDEO_PREVIEWS or shutil.which(FFMPEG_BINARY) is None:
+        return None
+    storage = get_storage()
+    prefix = previews_prefix(content_hash)
+    manifest_key = f"{prefix}/{PREVIEW_MANIFEST}"
+    try:
+        if await storage.exists(manifest_key):
+            return {**json.loads(await storage.read_text(manifest_key)), "prefix": prefix}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_dir = Path(temp_dir)
+            images = output_dir / "images"
+            images.mkdir()
+            manifest = await make_previews(video_path, images)
+            await storage.put_directory(images, prefix)
+            # The manifest goes last: its presence marks the previews complete
+            (output_dir / PREVIEW_MANIFEST).write_text(json.dumps(manifest))
+            await storage.put_file(output_dir / PREVIEW_MANIFEST, manifest_key)
+    except Exception as e:
+        # Previews are an optimisation; never fail publishing over them
+        print(f"Warning: preview generation failed: {e}")
+        metrics.incr("video_previews_total", outcome="failed")
+        return None
+    metrics.incr("video_previews_total", outcome="made")
+    return {**manifest, "prefix": prefix}
+
+
+def ladder_for(profile: RenderProfile | None) -> list[Rendition]:
+    """The renditions up to the profile's resolution (no upscaling)."""
+    if profile is None:
+        return HLS_LADDER
+    return [r for r in HLS_LADDER if r.height <= profile.height] or HLS_LADDER[-1:]
+
+
+async def package_hls(
+    video_path: Path,
+    output_dir: Path,
+    ladder: list[Rendition] = HLS_LADDER,
+    preset: str = "veryfast",
+):
+    """Transcode `video_path` into an HLS ladder in one ffmpeg pass."""
+    audio = await has_audio(video_path)
+    split = f"[0:v]split={len(ladder)}" + "".join(f"[v{i}]" for i in range(len(ladder)))
+    scales = [f"[v{i}]scale=-2:{r.height}[v{i}out]" for i, r in enumerate(ladder)]
+
+    command = [FFMPEG_BINARY, "-y", "-v", "error", "-i", str(video_path),
+               "-filter_complex", ";".join([split, *scales])]
+    stream_map = []
+    for i, rendition in enumerate(ladder):
+        command += [
+            "-map", f"[v{i}out]",
+            f"-c:v:{i}", "libx264", f"-b:v:{i}", rendition.video_bitrate,
+            f"-maxrate:v:{i}", rendition.video_bitrate, f"-bufsize:v:{i}", rendition.video_bitrate,
+        ]
+        if audio:
+            command += ["-map", "0:a", f"-c:a:{i}", "aac", f"-b:a:{i}", rendition.audio_bitrate]
+            stream_map.append(f"v:{i},a:{i},name:{rendition.name}")
+        else:
+            stream_map.append(f"v:{i},name:{rendition.name}")
+
+    command += [
+        "-preset", preset,
+        "-pix_fmt", "yuv420p",
+        # Keyframe on every segment boundary so renditions can switch cleanly
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+        "-sc_threshold", "0",
+        "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_flags", "independent_segments",
+        "-hls_segment_filename", str(output_dir / "%v" / "seg_%03d.ts"),
+        "-master_pl_name", HLS_MASTER_PLAYLIST,
+        "-var_stream_map", " ".join(stream_map),
+        str(output_dir / "%v" / "index.m3u8"),
+    ]
+    await _run(command)
+
+
+async def publish_video(
+    video_path: Path, video_uuid: str, profile: RenderProfile | None = None
+) -> dict:
+    """Package and upload a rendered video and its previews.
+
+    Returns the fields to store on the chat history.
+
+    The HLS ladder stops at the render `profile`'s resolution and uses its
+    (faster, for cheaper profiles) x264 preset.
+    """
+    content_hash = await sha256_file(video_path)
+    previews_task = asyncio.create_task(publish_previews(video_path, content_hash))
+    try:
+        published = await _publish_streams(video_path, video_uuid, content_hash, profile)
+    except BaseException:
+        # Publishing failed (or was cancelled): don't keep extracting and uploading previews for it
+        previews_task.cancel()
+        raise
+    published["previews"] = await previews_task
+    return published
+
+
+async def _publish_streams(
+    video_path: Path, video_uuid: str, content_hash: str, profile: RenderProfile | None
+) -> dict:
+    """The MP4 and HLS ladder of `publish_video`."""
+    storage = get_storage()
+    key = content_key(content_hash)
+    prefix = hls_prefix(content_hash)
+    manifest_key = f"{prefix}/{HLS_MASTER_PLAYLIST}"
+    published = {"video_key": key, "content_hash": content_hash, "hls_manifest_key": None}
+
+    want_hls = HLS_PACKAGING and shutil.which(FFMPEG_BINARY) is not None
+    have_video, have_hls = await asyncio.gather(storage.exists(key), storage.exists(manifest_key))
+    if have_hls:
+        published["hls_manifest_key"] = manifest_key
+    if have_video and (have_hls or not want_hls):
+        print(f"Video {video_uuid} is identical to stored {key}; skipping upload")
+        metrics.incr("publish_dedup_total", outcome="hit")
+        return published
+    metrics.incr("publish_dedup_total", outcome="miss")
+
+    if not want_hls:
+        await storage.put_file(video_path, key)
+        return published
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_dir = Path(temp_dir)
+        hls_dir = output_dir / "hls"
+        faststart_path = output_dir / f"{video_uuid}.mp4"
+
+        try:
+            await asyncio.gather(
+                package_hls(
+                    video_path,
+                    hls_dir,
+                    ladder_for(profile),
+                    profile.x264_preset if profile else "veryfast",
+                ),
+                make_faststart_mp4(video_path, faststart_path)
+                if not have_video
+                else asyncio.sleep(0),
+            )
+        except RuntimeError as e:
+            # Packaging is an optimisation; never lose the video over it
+            print(f"Warning: HLS packaging failed, uploading MP4 only: {e}")
+            await storage.put_file_if_absent(video_path, key)
+            return published
+
+        # The master playlist goes last: its presence marks the ladder complete
+        master_path = output_dir / HLS_MASTER_PLAYLIST
+        (hls_dir / HLS_MASTER_PLAYLIST).rename(master_path)
+        uploads = [storage.put_directory(hls_dir, prefix)]
+        if not have_video:
+            uploads.append(storage.put_file(faststart_path, key))
+        await asyncio.gather(*uploads)
+        await storage.put_file(master_path, manifest_key)
+
+    published["hls_manifest_key"] = manifest_key
+    return published
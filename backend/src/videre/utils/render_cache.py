@@ -0,0 +1,165 @@
+"""Shared Tex/Text SVG cache for every render and dry run on a host.
+
+Renders run `manim_runner.py` with a Manim config (`config_file()`) that puts
+`tex_dir` and `text_dir` under RENDER_CACHE_DIR instead of each video's
+workspace, so a formula or label compiled for one video is reused by all
+later ones. The runner makes the shared directories safe for concurrent
+renders and reports hits and misses: per render as
+`render_cache_total{kind,outcome}` metrics, and cumulatively (all processes on
+the host) in `stats()`, shown by `GET /api/metrics`.
+
+`warm()` mines the most common MathTex/Tex/Text literals from recent stored
+scripts and precompiles them, so even a video's first render finds its
+formulas cached. Render workers run it at startup; `just warm-render-cache`
+runs it on demand.
+
+Environment variables supported:
+- RENDER_CACHE_DIR (default: src/media/render_cache)
+- RENDER_CACHE_WARM_SCRIPTS (default: 500) - recent scripts mined by warm()
+- RENDER_CACHE_WARM_LIMIT (default: 300) - calls precompiled by warm()
+- RENDER_CACHE_WARM_ON_START (default: 1) - render workers warm at startup
+"""
+from __future__ import annotations
+
+import ast
+import asyncio
+import json
+import os
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from ..config import settings
+from .manim_runner import STATS_FILE, STATS_MARKER
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+RENDER_CACHE_DIR = settings.render_cache_dir
+RENDER_CACHE_WARM_SCRIPTS = settings.render_cache_warm_scripts
+RENDER_CACHE_WARM_LIMIT = settings.render_cache_warm_limit
+CACHED_CLASSES = ("MathTex", "Tex", "Text", "MarkupText")
+
+
+def config_file() -> Path:
+    """Manim config pointing the Tex/Text caches at RENDER_CACHE_DIR (passed as --config_file)."""
+    path = RENDER_CACHE_DIR / "manim.cfg"
+    content = (
+        "[CLI]\n"
+        f"tex_dir = {RENDER_CACHE_DIR / 'Tex'}\n"
+        f"text_dir = {RENDER_CACHE_DIR / 'texts'}\n"
+        # Manim's cleanup deletes every non-SVG file in tex_dir, even other renders' in-flight ones
+        "no_latex_cleanup = True\n"
+    )
+    if not path.exists() or path.read_text() != content:
+        RENDER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("w", dir=RENDER_CACHE_DIR, delete=False) as f:
+            f.write(content)
+        os.replace(f.name, path)
+    return path
+
+
+def _is_constant(node: ast.AST) -> bool:
+    """Literals and Manim constants (BLUE, UP, ...), which the warm-up can evaluate."""
+    for child in ast.walk(node):
+        if isinstance(child, (ast.Call, ast.Lambda, ast.Subscript, ast.Starred, ast.NamedExpr)):
+            return False
+        if isinstance(child, ast.Name) and not child.id.isupper():
+            return False
+    return True
+
+
+def cached_calls(code: str) -> list[tuple[str, str]]:
+    """(class, source) of each MathTex/Tex/Text call in `code` whose arguments are constants."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+    calls = []
+    for node in ast.walk(tree):
+        if (
+            isinstance(node, ast.Call)
+            and isinstance(node.func, ast.Name)
+            and node.func.id in CACHED_CLASSES
+            and node.args
+            and all(_is_constant(arg) for arg in node.args)
+            and all(kw.arg and _is_constant(kw.value) for kw in node.keywords)
+        ):
+            calls.append((node.func.id, ast.unparse(node)))
+    return calls
+
+
+def record_stats(stdout: str) -> dict[str, dict]:
+    """Count the hits and misses a manim_runner run printed."""
+    for line in stdout.splitlines():
+        if line.startswith(STATS_MARKER):
+            stats = json.loads(line[len(STATS_MARKER):])
+            for kind, counts in stats.items():
+                metrics.incr("render_cache_total", counts["hits"], kind=kind, outcome="hit")
+                metrics.incr("render_cache_total", counts["misses"], kind=kind, outcome="miss")
+            return stats
+    return {}
+
+
+def stats() -> dict:
+    """Cumulative hits and misses of every render on this host."""
+    try:
+        totals = json.loads((RENDER_CACHE_DIR / STATS_FILE).read_text())
+    except (OSError, ValueError):
+        return {}
+    for counts in totals.values():
+        lookups = counts["hits"] + counts["misses"]
+        counts["hit_ratio"] = round(counts["hits"] / lookups, 4) if lookups else None
+        counts["miss_seconds"] = round(counts["miss_seconds"], 1)
+    return totals
+
+
+async def warm(
+    db: AsyncIOMotorDatabase,
+    scripts: int = RENDER_CACHE_WARM_SCRIPTS,
+    limit: int = RENDER_CACHE_WARM_LIMIT,
+) -> dict:
+    """Precompile the Tex/Text calls that recur most across recent scripts."""
+    counts: Counter = Counter()
+    cursor = (
+        db.chat_histories.find({"manim_code": {"$ne": None}}, {"manim_code": 1})
+        .sort("created_at", -1)
+        .limit(scripts)
+    )
+    async for doc in cursor:
+        counts.update(set(cached_calls(doc["manim_code"])))
+    calls = [{"cls": cls, "source": source} for (cls, source), _ in counts.most_common(limit)]
+    if not calls:
+        return {"calls": 0}
+
+    RENDER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("w", suffix=".json", dir=RENDER_CACHE_DIR, delete=False) as f:
+        json.dump({"calls": calls}, f)
+    try:
+        project_root = Path(__file__).parent.parent.parent
+        process = await asyncio.create_subprocess_exec(
+            "uv", "run", "python", "-m", "videre.utils.manim_runner", "--warm", f.name,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=str(project_root),
+        )
+        stdout, _ = await process.communicate()
+    finally:
+        os.unlink(f.name)
+    return {"calls": len(calls), "cache": record_stats(stdout.decode())}
+
+
+async def _main():
+    from ..database import close_db, connect_db, get_database
+
+    await connect_db()
+    try:
+        print(json.dumps(await warm(get_database())))
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
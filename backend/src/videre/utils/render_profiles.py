@@ -0,0 +1,167 @@
+"""Load-aware render quality profiles.
+
+Rendering at 1080p60 costs several times what 720p30 does, so when renders
+back up the policy picks a cheaper profile for new jobs instead of letting
+the queue (and every user's wait) grow without bound.
+
+The load signal is the estimated wait for a new job: the render work queued
+or running ahead of it, divided by the render capacity. Each job counts the
+recent mean render time of its own profile; a profile without recent renders
+is estimated from the others through its relative `cost`, so the estimate
+does not swing when the mix of profiles changes. In queue mode the capacity
+is the render slots advertised by live workers (`render_workers`), so a burst
+after an idle period is not mistaken for an overload. Each step in
+RENDER_PROFILE_STEPS (`<profile>@<seconds>`) applies once the estimated wait
+reaches its threshold; below all of them the job gets RENDER_PROFILE.
+
+Environment variables supported:
+- RENDER_PROFILE (default: 1080p60) - profile used when not under load
+- RENDER_ADAPTIVE_QUALITY (default: 1) - set to 0 to always use RENDER_PROFILE
+- RENDER_PROFILE_STEPS (default: 720p30@300,480p15@900)
+- RENDER_UPGRADE (default: 0) - re-render degraded videos at RENDER_PROFILE
+  once the load has dropped (queued in `render_upgrades`, see pipeline.py)
+"""
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from ..config import settings
+from .metrics import metrics
+from .render_queue import live_render_slots, unfinished_jobs_by_profile
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+RENDER_ADAPTIVE_QUALITY = settings.render_adaptive_quality
+RENDER_UPGRADE = settings.render_upgrade
+# Assumed render time until this process has observed one
+DEFAULT_RENDER_SECONDS = 90.0
+
+
+@dataclass(frozen=True)
+class RenderProfile:
+    name: str
+    quality_flag: str  # Manim CLI quality preset
+    height: int
+    fps: int
+    x264_preset: str  # for the HLS transcode
+    rank: int  # higher is better
+    cost: float  # rough render time relative to 1080p60
+
+    @property
+    def output_dir(self) -> str:
+        """Manim's directory name for this quality, e.g. `1080p60`."""
+        return f"{self.height}p{self.fps}"
+
+
+PROFILES: dict[str, RenderProfile] = {
+    p.name: p for p in [
+        RenderProfile("1080p60", "-qh", 1080, 60, "veryfast", rank=2, cost=1.0),
+        RenderProfile("720p30", "-qm", 720, 30, "superfast", rank=1, cost=0.3),
+        RenderProfile("480p15", "-ql", 480, 15, "ultrafast", rank=0, cost=0.1),
+    ]
+}
+
+
+def get_profile(name: str | None) -> RenderProfile:
+    """The named profile; RENDER_PROFILE for None (e.g. jobs queued before profiles)."""
+    if name is None:
+        return default_profile()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown render profile: {name}")
+    return PROFILES[name]
+
+
+def default_profile() -> RenderProfile:
+    return PROFILES[settings.render_profile]
+
+
+def parse_steps(spec: str) -> list[tuple[float, RenderProfile]]:
+    """`720p30@300,480p15@900` -> [(300.0, 720p30), (900.0, 480p15)], by threshold."""
+    steps = []
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, seconds = part.strip().partition("@")
+        steps.append((float(seconds), get_profile(name)))
+    return sorted(steps, key=lambda step: step[0])
+
+
+@dataclass
+class RenderLoad:
+    queue_depth: int  # renders queued or running ahead of a new job
+    capacity: int  # renders that run at once
+    queued_render_seconds: float  # expected render time of those renders, each at its own profile
+
+    @property
+    def estimated_wait_seconds(self) -> float:
+        return self.queued_render_seconds / max(self.capacity, 1)
+
+    def to_stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "capacity": self.capacity,
+            "queued_render_seconds": round(self.queued_render_seconds, 1),
+            "estimated_wait_seconds": round(self.estimated_wait_seconds, 1),
+        }
+
+
+class RenderProfilePolicy:
+    def __init__(
+        self, best: RenderProfile, steps: list[tuple[float, RenderProfile]], adaptive: bool = True
+    ):
+        self.best = best
+        self.steps = steps
+        self.adaptive = adaptive
+        # Renders running in this process by profile name (local mode has no queue collection)
+        self.local_renders: Counter = Counter()
+        self.last_load: RenderLoad | None = None
+
+    def render_seconds(self, profile: RenderProfile) -> float:
+        """Expected render time at `profile`: its recent mean, else scaled from other profiles'."""
+        recent = metrics.recent("render_profile_seconds", profile=profile.name)
+        if recent:
+            return sum(recent) / len(recent)
+        # Renders of every profile, as 1080p60-equivalent seconds
+        normalized = metrics.recent("render_normalized_seconds")
+        best_seconds = sum(normalized) / len(normalized) if normalized else DEFAULT_RENDER_SECONDS
+        return best_seconds * profile.cost
+
+    def _work(self, renders: dict[str | None, int]) -> float:
+        return sum(
+            count * self.render_seconds(get_profile(name)) for name, count in renders.items()
+        )
+
+    async def current_load(self, db: AsyncIOMotorDatabase | None = None) -> RenderLoad:
+        """Queued work from `render_jobs` with a db (queue mode), else this process's renders."""
+        if db is not None:
+            renders = await unfinished_jobs_by_profile(db)
+            capacity = await live_render_slots(db)
+        else:
+            renders, capacity = dict(self.local_renders), 1
+        load = RenderLoad(sum(renders.values()), max(capacity, 1), self._work(renders))
+        self.last_load = load
+        return load
+
+    def choose(self, load: RenderLoad) -> RenderProfile:
+        if not self.adaptive:
+            return self.best
+        profile = self.best
+        for threshold, step in self.steps:
+            if load.estimated_wait_seconds >= threshold:
+                profile = step
+        return profile
+
+    def stats(self) -> dict:
+        return {
+            "adaptive": self.adaptive,
+            "best": self.best.name,
+            "last_load": self.last_load.to_stats() if self.last_load else None,
+        }
+
+
+render_policy = RenderProfilePolicy(
+    default_profile(), parse_steps(settings.render_profile_steps), RENDER_ADAPTIVE_QUALITY
+)
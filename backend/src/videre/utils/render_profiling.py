@@ -0,0 +1,102 @@
+"""Profiles of individual renders: where the time of a slow video went.
+
+A render runs with profiling when the request asks for it (`profiling` on
+/api/integrate and the re-render endpoints) or, with
+RENDER_PROFILING_SAMPLE_RATE, for a random share of renders. The runner
+(`manim_runner.py --profile`) then runs Manim under cProfile and times the
+phases: TTS, tex and text compilation, frame rendering, encoding and the
+rest. cProfile is deterministic and adds overhead to Python-heavy phases, so
+compare profiled renders with each other rather than with unprofiled ones.
+
+`collect` uploads the pstats file to storage (open it with `python -m pstats`
+or snakeviz). `record` stores the summary in the `render_profilings`
+collection, and the chat's `render_stats.profiling` links to it.
+`GET /api/profiling/renders` lists the slowest profiled renders with their
+top hotspots.
+
+Environment variables supported:
+- RENDER_PROFILING_SAMPLE_RATE (default: 0) - share of renders profiled
+  without being asked
+"""
+from __future__ import annotations
+
+import json
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from ..config import settings
+from .manim_runner import PSTATS_FILE, SUMMARY_FILE
+from .metrics import metrics
+from .storage import get_storage
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+RENDER_PROFILING_SAMPLE_RATE = settings.render_profiling_sample_rate
+CHAT_HOTSPOTS = 5  # hotspots copied into the chat's render_stats
+
+
+def sampled() -> bool:
+    return random.random() < RENDER_PROFILING_SAMPLE_RATE
+
+
+async def collect(profile_dir: Path, video_uuid: str) -> dict:
+    """Summary of the profiled render in `profile_dir`, with its uploaded pstats key; {} if none."""
+    try:
+        summary = json.loads((profile_dir / SUMMARY_FILE).read_text())
+    except (OSError, ValueError):
+        return {}
+    key = f"profiles/{video_uuid}/{int(time.time())}.pstats"
+    try:
+        await get_storage().put_file(profile_dir / PSTATS_FILE, key)
+        summary["artifact_key"] = key
+    except Exception as e:
+        # The render itself succeeded; a profile is not worth failing it over
+        print(f"Warning: could not upload render profile of {video_uuid}: {e}")
+    return summary
+
+
+def chat_summary(profiling: dict) -> dict:
+    """The part of a profile kept in the chat's render_stats."""
+    return {**profiling, "hotspots": profiling.get("hotspots", [])[:CHAT_HOTSPOTS]}
+
+
+async def record(
+    db: AsyncIOMotorDatabase, chat_id: str, video_id: str, topic: str, profiling: dict,
+    render_profile: str | None = None,
+):
+    for phase, seconds in profiling.get("phases", {}).items():
+        metrics.observe("render_phase_seconds", seconds, phase=phase)
+    await db.render_profilings.insert_one({
+        "chat_id": chat_id,
+        "video_id": video_id,
+        "topic": topic,
+        "render_profile": render_profile,
+        **profiling,
+        "created_at": datetime.utcnow(),
+    })
+
+
+async def ensure_profiling_indexes(db: AsyncIOMotorDatabase):
+    await db.render_profilings.create_index([("total_seconds", -1)])
+
+
+async def slowest(
+    db: AsyncIOMotorDatabase, limit: int = 20, phase: str | None = None, hotspots: int = 10
+) -> list[dict]:
+    """Slowest profiled renders (overall, or in one phase), with their top hotspots."""
+    sort_field = f"phases.{phase}" if phase else "total_seconds"
+    cursor = db.render_profilings.find({}).sort(sort_field, -1).limit(limit)
+    storage = get_storage()
+    renders = []
+    async for doc in cursor:
+        doc["id"] = str(doc.pop("_id"))
+        doc["hotspots"] = doc.get("hotspots", [])[:hotspots]
+        doc["artifact_url"] = (
+            await storage.url_for(doc["artifact_key"]) if doc.get("artifact_key") else None
+        )
+        renders.append(doc)
+    return renders
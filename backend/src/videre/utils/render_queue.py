@@ -0,0 +1,300 @@
+"""Mongo-backed render job queue shared by the API and render workers.
+
+In `RENDER_MODE=queue` the API enqueues each render into `render_jobs` and
+standalone workers (`python -m videre.worker`) lease jobs with an atomic
+`find_one_and_update`. Every lease gets its own token (`lease_token`), and a
+worker slot only heartbeats, reports and completes a job while its token is
+still on it; `lease_owner` is the worker id, used for affinity and display.
+Workers heartbeat to extend their lease; a lease that expires (worker crashed
+or hung) is reclaimed by the next worker. Failed jobs
+are retried until `max_attempts`. Progress events and the result are written
+back onto the job document, which the API node polls to keep its SSE stream
+unchanged.
+
+Environment variables supported:
+- RENDER_MODE (default: local) - "local" renders in-process, "queue" uses workers
+- RENDER_LEASE_SECONDS (default: 60)
+- RENDER_MAX_ATTEMPTS (default: 3)
+- RENDER_JOB_TIMEOUT_SECONDS (default: 1800) - how long the API waits for a job
+- RENDER_AFFINITY_SECONDS (default: 30) - how long a re-render waits for the
+  worker that holds the video's cached workspace before any worker may take it
+"""
+from __future__ import annotations
+
+import asyncio
+import uuid
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any
+
+from bson import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+
+from ..config import settings
+
+if TYPE_CHECKING:
+    from motor.motor_asyncio import AsyncIOMotorDatabase
+
+RENDER_MODE = settings.render_mode
+RENDER_LEASE_SECONDS = settings.render_lease_seconds
+RENDER_MAX_ATTEMPTS = settings.render_max_attempts
+RENDER_JOB_TIMEOUT_SECONDS = settings.render_job_timeout_seconds
+RENDER_AFFINITY_SECONDS = settings.render_affinity_seconds
+
+# Delay before a failed job becomes visible again, multiplied by the attempt number
+RETRY_DELAY_SECONDS = 5
+
+EventCallback = Callable[[str, dict], Awaitable[None]]
+
+
+class RenderJobError(RuntimeError):
+    pass
+
+
+async def ensure_render_job_indexes(db: AsyncIOMotorDatabase):
+    await db.render_jobs.create_index([("status", ASCENDING), ("available_at", ASCENDING)])
+    await db.render_jobs.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+    await db.render_workers.create_index("heartbeat_at")
+
+
+async def advertise_worker(db: AsyncIOMotorDatabase, worker_id: str, slots: int):
+    """Record that a worker is alive with `slots` render slots.
+
+    The render capacity is the sum over live workers.
+    """
+    await db.render_workers.update_one(
+        {"_id": worker_id},
+        {"$set": {"slots": slots, "heartbeat_at": datetime.utcnow()}},
+        upsert=True,
+    )
+
+
+async def retire_worker(db: AsyncIOMotorDatabase, worker_id: str):
+    await db.render_workers.delete_one({"_id": worker_id})
+
+
+async def live_render_slots(db: AsyncIOMotorDatabase) -> int:
+    """Render slots of workers that advertised within the last lease period."""
+    cutoff = datetime.utcnow() - timedelta(seconds=RENDER_LEASE_SECONDS)
+    workers = await db.render_workers.find(
+        {"heartbeat_at": {"$gte": cutoff}}, {"slots": 1}
+    ).to_list(None)
+    return sum(worker["slots"] for worker in workers)
+
+
+async def unfinished_jobs_by_profile(db: AsyncIOMotorDatabase) -> dict[str | None, int]:
+    """Queued and running jobs per render profile name (None: jobs queued before profiles)."""
+    groups = await db.render_jobs.aggregate([
+        {"$match": {"status": {"$in": ["queued", "leased"]}}},
+        {"$group": {"_id": "$profile", "count": {"$sum": 1}}},
+    ]).to_list(None)
+    return {group["_id"]: group["count"] for group in groups}
+
+
+async def enqueue_render(
+    db: AsyncIOMotorDatabase,
+    video_uuid: str,
+    scene_class_name: str,
+    manim_code: str,
+    affinity_worker: str | None = None,
+    profile: str | None = None,
+    max_attempts: int = RENDER_MAX_ATTEMPTS,
+    profiling: bool = False,
+) -> str:
+    now = datetime.utcnow()
+    job = {
+        "video_uuid": video_uuid,
+        "scene_class_name": scene_class_name,
+        "manim_code": manim_code,
+        "profile": profile,  # render profile name, chosen by the API from the current load
+        "profiling": profiling,  # run under the profiler (see render_profiling.py)
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "available_at": now,
+        "affinity_worker": affinity_worker,
+        "affinity_until": now + timedelta(seconds=RENDER_AFFINITY_SECONDS)
+        if affinity_worker
+        else None,
+        "lease_owner": None,
+        "lease_token": None,
+        "lease_expires_at": None,
+        "events": [],
+        "result": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    result = await db.render_jobs.insert_one(job)
+    return str(result.inserted_id)
+
+
+async def reap_expired_jobs(db: AsyncIOMotorDatabase) -> int:
+    """Fail leased jobs whose lease expired after their last allowed attempt."""
+    now = datetime.utcnow()
+    result = await db.render_jobs.update_many(
+        {
+            "status": "leased",
+            "lease_expires_at": {"$lt": now},
+            "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+        },
+        {
+            "$set": {
+                "status": "failed",
+                "error": "Lease expired on final attempt",
+                "updated_at": now,
+            }
+        },
+    )
+    return result.modified_count
+
+
+async def lease_next_job(
+    db: AsyncIOMotorDatabase,
+    worker_id: str,
+    slot: int = 0,
+    lease_seconds: int = RENDER_LEASE_SECONDS,
+) -> dict[str, Any] | None:
+    """Atomically claim the oldest runnable job (queued, or leased with an expired lease).
+
+    The returned job carries the new `lease_token`; pass it to heartbeat,
+    report_event, complete_job and fail_job.
+    """
+    now = datetime.utcnow()
+    lease_token = f"{worker_id}:{slot}:{uuid.uuid4().hex}"
+    return await db.render_jobs.find_one_and_update(
+        {
+            "$and": [
+                {"$or": [
+                    {"status": "queued", "available_at": {"$lte": now}},
+                    {"status": "leased", "lease_expires_at": {"$lt": now}},
+                ]},
+                {"$or": [
+                    {"affinity_worker": None},
+                    {"affinity_worker": worker_id},
+                    {"affinity_until": {"$lt": now}},
+                ]},
+                {"$expr": {"$lt": ["$attempts", "$max_attempts"]}},
+            ]
+        },
+        {
+            "$set": {
+                "status": "leased",
+                "lease_owner": worker_id,
+                "lease_token": lease_token,
+                "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                "heartbeat_at": now,
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def heartbeat(
+    db: AsyncIOMotorDatabase,
+    job_id: ObjectId,
+    lease_token: str,
+    lease_seconds: int = RENDER_LEASE_SECONDS,
+) -> bool:
+    """Extend the lease. Returns False if this lease no longer owns the job."""
+    now = datetime.utcnow()
+    result = await db.render_jobs.update_one(
+        {"_id": job_id, "status": "leased", "lease_token": lease_token},
+        {"$set": {
+            "lease_expires_at": now + timedelta(seconds=lease_seconds),
+            "heartbeat_at": now,
+        }},
+    )
+    return result.matched_count == 1
+
+
+async def report_event(
+    db: AsyncIOMotorDatabase, job_id: ObjectId, lease_token: str, event_type: str, data: dict
+):
+    await db.render_jobs.update_one(
+        {"_id": job_id, "lease_token": lease_token},
+        {"$push": {"events": {"type": event_type, "data": data}}},
+    )
+
+
+async def complete_job(
+    db: AsyncIOMotorDatabase, job_id: ObjectId, lease_token: str, result: dict
+) -> bool:
+    update = await db.render_jobs.update_one(
+        {"_id": job_id, "status": "leased", "lease_token": lease_token},
+        {"$set": {"status": "done", "result": result, "updated_at": datetime.utcnow()}},
+    )
+    return update.matched_count == 1
+
+
+async def fail_job(db: AsyncIOMotorDatabase, job: dict[str, Any], error: str):
+    """Requeue the job with a delay, or fail it for good after its last attempt."""
+    now = datetime.utcnow()
+    if job["attempts"] < job["max_attempts"]:
+        update = {
+            "status": "queued",
+            "available_at": now + timedelta(seconds=RETRY_DELAY_SECONDS * job["attempts"]),
+            "lease_owner": None,
+            "lease_token": None,
+            "lease_expires_at": None,
+        }
+    else:
+        update = {"status": "failed"}
+    await db.render_jobs.update_one(
+        {"_id": job["_id"], "lease_token": job["lease_token"]},
+        {"$set": {**update, "error": error, "updated_at": now}},
+    )
+
+
+async def release_job(db: AsyncIOMotorDatabase, job: dict[str, Any]):
+    """Requeue a job right away without counting the attempt (its worker is shutting down)."""
+    await db.render_jobs.update_one(
+        {"_id": job["_id"], "status": "leased", "lease_token": job["lease_token"]},
+        {
+            "$set": {
+                "status": "queued",
+                "available_at": datetime.utcnow(),
+                "lease_owner": None,
+                "lease_token": None,
+                "lease_expires_at": None,
+                "updated_at": datetime.utcnow(),
+            },
+            "$inc": {"attempts": -1},
+        },
+    )
+
+
+async def wait_for_job(
+    db: AsyncIOMotorDatabase,
+    job_id: str,
+    event_callback: EventCallback | None = None,
+    poll_interval: float = 0.5,
+    timeout: float = RENDER_JOB_TIMEOUT_SECONDS,
+) -> dict:
+    """Poll a job until it finishes, forwarding its progress events. Returns the result."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    seen = 0
+    while True:
+        job = await db.render_jobs.find_one(
+            {"_id": ObjectId(job_id)},
+            {"status": 1, "result": 1, "error": 1, "events": {"$slice": [seen, 1000]}},
+        )
+        if job is None:
+            raise RenderJobError(f"Render job {job_id} disappeared")
+
+        for event in job.get("events", []):
+            seen += 1
+            if event_callback:
+                await event_callback(event["type"], event["data"])
+
+        if job["status"] == "done":
+            return job["result"]
+        if job["status"] == "failed":
+            raise RenderJobError(f"Render job {job_id} failed: {job.get('error')}")
+        if asyncio.get_running_loop().time() > deadline:
+            raise RenderJobError(f"Render job {job_id} timed out")
+
+        await asyncio.sleep(poll_interval)
@@ -0,0 +1,227 @@
+"""Read-through cache of serialized chat-history responses.
+
+`GET /api/chat-history/{id}` and the first pages of `GET /api/chat-history`
+are read far more often than they change. Their JSON bodies are cached here
+and served without touching Mongo or pydantic. The write paths invalidate
+precisely:
+- creating a chat drops the cached list pages,
+- updating or deleting a chat drops that chat and the list pages.
+
+Backends:
+- `memory` (default): per-process LRU with a TTL. Other API processes may
+  serve an entry for up to the TTL after a write they did not see.
+- `sqlite`: one SQLite file shared by every process on the host, so an
+  invalidation in one worker is seen by all of them.
+- `off`
+
+A fill that raced with an invalidation is not stored: every invalidation
+bumps a version, and a fill only stores if the version is unchanged since
+its read started.
+
+Hits and misses are counted as `response_cache_total{kind,outcome}`;
+`stats()` adds hit ratios to `GET /api/metrics`.
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from contextlib import contextmanager
+from pathlib import Path
+
+from ..config import settings
+from .metrics import metrics
+
+CHAT_PREFIX = "chat:"
+LIST_PREFIX = "list:"
+
+
+def chat_key(chat_id: str) -> str:
+    return f"{CHAT_PREFIX}{chat_id}"
+
+
+def list_key(skip: int, limit: int) -> str:
+    return f"{LIST_PREFIX}{skip}:{limit}"
+
+
+class MemoryStore:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def version(self) -> int:
+        return self._version
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: float, version: int):
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._version += 1
+            self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            self._version += 1
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteStore:
+    """Process-shared store; each call opens a short-lived connection (thread-safe)."""
+
+    def __init__(self, path: Path, max_entries: int):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries"
+                " (key TEXT PRIMARY KEY, value BLOB, expires REAL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS meta"
+                " (id INTEGER PRIMARY KEY CHECK (id = 0), version INTEGER)"
+            )
+            db.execute("INSERT OR IGNORE INTO meta VALUES (0, 0)")
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=1.0)
+        try:
+            with connection:  # commits on success
+                yield connection
+        finally:
+            connection.close()
+
+    def version(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT version FROM meta").fetchone()[0]
+
+    def get(self, key: str) -> bytes | None:
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float, version: int):
+        with self._connect() as db:
+            # Conditional on the version, in one statement so it can't interleave
+            db.execute(
+                "INSERT OR REPLACE INTO entries SELECT ?, ?, ? FROM meta WHERE version = ?",
+                (key, value, time.time() + ttl, version),
+            )
+            db.execute("DELETE FROM entries WHERE expires <= ?", (time.time(),))
+            db.execute(
+                "DELETE FROM entries WHERE key NOT IN "
+                "(SELECT key FROM entries ORDER BY expires DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def delete(self, key: str):
+        with self._connect() as db:
+            db.execute("UPDATE meta SET version = version + 1")
+            db.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix: str):
+        with self._connect() as db:
+            db.execute("UPDATE meta SET version = version + 1")
+            db.execute("DELETE FROM entries WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def __len__(self):
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+class ResponseCache:
+    def __init__(self, backend: str, ttl: float, max_entries: int, sqlite_path: Path):
+        self.backend = backend
+        self.ttl = ttl
+        if backend == "sqlite":
+            self._store = SQLiteStore(sqlite_path, max_entries)
+        elif backend == "memory":
+            self._store = MemoryStore(max_entries)
+        else:
+            self._store = None
+
+    async def _call(self, method, *args):
+        # SQLite may wait on a lock; keep that off the event loop
+        if isinstance(self._store, SQLiteStore):
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+    async def get_or_load(
+        self, key: str, load: Callable[[], Awaitable[bytes | None]]
+    ) -> bytes | None:
+        """Cached body for `key`, or `load()` it (None results are not cached)."""
+        kind = key.split(":", 1)[0]
+        if self._store is None:
+            return await load()
+
+        cached = await self._call(self._store.get, key)
+        if cached is not None:
+            metrics.incr("response_cache_total", kind=kind, outcome="hit")
+            return cached
+        metrics.incr("response_cache_total", kind=kind, outcome="miss")
+
+        version = await self._call(self._store.version)
+        body = await load()
+        if body is not None:
+            await self._call(self._store.set, key, body, self.ttl, version)
+        return body
+
+    async def invalidate_chat(self, chat_id: str):
+        """A chat changed or was deleted: drop it and every cached list page."""
+        if self._store is not None:
+            await self._call(self._store.delete, chat_key(chat_id))
+            await self.invalidate_lists()
+
+    async def invalidate_lists(self):
+        """A chat was created: list pages (and their totals) are stale."""
+        if self._store is not None:
+            await self._call(self._store.delete_prefix, LIST_PREFIX)
+
+    def stats(self) -> dict:
+        ratios = {}
+        for kind in ("chat", "list"):
+            hits = metrics.counter("response_cache_total", kind=kind, outcome="hit")
+            misses = metrics.counter("response_cache_total", kind=kind, outcome="miss")
+            ratios[kind] = round(hits / (hits + misses), 4) if hits + misses else None
+        return {
+            "backend": self.backend,
+            "entries": len(self._store) if self._store is not None else 0,
+            "hit_ratio": ratios,
+        }
+
+
+response_cache = ResponseCache(
+    settings.response_cache_backend,
+    settings.response_cache_ttl_seconds,
+    settings.response_cache_max_entries,
+    settings.response_cache_sqlite_path,
+)
@@ -0,0 +1,343 @@
+"""Scene-graph generation: Claude describes the video as JSON, we write the Manim.
+
+Instead of a full Python script, the model returns a compact scene
+description: voiceover blocks, each with typed visual primitives (title,
+text, formula, graph, array, code) and highlights of what is already on
+screen. Validation is a schema check (`parse_scene_graph`) plus a semantic
+one (highlights must target visible objects), and `compile_scene` turns the
+graph into a `VoiceoverScene` subclass.
+
+The compiler is deterministic: the same block always compiles to the same
+calls. So when a scene graph is edited and re-rendered, unchanged blocks hit
+Manim's partial movie cache and the voiceover cache in the video's workspace
+and only the changed blocks are rendered again. `block_hashes` identifies
+the blocks for that purpose.
+
+Each block replaces the previous block's visuals (the title stays); a block
+with only highlights keeps them on screen.
+"""
+import hashlib
+import json
+import re
+from typing import Literal
+
+from pydantic import BaseModel, Field, ValidationError
+
+MAX_BLOCKS = 20
+VOICE_ID = "TVtDNgumMv4lb9zzFzA2"
+
+COLORS = {
+    "yellow": "YELLOW", "red": "RED", "green": "GREEN", "blue": "BLUE",
+    "orange": "ORANGE", "purple": "PURPLE", "teal": "TEAL", "pink": "PINK",
+}
+Color = Literal["yellow", "red", "green", "blue", "orange", "purple", "teal", "pink"]
+Identifier = Field(None, pattern=r"^[a-z][a-z0-9_]{0,23}$")
+NodeName = Field(..., pattern=r"^[A-Za-z0-9]{1,6}$")
+
+
+class SceneGraphError(ValueError):
+    pass
+
+
+class Title(BaseModel):
+    type: Literal["title"]
+    text: str = Field(..., max_length=80)
+
+
+class TextLine(BaseModel):
+    type: Literal["text"]
+    id: str | None = Identifier
+    text: str = Field(..., max_length=200)
+
+
+class Formula(BaseModel):
+    type: Literal["formula"]
+    id: str | None = Identifier
+    tex: str = Field(..., max_length=300)
+
+
+class GraphEdge(BaseModel):
+    source: str = NodeName
+    target: str = NodeName
+    weight: str | None = Field(None, max_length=8)
+
+
+class Graph(BaseModel):
+    type: Literal["graph"]
+    id: str | None = Identifier
+    nodes: list[str] = Field(..., min_length=1, max_length=16)
+    edges: list[GraphEdge] = Field(default_factory=list, max_length=40)
+    layout: Literal["circular", "spring", "kamada_kawai", "tree"] = "circular"
+    root: str | None = None  # for the tree layout
+
+
+class Array(BaseModel):
+    type: Literal["array"]
+    id: str | None = Identifier
+    values: list[int | float | str] = Field(..., min_length=1, max_length=16)
+    label: str | None = Field(None, max_length=24)
+
+
+class CodeBlock(BaseModel):
+    type: Literal["code"]
+    id: str | None = Identifier
+    code: str = Field(..., max_length=1500)
+    language: str = Field("python", pattern=r"^[a-z0-9+#]{1,16}$")
+
+
+class Highlight(BaseModel):
+    type: Literal["highlight"]
+    target: str = Field(..., pattern=r"^[a-z][a-z0-9_]{0,23}$")
+    index: int | None = None  # array element
+    node: str | None = None  # graph vertex
+    edge: tuple[str, str] | None = None  # graph edge
+    color: Color = "yellow"
+
+
+Visual = Title | TextLine | Formula | Graph | Array | CodeBlock | Highlight
+
+
+class Block(BaseModel):
+    narration: str = Field(..., min_length=1, max_length=600)
+    visuals: list[Visual] = Field(default_factory=list, max_length=8)
+
+
+class SceneGraph(BaseModel):
+    blocks: list[Block] = Field(..., min_length=1, max_length=MAX_BLOCKS)
+
+
+def schema_prompt() -> str:
+    """Compact JSON schema for the prompt."""
+    return json.dumps(SceneGraph.model_json_schema(), separators=(",", ":"))
+
+
+def block_hashes(graph: SceneGraph) -> list[str]:
+    return [
+        hashlib.sha256(block.model_dump_json().encode()).hexdigest()[:16]
+        for block in graph.blocks
+    ]
+
+
+def parse_scene_graph(text: str) -> SceneGraph:
+    """Schema and reference check of a model response. SceneGraphError explains what is wrong."""
+    # Drop markdown fences or chatter around the JSON object
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise SceneGraphError("Response contains no JSON object")
+    try:
+        graph = SceneGraph.model_validate_json(text[start:end + 1])
+    except ValidationError as e:
+        raise SceneGraphError(str(e)) from e
+    _check_references(graph)
+    return graph
+
+
+def _check_references(graph: SceneGraph):
+    shown: dict[str, BaseModel] = {}
+    for b, block in enumerate(graph.blocks, 1):
+        new = [v for v in block.visuals if not isinstance(v, (Title, Highlight))]
+        if new:
+            shown = {}
+        ids = [visual.id for visual in new if visual.id]
+        if len(ids) != len(set(ids)):
+            raise SceneGraphError(f"Block {b}: duplicate visual ids")
+        for visual in block.visuals:
+            if isinstance(visual, Graph):
+                names = set(visual.nodes)
+                for edge in visual.edges:
+                    if edge.source not in names or edge.target not in names:
+                        raise SceneGraphError(
+                            f"Block {b}: edge {edge.source}-{edge.target} uses an unknown node"
+                        )
+                if visual.root is not None and visual.root not in names:
+                    raise SceneGraphError(f"Block {b}: tree root {visual.root} is not a node")
+            if isinstance(visual, Highlight):
+                target = shown.get(visual.target)
+                if target is None:
+                    raise SceneGraphError(
+                        f"Block {b}: highlight target {visual.target!r} is not on screen"
+                    )
+                if visual.index is not None and not (
+                    isinstance(target, Array) and 0 <= visual.index < len(target.values)
+                ):
+                    raise SceneGraphError(
+                        f"Block {b}: index {visual.index} is not in array {visual.target!r}"
+                    )
+                if visual.node is not None and not (
+                    isinstance(target, Graph) and visual.node in target.nodes
+                ):
+                    raise SceneGraphError(
+                        f"Block {b}: node {visual.node!r} is not in graph {visual.target!r}"
+                    )
+                if visual.edge is not None and (
+                    not isinstance(target, Graph) or _edge(target, visual.edge) is None
+                ):
+                    raise SceneGraphError(
+                        f"Block {b}: edge {visual.edge} is not in graph {visual.target!r}"
+                    )
+            elif not isinstance(visual, Title) and getattr(visual, "id", None):
+                shown[visual.id] = visual
+
+
+def _edge(graph: Graph, edge: tuple[str, str]) -> tuple[str, str] | None:
+    """The edge as declared (either direction), or None."""
+    for declared in graph.edges:
+        if {declared.source, declared.target} == set(edge):
+            return declared.source, declared.target
+    return None
+
+
+class _Compiler:
+    def __init__(self, graph: SceneGraph, scene_class_name: str):
+        self.graph = graph
+        self.scene_class_name = scene_class_name
+        self.lines: list[str] = []
+        self.shown: dict[str, BaseModel] = {}  # id -> visual
+        self.shown_names: list[str] = []  # variables currently on screen (not the title)
+        self.title: str | None = None
+
+    def emit(self, line: str = "", indent: int = 3):
+        self.lines.append("    " * indent + line if line else "")
+
+    def compile(self) -> str:
+        self.lines = [
+            "import os",
+            "from manim import *",
+            "from manim_voiceover import VoiceoverScene",
+            "from manim_voiceover.services.elevenlabs import ElevenLabsService",
+            "from dotenv import load_dotenv",
+            "",
+            "load_dotenv()",
+            'ELEVEN_API_KEY = os.getenv("ELEVEN_API_KEY")',
+            "",
+            "",
+            f"class {self.scene_class_name}(VoiceoverScene):",
+            "    # Compiled from a scene graph by videre.utils.scene_graph",
+            "    def fit(self, group, title):",
+            "        top = config.frame_height / 2 - 0.5",
+            "        if title is not None:",
+            "            top = title.get_bottom()[1] - 0.4",
+            "        group.arrange(DOWN, buff=0.5)",
+            "        if group.width > config.frame_width - 1:",
+            "            group.scale_to_fit_width(config.frame_width - 1)",
+            "        if group.height > top + config.frame_height / 2 - 0.4:",
+            "            group.scale_to_fit_height(top + config.frame_height / 2 - 0.4)",
+            "        group.move_to([0, (top - config.frame_height / 2 + 0.4) / 2, 0])",
+            "",
+            "    def construct(self):",
+            f"        self.set_speech_service(ElevenLabsService(voice_id={VOICE_ID!r}))",
+            "        title = None",
+        ]
+        for index, block in enumerate(self.graph.blocks, 1):
+            self.block(index, block)
+        return "\n".join(self.lines) + "\n"
+
+    def block(self, index: int, block: Block):
+        self.emit()
+        self.emit(f"# Block {index}", 2)
+        self.emit(f"with self.voiceover(text={block.narration!r}) as tracker:", 2)
+        steps = 0
+        titles = [v for v in block.visuals if isinstance(v, Title)]
+        new = [v for v in block.visuals if not isinstance(v, (Title, Highlight))]
+        highlights = [v for v in block.visuals if isinstance(v, Highlight)]
+
+        if new and self.shown_names:
+            self.emit(f"self.play(FadeOut({', '.join(self.shown_names)}), run_time=0.5)")
+            self.shown, self.shown_names = {}, []
+        for title in titles[-1:]:
+            if self.title is None:
+                self.emit(f"title = Text({title.text!r}, font_size=44).to_edge(UP)")
+                self.emit("self.play(Write(title), run_time=1)")
+            else:
+                new_title = f"Text({title.text!r}, font_size=44).to_edge(UP)"
+                self.emit(f"self.play(Transform(title, {new_title}), run_time=1)")
+            self.title = title.text
+            steps += 1
+
+        if new:
+            names, animations, extras = [], [], []
+            for v, visual in enumerate(new):
+                name = f"v_{visual.id}" if visual.id else f"anon_{index}_{v}"
+                self.emit(f"{name} = {self.mobject(visual)}")
+                names.append(name)
+                animations.append(self.intro(visual, name))
+                if visual.id:
+                    self.shown[visual.id] = visual
+            self.emit(f"self.fit(VGroup({', '.join(names)}), title)")
+            for name, visual in zip(names, new):
+                if isinstance(visual, Graph) and any(e.weight for e in visual.edges):
+                    weights = ", ".join(
+                        f"MathTex({e.weight!r}, font_size=28).next_to("
+                        f"{name}.edges[({e.source!r}, {e.target!r})].get_center(), UP, buff=0.1)"
+                        for e in visual.edges if e.weight
+                    )
+                    self.emit(f"weights_{name} = VGroup({weights})")
+                    animations.append(f"Write(weights_{name})")
+                    extras.append(f"weights_{name}")
+            self.emit(
+                f"self.play({', '.join(animations)}, run_time=max(1, tracker.duration * 0.4))"
+            )
+            self.shown_names = names + extras
+            steps += 1
+
+        for highlight in highlights:
+            run_time = "max(0.5, tracker.duration * 0.15)"
+            self.emit(f"self.play({self.highlight(highlight)}, run_time={run_time})")
+            steps += 1
+        if steps == 0:
+            self.emit("pass")
+
+    def mobject(self, visual) -> str:
+        if isinstance(visual, TextLine):
+            return f"Text({visual.text!r}, font_size=32)"
+        if isinstance(visual, Formula):
+            return f"MathTex({visual.tex!r})"
+        if isinstance(visual, CodeBlock):
+            return f"Code(code_string={visual.code!r}, language={visual.language!r})"
+        if isinstance(visual, Array):
+            cells = ", ".join(
+                f"VGroup(Square(side_length=0.9), Text({str(value)!r}, font_size=30))"
+                for value in visual.values
+            )
+            array = f"VGroup({cells}).arrange(RIGHT, buff=0)"
+            if visual.label:
+                label = f"Text({visual.label!r}, font_size=28)"
+                return f"VGroup({label}, {array}).arrange(RIGHT, buff=0.4)"
+            return array
+        if isinstance(visual, Graph):
+            edges = ", ".join(f"({e.source!r}, {e.target!r})" for e in visual.edges)
+            layout = f"layout={visual.layout!r}"
+            if visual.layout == "tree":
+                layout += f", root_vertex={(visual.root or visual.nodes[0])!r}"
+            return f"Graph({visual.nodes!r}, [{edges}], labels=True, {layout})"
+        raise SceneGraphError(f"Cannot compile {type(visual).__name__}")
+
+    @staticmethod
+    def intro(visual, name: str) -> str:
+        if isinstance(visual, (Graph, Array)):
+            return f"Create({name})"
+        if isinstance(visual, CodeBlock):
+            return f"FadeIn({name})"
+        return f"Write({name})"
+
+    def highlight(self, highlight: Highlight) -> str:
+        name = f"v_{highlight.target}"
+        color = COLORS[highlight.color]
+        target = self.shown[highlight.target]
+        if highlight.index is not None:
+            # Labelled arrays wrap the cells: VGroup(label, cells)
+            cells = f"{name}[1]" if isinstance(target, Array) and target.label else name
+            return f"{cells}[{highlight.index}][0].animate.set_fill({color}, opacity=0.5)"
+        if highlight.node is not None:
+            return f"{name}.vertices[{highlight.node!r}].animate.set_color({color})"
+        if highlight.edge is not None:
+            return f"{name}.edges[{_edge(target, highlight.edge)!r}].animate.set_color({color})"
+        return f"Indicate({name}, color={color})"
+
+
+def compile_scene(graph: SceneGraph, scene_class_name: str) -> str:
+    """Python source of a `VoiceoverScene` subclass named `scene_class_name` for `graph`."""
+    if not re.fullmatch(r"[A-Za-z_]\w*", scene_class_name):
+        raise SceneGraphError(f"Invalid scene class name: {scene_class_name}")
+    _check_references(graph)
+    return _Compiler(graph, scene_class_name).compile()
@@ -0,0 +1,148 @@
+"""Similarity index over previously rendered Manim scripts.
+
+Every successful generation is stored on its chat history (`manim_code`,
+`narration`, `render_stats`). This module keeps an in-memory TF-IDF index over
+their topics and narration so a new request can reuse a close match outright,
+or pass it to Claude as a few-shot starting point.
+
+Environment variables supported:
+- SCRIPT_REUSE_THRESHOLD (default: 0.9) - topic similarity to reuse a script
+  as-is; the topics must also contain the same numbers
+- SCRIPT_FEWSHOT_THRESHOLD (default: 0.3) - similarity to use a script as an example
+"""
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from bson import ObjectId
+
+from ..config import settings
+from ..database import get_database
+
+SCRIPT_REUSE_THRESHOLD = settings.script_reuse_threshold
+SCRIPT_FEWSHOT_THRESHOLD = settings.script_fewshot_threshold
+
+# Topic terms count more than narration terms when matching
+TOPIC_WEIGHT = 3
+
+# Unlike the docs tokenizer, numbers and one-letter terms are kept: "sort 5
+# numbers" and "sort 10 numbers" are different videos
+_TERM_RE = re.compile(r"[A-Za-z0-9_]+")
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def tokenize(text: str) -> list[str]:
+    return [t.lower() for t in _TERM_RE.findall(text)]
+
+
+def numbers_in(text: str) -> list[str]:
+    return sorted(_NUMBER_RE.findall(text))
+
+
+@dataclass
+class ScriptMatch:
+    chat_id: str
+    topic: str
+    video_id: str | None
+    score: float
+    topic_score: float
+    manim_code: str = ""
+    # Same numbers in both topics; a script is only reused as-is if so
+    numbers_match: bool = True
+
+
+@dataclass
+class _Entry:
+    chat_id: str
+    topic: str
+    video_id: str | None
+    topic_tf: Counter = field(default_factory=Counter)
+    content_tf: Counter = field(default_factory=Counter)
+
+
+class ScriptIndex:
+    """TF-IDF cosine similarity over stored scripts."""
+
+    def __init__(self):
+        self.entries: dict[str, _Entry] = {}
+        self.df: Counter = Counter()
+
+    def add(self, chat_id: str, topic: str, narration: list[str], video_id: str | None = None):
+        self.remove(chat_id)
+        topic_tf = Counter(tokenize(topic))
+        content_tf = Counter(tokenize(" ".join(narration)))
+        for term, count in topic_tf.items():
+            content_tf[term] += count * TOPIC_WEIGHT
+        self.entries[chat_id] = _Entry(chat_id, topic, video_id, topic_tf, content_tf)
+        self.df.update(content_tf.keys())
+
+    def remove(self, chat_id: str):
+        entry = self.entries.pop(chat_id, None)
+        if entry is not None:
+            self.df.subtract(entry.content_tf.keys())
+
+    def _vector(self, tf: Counter) -> dict[str, float]:
+        n = len(self.entries) or 1
+        vector = {
+            term: (1 + math.log(count)) * math.log(1 + n / (1 + self.df[term]))
+            for term, count in tf.items() if count > 0
+        }
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return {term: w / norm for term, w in vector.items()}
+
+    @staticmethod
+    def _cosine(a: dict[str, float], b: dict[str, float]) -> float:
+        if len(a) > len(b):
+            a, b = b, a
+        return sum(w * b.get(term, 0.0) for term, w in a.items())
+
+    def search(self, topic: str, k: int = 1) -> list[ScriptMatch]:
+        query = self._vector(Counter(tokenize(topic)))
+        if not query:
+            return []
+        matches = []
+        for entry in self.entries.values():
+            score = self._cosine(query, self._vector(entry.content_tf))
+            if score <= 0:
+                continue
+            topic_score = self._cosine(query, self._vector(entry.topic_tf))
+            matches.append(ScriptMatch(
+                entry.chat_id, entry.topic, entry.video_id, score, topic_score,
+                numbers_match=numbers_in(entry.topic) == numbers_in(topic),
+            ))
+        matches.sort(key=lambda m: (m.topic_score, m.score), reverse=True)
+        return matches[:k]
+
+
+script_index = ScriptIndex()
+
+
+async def load_script_index():
+    """Populate the index from every chat history with a stored script."""
+    db = get_database()
+    cursor = db.chat_histories.find(
+        {"manim_code": {"$ne": None}, "video_id": {"$ne": None}},
+        {"topic": 1, "narration": 1, "video_id": 1},
+    )
+    async for doc in cursor:
+        script_index.add(
+            str(doc["_id"]), doc["topic"], doc.get("narration", []), doc.get("video_id")
+        )
+    print(f"Script index loaded: {len(script_index.entries)} scripts")
+
+
+async def find_similar_script(topic: str) -> ScriptMatch | None:
+    """Best stored script for `topic` above the few-shot threshold, with its code."""
+    matches = script_index.search(topic, k=1)
+    if not matches or matches[0].score < SCRIPT_FEWSHOT_THRESHOLD:
+        return None
+    match = matches[0]
+    doc = await get_database().chat_histories.find_one(
+        {"_id": ObjectId(match.chat_id)}, {"manim_code": 1}
+    )
+    if not doc or not doc.get("manim_code"):
+        script_index.remove(match.chat_id)
+        return None
+    match.manim_code = doc["manim_code"]
+    return match
@@ -0,0 +1,265 @@
+"""Pluggable async storage for rendered videos and their artifacts.
+
+One interface, three deployments:
+- `s3` (default): AWS S3, presigned URLs
+- `s3` with `S3_ENDPOINT_URL` set: S3-compatible stores such as MinIO
+- `local`: a directory on disk, served by the API itself (see `/media/...`)
+
+boto3 is blocking, so S3 calls run on worker threads.
+
+Environment variables supported:
+- STORAGE_BACKEND (default: s3) - "s3" or "local"
+- AWS_MP4_S3_BUCKET_ID, AWS_REGION, S3_ENDPOINT_URL
+- LOCAL_STORAGE_DIR (default: <backend/src>/media/storage)
+- PUBLIC_BASE_URL (default: http://localhost:8000) - prefix for local media URLs
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+
+from ..config import settings
+
+STORAGE_BACKEND = settings.storage_backend
+LOCAL_STORAGE_DIR = settings.local_storage_dir
+PUBLIC_BASE_URL = settings.public_base_url.rstrip("/")
+LOCAL_MEDIA_ROUTE = "/media"
+
+CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".ts": "video/mp2t",
+    ".mp4": "video/mp4",
+    ".jpg": "image/jpeg",
+    ".json": "application/json",
+}
+
+
+class StorageError(RuntimeError):
+    pass
+
+
+def content_type_for(key: str) -> str:
+    return CONTENT_TYPES.get(Path(key).suffix, "application/octet-stream")
+
+
+def video_key(video_uuid: str) -> str:
+    """Per-video key used before content addressing (see `content_key`)."""
+    return f"{video_uuid}.mp4"
+
+
+def content_key(content_hash: str) -> str:
+    """Content-addressed key of a published MP4: identical videos share one object."""
+    return f"videos/sha256/{content_hash}.mp4"
+
+
+async def sha256_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """Hex SHA-256 of a file, read in chunks on a worker thread."""
+    def digest():
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                sha.update(chunk)
+        return sha.hexdigest()
+
+    return await asyncio.to_thread(digest)
+
+
+class Storage(ABC):
+    """Async object storage interface. Keys are '/'-separated relative paths."""
+
+    @abstractmethod
+    async def put_file(self, local_path: Path, key: str):
+        ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def read_text(self, key: str) -> str:
+        ...
+
+    @abstractmethod
+    async def url_for(self, key: str, expires_in: int = 3600) -> str:
+        ...
+
+    async def put_file_if_absent(self, local_path: Path, key: str) -> bool:
+        """Upload unless `key` already exists (one HEAD). Returns True if uploaded."""
+        if await self.exists(key):
+            return False
+        await self.put_file(local_path, key)
+        return True
+
+    async def put_directory(self, local_dir: Path, prefix: str, max_concurrency: int = 8):
+        """Upload every file under `local_dir` to `prefix/` concurrently."""
+        semaphore = asyncio.Semaphore(max_concurrency)
+        local_dir = Path(local_dir)
+
+        async def put(path: Path):
+            async with semaphore:
+                await self.put_file(path, f"{prefix}/{path.relative_to(local_dir).as_posix()}")
+
+        await asyncio.gather(*[put(p) for p in local_dir.rglob("*") if p.is_file()])
+
+
+def _credentials() -> dict:
+    # None falls back to boto3's own chain (env, ~/.aws, instance role)
+    return {
+        "aws_access_key_id": settings.aws_access_key_id,
+        "aws_secret_access_key": settings.aws_secret_access_key,
+    }
+
+
+class S3Storage(Storage):
+    def __init__(self, bucket: str, region: str, endpoint_url: str | None = None):
+        self.bucket = bucket
+        self.region = region
+        self.endpoint_url = endpoint_url
+        # Created on first use (on a worker thread), then shared
+        self._clients_lock = threading.Lock()
+        self._s3_client = None
+        self._s3_signing_client = None
+
+    def _client(self):
+        with self._clients_lock:
+            if self._s3_client is None:
+                self._s3_client = self._new_client()
+            return self._s3_client
+
+    def _new_client(self):
+        import boto3
+        from botocore.config import Config
+
+        # boto3 clients are thread-safe; share one across uploads
+        return boto3.client(
+            "s3",
+            region_name=self.region,
+            endpoint_url=self.endpoint_url,
+            **_credentials(),
+            config=Config(signature_version="s3v4", max_pool_connections=32),
+        )
+
+    def _signing_client(self):
+        """Client for the bucket's own region, so presigned hosts match it."""
+        if self.endpoint_url:
+            return self._client()
+        if self._s3_signing_client is None:
+            client = self._new_signing_client()
+            with self._clients_lock:
+                if self._s3_signing_client is None:
+                    self._s3_signing_client = client
+        return self._s3_signing_client
+
+    def _new_signing_client(self):
+        import boto3
+        from botocore.config import Config
+
+        # Ask S3 where the bucket lives
+        loc = self._client().get_bucket_location(Bucket=self.bucket)["LocationConstraint"]
+        bucket_region = loc or "us-east-1"  # AWS returns None for us-east-1
+
+        return boto3.client(
+            "s3",
+            region_name=bucket_region,
+            config=Config(signature_version="s3v4", s3={"addressing_style": "virtual"}),
+            **_credentials(),
+            endpoint_url=f"https://s3.{bucket_region}.amazonaws.com"
+                if bucket_region != "us-east-1"
+                else "https://s3.amazonaws.com",  # us-east-1 quirk
+        )
+
+    async def put_file(self, local_path: Path, key: str):
+        from botocore.exceptions import ClientError
+
+        try:
+            await asyncio.to_thread(
+                self._client().upload_file, str(local_path), self.bucket, key,
+                ExtraArgs={"ContentType": content_type_for(key)},
+            )
+        except ClientError as e:
+            raise StorageError(f"Upload of {key} failed: {e}")
+        logging.info(f"Successfully uploaded {local_path} to s3://{self.bucket}/{key}")
+
+    async def exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            await asyncio.to_thread(self._client().head_object, Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise StorageError(f"HEAD of {key} failed: {e}")
+
+    async def read_text(self, key: str) -> str:
+        from botocore.exceptions import ClientError
+
+        def read():
+            response = self._client().get_object(Bucket=self.bucket, Key=key)
+            return response["Body"].read().decode("utf-8")
+
+        try:
+            return await asyncio.to_thread(read)
+        except ClientError as e:
+            raise StorageError(f"Read of {key} failed: {e}")
+
+    async def url_for(self, key: str, expires_in: int = 3600) -> str:
+        client = await asyncio.to_thread(self._signing_client)
+        return client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": key}, ExpiresIn=expires_in
+        )
+
+
+class LocalStorage(Storage):
+    """Stores objects under a local directory; the API serves them with Range support."""
+
+    def __init__(self, root: Path, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url
+
+    def path_for(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise StorageError(f"Invalid key: {key}")
+        return path
+
+    async def put_file(self, local_path: Path, key: str):
+        target = self.path_for(key)
+
+        def copy():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = target.with_name(target.name + ".tmp")
+            shutil.copyfile(local_path, tmp_path)
+            os.replace(tmp_path, target)
+
+        await asyncio.to_thread(copy)
+
+    async def exists(self, key: str) -> bool:
+        return self.path_for(key).is_file()
+
+    async def read_text(self, key: str) -> str:
+        try:
+            return await asyncio.to_thread(self.path_for(key).read_text)
+        except OSError as e:
+            raise StorageError(f"Read of {key} failed: {e}")
+
+    async def url_for(self, key: str, expires_in: int = 3600) -> str:
+        return f"{self.base_url}{LOCAL_MEDIA_ROUTE}/{key}"
+
+
+@lru_cache(maxsize=1)
+def get_storage() -> Storage:
+    if STORAGE_BACKEND == "local":
+        return LocalStorage(LOCAL_STORAGE_DIR, PUBLIC_BASE_URL)
+    if STORAGE_BACKEND == "s3":
+        return S3Storage(
+            bucket=settings.aws_mp4_s3_bucket_id,
+            region=settings.aws_region,
+            endpoint_url=settings.s3_endpoint_url or None,
+        )
+    raise StorageError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
@@ -0,0 +1,160 @@
+"""Standalone render worker.
+
+Pulls render jobs from the Mongo `render_jobs` queue, renders them with Manim
+and uploads the result to S3. Run as many as needed, on any host that can
+reach MongoDB and S3:
+
+    cd backend/src && uv run python -m videre.worker --concurrency 2
+"""
+import argparse
+import asyncio
+import socket
+import time
+import traceback
+import uuid
+
+from .config import settings
+from .database import close_db, connect_db, get_database
+from .utils import render_cache
+from .utils.create_video import profiling_dir, render_manim_code
+from .utils.package_video import publish_video
+from .utils.render_profiles import get_profile
+from .utils.render_profiling import collect as collect_profile
+from .utils.render_queue import (
+    RENDER_LEASE_SECONDS,
+    advertise_worker,
+    complete_job,
+    ensure_render_job_indexes,
+    fail_job,
+    heartbeat,
+    lease_next_job,
+    reap_expired_jobs,
+    release_job,
+    report_event,
+    retire_worker,
+)
+
+POLL_INTERVAL_SECONDS = settings.render_poll_interval_seconds
+HEARTBEAT_SECONDS = max(RENDER_LEASE_SECONDS // 3, 1)
+
+
+async def _keep_lease(db, job, worker_id, render_task: asyncio.Task, lease_lost: asyncio.Event):
+    """Heartbeat until cancelled; set `lease_lost` and abort the render if the lease is lost."""
+    while True:
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+        if not await heartbeat(db, job["_id"], job["lease_token"]):
+            print(f"[{worker_id}] Lost lease on job {job['_id']}, aborting render")
+            lease_lost.set()
+            render_task.cancel()
+            return
+
+
+async def process_job(db, job, worker_id):
+    job_id = job["_id"]
+    video_uuid, attempt = job["video_uuid"], job["attempts"]
+    print(f"[{worker_id}] Rendering job {job_id} (video {video_uuid}, attempt {attempt})")
+
+    async def emit(event_type: str, data: dict):
+        await report_event(db, job_id, job["lease_token"], event_type, data)
+
+    profile = get_profile(job.get("profile"))
+    profiling = job.get("profiling", False)
+
+    async def render_and_publish():
+        started = time.monotonic()
+        video_path = await render_manim_code(
+            job["manim_code"], job["scene_class_name"], job["video_uuid"], emit, profile, profiling
+        )
+        render_seconds = round(time.monotonic() - started, 2)
+        summary = (
+            await collect_profile(profiling_dir(job["video_uuid"]), job["video_uuid"])
+            if profiling
+            else {}
+        )
+        return await publish_video(video_path, job["video_uuid"], profile), render_seconds, summary
+
+    render_task = asyncio.create_task(render_and_publish())
+    lease_lost = asyncio.Event()
+    lease_task = asyncio.create_task(_keep_lease(db, job, worker_id, render_task, lease_lost))
+    try:
+        published, render_seconds, summary = await render_task
+        await complete_job(db, job_id, job["lease_token"], {
+            "worker_id": worker_id,
+            "published": published,
+            "profile": profile.name,
+            "render_seconds": render_seconds,
+            "profiling": summary,
+        })
+        print(f"[{worker_id}] Job {job_id} done")
+    except asyncio.CancelledError:
+        if lease_lost.is_set():
+            # Whoever reclaimed the job owns it now
+            return
+        # The worker is shutting down: hand the job back instead of holding
+        # it until the lease expires
+        render_task.cancel()
+        await release_job(db, job)
+        print(f"[{worker_id}] Released job {job_id} on shutdown")
+        raise
+    except Exception as e:
+        stderr = getattr(e, "stderr", None)
+        error = f"{e}\n{stderr[-2000:]}" if stderr else str(e)
+        traceback.print_exc()
+        await fail_job(db, job, error)
+        print(f"[{worker_id}] Job {job_id} failed: {e}")
+    finally:
+        lease_task.cancel()
+
+
+async def _warm_render_cache(db):
+    try:
+        print(f"Render cache warm-up: {await render_cache.warm(db)}")
+    except Exception as e:
+        print(f"Render cache warm-up failed: {e}")
+
+
+async def _advertise(db, worker_id, concurrency):
+    """Keep this worker's slots counted in the render capacity the API sees."""
+    while True:
+        await advertise_worker(db, worker_id, concurrency)
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+
+
+async def _worker_loop(db, worker_id, slot):
+    while True:
+        await reap_expired_jobs(db)
+        job = await lease_next_job(db, worker_id, slot)
+        if job is None:
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+            continue
+        await process_job(db, job, worker_id)
+
+
+async def run_worker(concurrency: int, worker_id: str):
+    await connect_db()
+    db = get_database()
+    await ensure_render_job_indexes(db)
+    print(f"Render worker {worker_id} started with concurrency {concurrency}")
+    # Slots share the worker id (they share this host's render workspaces) but
+    # each lease has its own token, so two slots never both own one job
+    tasks = [_worker_loop(db, worker_id, slot) for slot in range(concurrency)]
+    tasks.append(_advertise(db, worker_id, concurrency))
+    if settings.render_cache_warm_on_start:
+        tasks.append(_warm_render_cache(db))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await retire_worker(db, worker_id)
+        await close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Videre render worker")
+    parser.add_argument("--concurrency", type=int, default=settings.render_worker_concurrency)
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}")
+    args = parser.parse_args()
+    asyncio.run(run_worker(args.concurrency, args.worker_id))
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,7 @@ const queryClient = new QueryClient();
 const App = () => {
   const [topic, setTopic] = useState<string>('');
   const [videoURL, setVideoURL] = useState<string>('');
+  const [posterURL, setPosterURL] = useState<string>('');
 
   return (
     <QueryClientProvider client={queryClient}>
@@ -24,9 +25,9 @@ const App = () => {
         <BrowserRouter>
           <Routes>
             <Route path="/" element={<Index topic={topic} setTopic={setTopic} />} />
-            <Route path="/generate" element={<GenerateVideo topic={topic} setVideoURL={setVideoURL} />} />
-            <Route path="/video" element={<VideoDisplay topic={topic} videoURL={videoURL} />} />
-            <Route path="/history" element={<History setTopic={setTopic} setVideoURL={setVideoURL} />} />
+            <Route path="/generate" element={<GenerateVideo topic={topic} setVideoURL={setVideoURL} setPosterURL={setPosterURL} />} />
+            <Route path="/video" element={<VideoDisplay topic={topic} videoURL={videoURL} posterURL={posterURL} />} />
+            <Route path="/history" element={<History setTopic={setTopic} setVideoURL={setVideoURL} setPosterURL={setPosterURL} />} />
             {/* ADD ALL CUSTOM ROUTES ABOVE THE CATCH-ALL "*" ROUTE */}
             <Route path="*" element={<NotFound />} />
           </Routes>
@@ -11,9 +11,11 @@ interface GenerationStep {
 const GenerateVideo = ({
   topic,
   setVideoURL,
+  setPosterURL,
 }: {
   topic: string;
   setVideoURL: any;
+  setPosterURL: any;
 }) => {
   const navigate = useNavigate();
 
@@ -154,6 +156,7 @@ const GenerateVideo = ({
                   // Use the video URL from the event
                   if (eventData.video_url) {
                     setVideoURL(eventData.video_url);
+                    setPosterURL(eventData.poster_url ? `http://localhost:8000${eventData.poster_url}` : "");
 
                     // Navigate to video display after a short delay
                     setTimeout(() => {
@@ -168,6 +171,15 @@ const GenerateVideo = ({
                       "An error occurred during video generation"
                   );
                   break;
+
+                case "rejected":
+                  // A tenant limit (daily quota, too many waiting) refused the request
+                  setError(
+                    eventData.retry_after_seconds
+                      ? `${eventMessage}. Try again in ${Math.ceil(eventData.retry_after_seconds / 60)} minutes.`
+                      : eventMessage
+                  );
+                  break;
               }
             } catch (parseError) {
               console.error("Error parsing SSE event:", parseError, line);
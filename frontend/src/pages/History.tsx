@@ -11,17 +11,88 @@ interface ChatMessage {
   timestamp: string;
 }
 
+interface SpriteSheet {
+  columns: number;
+  rows: number;
+  frames: number;
+  width: number;
+  height: number;
+}
+
 interface ChatHistoryItem {
   id: string;
   topic: string;
   video_url?: string;
   video_id?: string;
+  poster_url?: string;
+  thumbnail_urls?: Record<string, string>;
+  sprite_url?: string;
+  sprite?: SpriteSheet;
   created_at: string;
   updated_at: string;
-  chat_messages: ChatMessage[];
+  chat_messages?: ChatMessage[]; // only on a single chat, not in the list
 }
 
-const History = ({ setTopic, setVideoURL }: { setTopic: any; setVideoURL: any }) => {
+const API_BASE = "http://localhost:8000";
+
+// Poster thumbnail that scrubs through the sprite sheet on hover (a few KB instead of the MP4)
+const PreviewImage = ({ history }: { history: ChatHistoryItem }) => {
+  const [frame, setFrame] = useState<number | null>(null);
+  const thumbnail = history.thumbnail_urls?.["320"] ?? history.poster_url;
+  if (!thumbnail) {
+    return null;
+  }
+  const sprite = history.sprite;
+
+  const handleMove = (event: React.MouseEvent<HTMLDivElement>) => {
+    if (!sprite) {
+      return;
+    }
+    const rect = event.currentTarget.getBoundingClientRect();
+    const position = (event.clientX - rect.left) / rect.width;
+    setFrame(Math.min(sprite.frames - 1, Math.max(0, Math.floor(position * sprite.frames))));
+  };
+
+  const scrubStyle = () => {
+    if (!sprite || frame === null) {
+      return undefined;
+    }
+    // Percentages keep the tile aligned at any card width
+    const column = frame % sprite.columns;
+    const row = Math.floor(frame / sprite.columns);
+    return {
+      backgroundImage: `url(${API_BASE}${history.sprite_url})`,
+      backgroundSize: `${sprite.columns * 100}% ${sprite.rows * 100}%`,
+      backgroundPosition: `${sprite.columns > 1 ? (column / (sprite.columns - 1)) * 100 : 0}% ${
+        sprite.rows > 1 ? (row / (sprite.rows - 1)) * 100 : 0
+      }%`,
+    };
+  };
+
+  return (
+    <div
+      className="aspect-video w-full overflow-hidden rounded-md bg-muted mb-3"
+      onMouseMove={handleMove}
+      onMouseLeave={() => setFrame(null)}
+    >
+      {frame === null ? (
+        <img src={`${API_BASE}${thumbnail}`} alt="" loading="lazy" className="w-full h-full object-cover" />
+      ) : (
+        <div className="w-full h-full" style={scrubStyle()} />
+      )}
+    </div>
+  );
+};
+
+const History = ({
+  setTopic,
+  setVideoURL,
+  setPosterURL,
+}: {
+  setTopic: any;
+  setVideoURL: any;
+  setPosterURL: any;
+}) => {
   const navigate = useNavigate();
   const [histories, setHistories] = useState<ChatHistoryItem[]>([]);
   const [loading, setLoading] = useState(true);
@@ -30,7 +101,7 @@ const History = ({ setTopic, setVideoURL }: { setTopic: any; setVideoURL: any })
   useEffect(() => {
     const fetchHistories = async () => {
       try {
-        const response = await fetch("http://localhost:8000/api/chat-history");
+        const response = await fetch(`${API_BASE}/api/chat-history`);
         if (!response.ok) {
           throw new Error("Failed to fetch chat histories");
         }
@@ -44,12 +115,57 @@ const History = ({ setTopic, setVideoURL }: { setTopic: any; setVideoURL: any })
     };
 
     fetchHistories();
+
+    // Live updates: the server pushes deltas; EventSource resumes from the last one on reconnect
+    const events = new EventSource(`${API_BASE}/api/chat-history/events`);
+    events.onmessage = (event) => {
+      const delta = JSON.parse(event.data);
+      if (delta.op === "reset") {
+        fetchHistories();
+        return;
+      }
+      if (delta.op === "update" && "previews" in delta.fields) {
+        // Preview URLs are derived by the API; fetch the finished chat once
+        fetch(`${API_BASE}/api/chat-history/${delta.id}`)
+          .then((response) => (response.ok ? response.json() : null))
+          .then((chat) => {
+            if (chat) {
+              setHistories((current) =>
+                current.map((history) => (history.id === chat.id ? { ...history, ...chat } : history))
+              );
+            }
+          });
+      }
+      setHistories((current) => {
+        const rest = current.filter((history) => history.id !== delta.id);
+        if (delta.op === "delete") {
+          return rest;
+        }
+        const existing = current.find((history) => history.id === delta.id);
+        if (delta.op === "upsert") {
+          return [{ ...existing, ...delta.doc, id: delta.id }, ...rest];
+        }
+        if (!existing) {
+          return current;
+        }
+        const updated = { ...existing };
+        for (const [field, value] of Object.entries(delta.fields)) {
+          // Nested fields (render_stats.*) are not shown here
+          if (!field.includes(".")) {
+            (updated as Record<string, unknown>)[field] = value;
+          }
+        }
+        return current.map((history) => (history.id === delta.id ? updated : history));
+      });
+    };
+    return () => events.close();
   }, []);
 
   const handleViewVideo = (history: ChatHistoryItem) => {
     if (history.video_url) {
       setTopic(history.topic);
       setVideoURL(history.video_url);
+      setPosterURL(history.poster_url ? `${API_BASE}${history.poster_url}` : "");
       navigate("/video");
     }
   };
@@ -117,6 +233,7 @@ const History = ({ setTopic, setVideoURL }: { setTopic: any; setVideoURL: any })
                 onClick={() => handleViewVideo(history)}
               >
                 <CardHeader>
+                  <PreviewImage history={history} />
                   <div className="flex items-start justify-between mb-2">
                     <Video className="w-5 h-5 text-primary" />
                     {history.video_url && (
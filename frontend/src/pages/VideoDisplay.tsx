@@ -3,7 +3,7 @@ import { Button } from '@/components/ui/button';
 import { Download, Home, Share2, RotateCcw } from 'lucide-react';
 import { toast } from 'sonner';
 
-const VideoDisplay = ({ topic, videoURL }: { topic: string, videoURL: string }) => {
+const VideoDisplay = ({ topic, videoURL, posterURL }: { topic: string, videoURL: string, posterURL?: string }) => {
   const location = useLocation();
   const navigate = useNavigate();
 
@@ -74,6 +74,7 @@ const VideoDisplay = ({ topic, videoURL }: { topic: string, videoURL: string })
               controls
               className="w-full aspect-video"
               src={videoURL}
+              poster={posterURL || undefined}
               autoPlay
             >
               Your browser does not support the video tag.